@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from openai import error
+from write_the.backends import FakeBackend, create_backend, parse_latency
+from write_the.commands.docs.prompts import write_docstrings_for_nodes_prompt
+from write_the.commands.docs.utils import extract_block
+from write_the.commands.tests.prompts import write_tests_for_file_prompt
+
+
+@pytest.fixture
+def llm():
+    return SimpleNamespace(prompt=write_docstrings_for_nodes_prompt, max_tokens=4096)
+
+
+@pytest.mark.parametrize(
+    "spec, expected",
+    [
+        ("fixed:0.5", ("fixed", (0.5,))),
+        ("uniform:0.1,2", ("uniform", (0.1, 2.0))),
+        ("lognormal:0,0.5", ("lognormal", (0.0, 0.5))),
+    ],
+)
+def test_parse_latency(spec, expected):
+    assert parse_latency(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["fixed", "uniform:1", "poisson:1"])
+def test_parse_latency_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_latency(spec)
+
+
+def test_create_backend():
+    assert create_backend("fake").name == "fake"
+    assert create_backend("openai").name == "openai"
+    with pytest.raises(ValueError):
+        create_backend("missing")
+
+
+def test_fake_backend_from_env(monkeypatch):
+    monkeypatch.setenv("WRITE_THE_FAKE_LATENCY", "uniform:0,1")
+    monkeypatch.setenv("WRITE_THE_FAKE_TPS", "100")
+    monkeypatch.setenv("WRITE_THE_FAKE_RATE_LIMIT", "0.5")
+    backend = FakeBackend.from_env()
+    assert backend.latency == ("uniform", (0.0, 1.0))
+    assert backend.tokens_per_second == 100
+    assert backend.rate_limit_rate == 0.5
+
+
+def test_fake_backend_docstrings(llm):
+    nodes = ["add", "Calculate.multiply"]
+    result = asyncio.run(FakeBackend().complete(llm, code="", nodes=nodes))
+    assert list(extract_block(result, nodes)) == nodes
+
+
+def test_fake_backend_tests():
+    llm = SimpleNamespace(prompt=write_tests_for_file_prompt, max_tokens=4096)
+    code = "def add(a, b):\n    return a + b\n"
+    result = asyncio.run(FakeBackend().complete(llm, code=code, path="add.py"))
+    assert "def test_add():" in result
+    compile(result, "test_add.py", "exec")
+
+
+def test_fake_backend_stream(llm):
+    async def collect():
+        return [c async for c in FakeBackend().stream(llm, code="", nodes=["add"])]
+
+    chunks = asyncio.run(collect())
+    assert "".join(chunks) == asyncio.run(FakeBackend().complete(llm, code="", nodes=["add"]))
+
+
+def test_fake_backend_rate_limits(llm):
+    backend = FakeBackend(rate_limit_rate=1, retry_after=3)
+    with pytest.raises(error.RateLimitError) as e:
+        asyncio.run(backend.complete(llm, code="", nodes=["add"]))
+    assert e.value.headers["retry-after"] == "3"
+
+
+def test_fake_backend_context_overflow(llm):
+    llm.max_tokens = 10
+    with pytest.raises(error.InvalidRequestError) as e:
+        asyncio.run(FakeBackend().complete(llm, code="x" * 100, nodes=["add"]))
+    assert e.value.code == "context_length_exceeded"
+
+
+def test_fake_backend_is_reproducible(llm):
+    def sample(backend):
+        return [backend.sample_latency() for _ in range(5)]
+
+    backend = FakeBackend(latency="lognormal:0,1", seed=1)
+    assert sample(backend) == sample(FakeBackend(latency="lognormal:0,1", seed=1))
@@ -0,0 +1,61 @@
+import pytest
+from write_the.cache import LLMCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMCache(tmp_path / "cache")
+
+
+def test_key_is_deterministic():
+    key = LLMCache.key("gpt-4", 0, "{code}", {"code": "pass", "nodes": ["a", "b"]})
+    assert key == LLMCache.key("gpt-4", 0, "{code}", {"nodes": ["a", "b"], "code": "pass"})
+
+
+@pytest.mark.parametrize(
+    "model_name, temperature, template, inputs",
+    [
+        ("gpt-3.5-turbo", 0, "{code}", {"code": "pass"}),
+        ("gpt-4", 1, "{code}", {"code": "pass"}),
+        ("gpt-4", 0, "Code: {code}", {"code": "pass"}),
+        ("gpt-4", 0, "{code}", {"code": "pass\n"}),
+    ],
+)
+def test_key_changes_with_request(model_name, temperature, template, inputs):
+    key = LLMCache.key("gpt-4", 0, "{code}", {"code": "pass"})
+    assert key != LLMCache.key(model_name, temperature, template, inputs)
+
+
+def test_get_and_set(cache):
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    assert len(cache) == 1
+
+
+def test_persists_between_instances(tmp_path):
+    LLMCache(tmp_path).set("key", "value")
+    assert LLMCache(tmp_path).get("key") == "value"
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = LLMCache(tmp_path, max_size=10)
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    cache.get("a")
+    cache.set("c", "12345")
+    assert cache.get("a") == "12345"
+    assert cache.get("b") is None
+    assert cache.get("c") == "12345"
+
+
+def test_expired_entries_are_ignored(tmp_path):
+    cache = LLMCache(tmp_path, max_age=-1)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+
+
+def test_clear(cache):
+    cache.set("key", "value")
+    cache.clear()
+    assert len(cache) == 0
@@ -19,6 +19,12 @@ def nodes():
     return ["add"]
 
 
+@pytest.fixture
+def in_tmp_path(tmp_path, monkeypatch):
+    # `docs --changed-only` records a manifest in the current directory
+    monkeypatch.chdir(tmp_path)
+
+
 def test_callback_version():
     runner = CliRunner()
     result = runner.invoke(app, ["--version"])
@@ -40,6 +46,7 @@ def test_callback_version():
     "write_the.llm.LLM.run",
     return_value="\n\nadd:\n  Sums 2 numbers.\n  Args:\n    a (int): The first number to add.\n    b (int): The second number to add.\n  Returns:\n    int: The sum of `a` and `b`.\n  Examples:\n    >>> add(1, 2)\n    3\n\n",
 )
+@pytest.mark.usefixtures("in_tmp_path")
 def test_docs_mocked(mocked_run, file_path: Path, nodes, save, context, pretty, force):
     runner = CliRunner()
     args = ["docs", str(file_path)]
@@ -124,3 +131,136 @@ def test_tests_mocked(mocked_run, file_path: Path, save, pretty, force):
         assert str(file_path) in result.stdout
     else:
         assert "assert add(a, b) == expected" in result.stdout
+
+
+@mock.patch("write_the.llm.LLM.run")
+def test_docs_skips_documented_files_without_parsing(mocked_run, tmp_path: Path):
+    documented = tmp_path / "documented.py"
+    documented.write_text('def add(a, b):\n    """Adds."""\n    return a + b\n')
+    with mock.patch("write_the.stages.create_tree") as create_tree:
+        result = CliRunner().invoke(app, ["docs", str(documented)])
+    assert result.exit_code == 0
+    assert "No nodes found" in result.stdout
+    create_tree.assert_not_called()
+    mocked_run.assert_not_called()
+
+
+@mock.patch(
+    "write_the.llm.LLM.run",
+    return_value="\n\nadd:\n  Sums 2 numbers.\n\n",
+)
+@pytest.mark.usefixtures("in_tmp_path")
+def test_docs_directory(mocked_run, tmp_path: Path):
+    for i in range(5):
+        (tmp_path / f"m{i}.py").write_text("def add(a, b):\n    return a + b\n")
+    (tmp_path / "documented.py").write_text('def add(a, b):\n    """Adds."""\n')
+    result = CliRunner().invoke(
+        app, ["docs", str(tmp_path), "--save", "--max-concurrency", "2"]
+    )
+    assert result.exit_code == 0
+    assert mocked_run.call_count == 5
+    for i in range(5):
+        assert "Sums 2 numbers." in (tmp_path / f"m{i}.py").read_text()
+        assert f"m{i}.py" in result.stdout
+    assert "skipping file" in result.stdout
+
+
+@mock.patch("write_the.llm.LLM.run", return_value="\n\nadd:\n  Sums 2 numbers.\n\n")
+@pytest.mark.parametrize("pretty", [False, True])
+@pytest.mark.usefixtures("in_tmp_path")
+def test_docs_directory_with_syntax_error(mocked_run, tmp_path: Path, pretty):
+    for name in ["a.py", "c.py"]:
+        (tmp_path / name).write_text("def add(a, b):\n    return a + b\n")
+    (tmp_path / "b.py").write_text("def add(a, b:\n    return a + b\n")
+    args = ["docs", str(tmp_path), "--save", "--cpu-workers", "0"]
+    result = CliRunner().invoke(app, args + (["--pretty"] if pretty else []))
+    assert result.exit_code == 0
+    assert "❌" in result.stdout and "b.py" in result.stdout
+    assert "Sums 2 numbers." in (tmp_path / "a.py").read_text()
+    assert "Sums 2 numbers." in (tmp_path / "c.py").read_text()
+
+
+@mock.patch(
+    "write_the.llm.LLM.run",
+    return_value="\n\na.py::add:\n  Sums 2 numbers.\n\nc.py::add:\n  Sums 2 numbers.\n\n",
+)
+@pytest.mark.usefixtures("in_tmp_path")
+def test_docs_cross_file_with_syntax_error(mocked_run, tmp_path: Path):
+    for name in ["a.py", "c.py"]:
+        (tmp_path / name).write_text("def add(a, b):\n    return a + b\n")
+    (tmp_path / "b.py").write_text("def add(a, b:\n    return a + b\n")
+    args = ["docs", ".", "--save", "--cross-file", "--cpu-workers", "0"]
+    result = CliRunner().invoke(app, args)
+    assert result.exit_code == 0
+    stdout = " ".join(result.stdout.split())
+    assert "❌ b.py - Syntax Error" in stdout
+    assert "❌ a.py" not in stdout and "❌ c.py" not in stdout
+    assert "Sums 2 numbers." in (tmp_path / "a.py").read_text()
+    assert "Sums 2 numbers." in (tmp_path / "c.py").read_text()
+
+
+@mock.patch(
+    "write_the.llm.LLM.run",
+    return_value="".join(f"\n\n{n}.py::add:\n  Sums 2 numbers.\n\n" for n in "abc"),
+)
+@pytest.mark.usefixtures("in_tmp_path")
+def test_docs_cross_file_groups(mocked_run, tmp_path: Path, monkeypatch):
+    monkeypatch.setattr("write_the.cli.main.CROSS_FILE_GROUP_FILES", 2)
+    for name in ["a.py", "b.py", "c.py"]:
+        (tmp_path / name).write_text("def add(a, b):\n    return a + b\n")
+    args = ["docs", ".", "--save", "--cross-file", "--cpu-workers", "0"]
+    assert CliRunner().invoke(app, args).exit_code == 0
+    # a request per group
+    assert mocked_run.call_count == 2
+    for name in ["a.py", "b.py", "c.py"]:
+        assert "Sums 2 numbers." in (tmp_path / name).read_text()
+
+
+@mock.patch("write_the.llm.LLM.run", return_value="\n\nadd:\n  Sums 2 numbers.\n\n")
+@pytest.mark.usefixtures("in_tmp_path")
+def test_docs_directory_exclusions(mocked_run, tmp_path: Path):
+    code = "def add(a, b):\n    return a + b\n"
+    for name in ["app.py", ".venv/site.py", "migrations/m1.py", "api_pb2.py"]:
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_text(code)
+    (tmp_path / "big.py").write_text(code * 10)
+    result = CliRunner().invoke(
+        app,
+        ["docs", str(tmp_path), "--save", "--exclude", "migrations/", "--max-size", "100"],
+    )
+    assert result.exit_code == 0
+    assert mocked_run.call_count == 1
+    assert "Sums 2 numbers." in (tmp_path / "app.py").read_text()
+    stdout = " ".join(result.stdout.split())
+    assert "Generated, skipping file" in stdout
+    assert "Larger than 100 bytes (320), skipping file" in stdout
+    assert "Sums" not in (tmp_path / "migrations" / "m1.py").read_text()
+
+
+@mock.patch(
+    "write_the.llm.LLM.run",
+    return_value="\n\nadd:\n  Sums 2 numbers.\n\nsub:\n  Subtracts 2 numbers.\n\n",
+)
+@pytest.mark.usefixtures("in_tmp_path")
+def test_docs_changed_only(mocked_run, tmp_path: Path):
+    file = tmp_path / "calc.py"
+    file.write_text("def add(a, b):\n    return a + b\n\n\ndef sub(a, b):\n    return a - b\n")
+    args = ["docs", str(file), "--save", "--update", "--changed-only"]
+    # the manifest is only written when asked for
+    assert CliRunner().invoke(app, args[:3]).exit_code == 0
+    assert not (tmp_path / ".write-the").exists()
+    assert CliRunner().invoke(app, args[:3] + ["--force", "--manifest"]).exit_code == 0
+    assert (tmp_path / ".write-the" / "manifest").exists()
+    # hand-edited docstrings aren't changes
+    file.write_text(file.read_text().replace("Sums 2 numbers.", "Adds a to b."))
+    # formatting-only edits aren't changes
+    file.write_text(file.read_text().replace("return a + b", "return (a +  b)  # sum"))
+    result = CliRunner().invoke(app, args)
+    assert result.exit_code == 0
+    assert "No changed nodes found" in " ".join(result.stdout.split())
+    assert "Adds a to b." in file.read_text()
+    assert mocked_run.call_count == 2
+    file.write_text(file.read_text().replace("return a - b", "return b - a"))
+    assert CliRunner().invoke(app, args).exit_code == 0
+    assert mocked_run.call_count == 3
+
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+import pytest
+
+# Modules that only the LLM commands need.
+HEAVY_MODULES = ["langchain", "openai", "tiktoken", "black", "libcst", "aiohttp"]
+# Cold startup was ~2.4s when every dependency was imported eagerly and is ~0.25s
+# with lazy imports (mostly typer). Leave headroom for slow CI runners.
+STARTUP_BUDGET = 1.0
+
+
+def import_times(code: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+@pytest.mark.parametrize(
+    "args", [["--version"], ["model", "--help"], ["mkdocs", "--help"]]
+)
+def test_cli_startup_skips_heavy_imports(args):
+    times = import_times(
+        "from write_the.cli import app\n"
+        "try:\n"
+        f"    app({args!r}, prog_name='write-the')\n"
+        "except SystemExit:\n"
+        "    pass\n"
+    )
+    assert "write_the.cli" in times
+    imported = [m for m in HEAVY_MODULES if m in times]
+    assert imported == []
+
+
+def test_cli_startup_budget():
+    times = import_times("import write_the.cli")
+    assert times["write_the.cli"] < STARTUP_BUDGET
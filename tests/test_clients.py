@@ -0,0 +1,44 @@
+import asyncio
+import openai
+import pytest
+from write_the.clients import clear_clients, client_session, get_client
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    clear_clients()
+    yield
+    clear_clients()
+
+
+def test_get_client_is_shared():
+    assert get_client("gpt-4") is get_client("gpt-4")
+
+
+@pytest.mark.parametrize(
+    "model_name, temperature",
+    [("gpt-3.5-turbo", 0), ("gpt-4", 1)],
+)
+def test_get_client_is_keyed_by_model_and_temperature(model_name, temperature):
+    assert get_client("gpt-4", 0) is not get_client(model_name, temperature)
+
+
+def test_get_client_type():
+    assert type(get_client("gpt-3.5-turbo-instruct")).__name__ == "OpenAI"
+    assert type(get_client("gpt-4")).__name__ == "ChatOpenAI"
+
+
+def test_client_session_is_shared_with_tasks():
+    async def get_session():
+        return openai.aiosession.get()
+
+    async def main():
+        async with client_session(pool_size=2) as session:
+            sessions = await asyncio.gather(get_session(), get_session())
+            assert all(s is session for s in sessions)
+            assert session.connector.limit == 2
+        assert openai.aiosession.get() is None
+        assert session.closed
+
+    asyncio.run(main())
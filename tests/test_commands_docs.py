@@ -0,0 +1,207 @@
+import asyncio
+from types import SimpleNamespace
+import libcst as cst
+import pytest
+from openai import error
+from write_the.backends import FakeBackend, set_backend
+from write_the.commands.docs.docs import (
+    request_docstrings,
+    run_batch,
+    write_the_docs_for_files,
+    write_the_docs_for_path,
+    write_the_docs_for_paths,
+)
+from write_the.cst.node_batcher import NodeBatch
+
+
+class FakeLLM:
+    def __init__(self, max_nodes=None, failures=0):
+        self.max_nodes = max_nodes
+        self.failures = failures
+        self.calls = []
+
+    async def run(self, code, nodes, tokens=None):
+        self.calls.append(nodes)
+        if self.failures:
+            self.failures -= 1
+            raise error.ServiceUnavailableError("Overloaded")
+        if self.max_nodes is not None and len(nodes) > self.max_nodes:
+            raise error.InvalidRequestError(
+                "This model's maximum context length is 4097 tokens.", None
+            )
+        return "\n".join(f"{node}:\n  Docs for {node}." for node in nodes)
+
+    async def stream(self, code, nodes, tokens=None):
+        result = await self.run(code, nodes, tokens)
+        for line in result.splitlines(keepends=True):
+            yield line
+
+
+@pytest.fixture
+def batch():
+    tree = cst.parse_module("def a(): pass\ndef b(): pass\ndef c(): pass\n")
+    return NodeBatch(
+        tree=tree,
+        background=None,
+        max_tokens=1000,
+        prompt_size=10,
+        nodes=[SimpleNamespace(name=name, tokens=10) for name in ["a", "b", "c"]],
+    )
+
+
+def test_run_batch(batch):
+    llm = FakeLLM()
+    docstrings = asyncio.run(run_batch(llm, batch))
+    assert list(docstrings) == ["a", "b", "c"]
+    assert len(llm.calls) == 1
+
+
+def test_run_batch_bisects_on_context_length_error(batch):
+    llm = FakeLLM(max_nodes=1)
+    docstrings = asyncio.run(run_batch(llm, batch))
+    assert sorted(docstrings) == ["a", "b", "c"]
+    assert llm.calls[0] == ["a", "b", "c"]
+    assert len(llm.calls) == 5
+    assert sorted(nodes for nodes in llm.calls if len(nodes) == 1) == [["a"], ["b"], ["c"]]
+
+
+def test_run_batch_raises_when_single_node_overflows(batch):
+    batch.nodes = batch.nodes[:1]
+    llm = FakeLLM(max_nodes=-1)
+    with pytest.raises(error.InvalidRequestError):
+        asyncio.run(run_batch(llm, batch))
+
+
+def test_run_batch_leaves_transient_errors_to_the_llm(batch):
+    llm = FakeLLM(failures=1)
+    with pytest.raises(error.ServiceUnavailableError):
+        asyncio.run(run_batch(llm, batch))
+    assert len(llm.calls) == 1
+
+
+def test_run_batch_streams_docstrings(batch):
+    llm = FakeLLM()
+    received = []
+    docstrings = asyncio.run(
+        run_batch(llm, batch, on_docstring=lambda name, docstring: received.append(name))
+    )
+    assert received == ["a", "b", "c"]
+    assert docstrings == asyncio.run(run_batch(FakeLLM(), batch))
+
+
+def test_run_batch_streams_bisected_batches(batch):
+    llm = FakeLLM(max_nodes=1)
+    received = []
+    asyncio.run(
+        run_batch(llm, batch, on_docstring=lambda name, docstring: received.append(name))
+    )
+    assert sorted(received) == ["a", "b", "c"]
+
+
+def test_run_batch_doesnt_request_streamed_nodes_again(batch):
+    class OverflowingLLM(FakeLLM):
+        async def stream(self, code, nodes, tokens=None):
+            self.calls.append(nodes)
+            if len(nodes) > 1:
+                # the first docstring is complete before the context window overflows
+                yield f"{nodes[0]}:\n  Docs for {nodes[0]}.\n{nodes[1]}:\n"
+                raise error.InvalidRequestError(
+                    "This model's maximum context length is 4097 tokens.", None
+                )
+            yield f"{nodes[0]}:\n  Docs for {nodes[0]}.\n"
+
+    llm = OverflowingLLM()
+    received = []
+    docstrings = asyncio.run(
+        run_batch(llm, batch, on_docstring=lambda name, docstring: received.append(name))
+    )
+    assert sorted(docstrings) == ["a", "b", "c"]
+    assert sorted(received) == ["a", "b", "c"]
+    assert not any("a" in nodes for nodes in llm.calls[1:])
+
+
+def test_request_docstrings_keeps_docstrings_when_cancelled(batch):
+    class StallingLLM(FakeLLM):
+        async def stream(self, code, nodes, tokens=None):
+            yield "a:\n  Docs for a.\nb:\n"
+            await asyncio.sleep(10)
+
+    received = {}
+
+    async def main():
+        task = asyncio.ensure_future(
+            request_docstrings(StallingLLM(), [batch], stream=True, received=received)
+        )
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(main())
+    assert list(received) == ["a"]
+
+
+def test_write_the_docs_for_files(monkeypatch):
+    monkeypatch.setattr("write_the.tokenizer.get_encoding", lambda model_name: None)
+    set_backend(FakeBackend())
+    trees = {
+        "pkg/a.py": cst.parse_module("def add(a, b):\n    return a + b\n"),
+        "pkg/b.py": cst.parse_module("class Calc:\n    def add(self):\n        pass\n"),
+        "pkg/c.py": cst.parse_module('def done():\n    """Done."""\n'),
+    }
+    batches = []
+    try:
+        results = asyncio.run(
+            write_the_docs_for_files(trees, model="fake", on_batches=batches.extend)
+        )
+    finally:
+        set_backend(None)
+    assert len(batches) == 1
+    assert batches[0].node_names == ["pkg/a.py::add", "pkg/b.py::Calc", "pkg/b.py::Calc.add"]
+    assert list(results) == ["pkg/a.py", "pkg/b.py"]
+    assert "pkg/a.py::add" in results["pkg/a.py"]
+    assert "pkg/b.py::Calc.add" in results["pkg/b.py"]
+
+
+def test_write_the_docs_for_paths(monkeypatch, tmp_path):
+    monkeypatch.setattr("write_the.tokenizer.get_encoding", lambda model_name: None)
+    set_backend(FakeBackend())
+    a, b = tmp_path / "a.py", tmp_path / "b.py"
+    a.write_text("def add(a, b):\n    return a + b\n")
+    b.write_text('def done():\n    """Done."""\n')
+    try:
+        result = asyncio.run(write_the_docs_for_path(a, model="fake", save=True))
+        results = asyncio.run(write_the_docs_for_paths([a, b], model="fake"))
+    finally:
+        set_backend(None)
+    assert result.startswith("def add(a, b):\n    \"\"\"")
+    assert list(results) == [a.as_posix()]
+    assert f"{a.as_posix()}::add" in results[a.as_posix()]
+
+
+def test_write_the_docs_for_paths_keeps_docstrings_when_cancelled(monkeypatch, tmp_path):
+    monkeypatch.setattr("write_the.tokenizer.get_encoding", lambda model_name: None)
+    set_backend(FakeBackend(tokens_per_second=100))
+    file = tmp_path / "calc.py"
+    file.write_text("def add(a, b):\n    return a + b\n\n\ndef sub(a, b):\n    return a - b\n")
+    kept = {}
+
+    async def main():
+        task = asyncio.ensure_future(
+            write_the_docs_for_paths(
+                [file],
+                model="fake",
+                stream=True,
+                on_docstring=lambda name, docstring: task.cancel(),
+                on_cancelled=lambda results, docstrings: kept.update(results),
+            )
+        )
+        await task
+
+    try:
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(main())
+    finally:
+        set_backend(None)
+    assert list(kept) == [file.as_posix()]
+    assert kept[file.as_posix()].count('"""') == 2
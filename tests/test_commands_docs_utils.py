@@ -0,0 +1,65 @@
+import pytest
+from write_the.commands.docs.utils import BlockStreamParser, extract_block
+
+
+@pytest.fixture
+def text():
+    return "add:\n  Sums 2 numbers.\n\n  Returns:\n    int: The sum.\nCalculate.multiply:\n  Multiplies 2 numbers.\n"
+
+
+def test_extract_block(text):
+    blocks = extract_block(text, ["add", "Calculate.multiply", "missing"])
+    assert blocks == {
+        "add": "\n  Sums 2 numbers.\n\n  Returns:\n    int: The sum.\n",
+        "Calculate.multiply": "\n  Multiplies 2 numbers.\n",
+    }
+
+
+def test_block_stream_parser_completes_blocks_as_they_arrive(text):
+    parser = BlockStreamParser(["add", "Calculate.multiply"])
+    completed = []
+    for i in range(0, len(text), 3):
+        blocks = parser.feed(text[i : i + 3])
+        completed.extend(blocks)
+        if "Calculate" in parser.text:
+            assert "add" in completed
+    assert completed == ["add"]
+    assert list(parser.close()) == ["Calculate.multiply"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_block_stream_parser_matches_extract_block(text, chunk_size):
+    names = ["add", "Calculate.multiply"]
+    parser = BlockStreamParser(names)
+    blocks = {}
+    for i in range(0, len(text), chunk_size):
+        blocks.update(parser.feed(text[i : i + chunk_size]))
+    blocks.update(parser.close())
+    assert blocks == extract_block(text, names)
+
+
+def test_block_stream_parser_close_without_blocks():
+    parser = BlockStreamParser(["add"])
+    parser.feed("Sorry, I can't help with that.")
+    assert parser.close() == {}
+
+
+def test_extract_block_file_qualified_names():
+    text = (
+        "/src/b.py::add:\n  Adds in b.\n"
+        "./a.py::add:\n  Adds in a.\n"
+        "a.py::add:\n  Adds.\n"
+        "a.py::Calculate.add:\n  Adds in Calculate.\n"
+    )
+    names = ["./a.py::add", "/src/b.py::add", "a.py::add", "a.py::Calculate.add"]
+    assert extract_block(text, names) == {
+        "./a.py::add": "\n  Adds in a.\n",
+        "/src/b.py::add": "\n  Adds in b.\n",
+        "a.py::add": "\n  Adds.\n",
+        "a.py::Calculate.add": "\n  Adds in Calculate.\n",
+    }
+
+
+def test_extract_block_ignores_longer_names():
+    text = "Calculate.add:\n  Adds in Calculate.\nadd:\n  Adds.\n"
+    assert extract_block(text, ["add"]) == {"add": "\n  Adds.\n"}
@@ -0,0 +1,120 @@
+import asyncio
+import pytest
+from openai import error
+from write_the.concurrency import (
+    AdaptiveConcurrencyLimiter,
+    backoff_delay,
+    get_retry_after,
+)
+
+
+def rate_limit_error(headers=None):
+    return error.RateLimitError("Rate limit reached", headers=headers)
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        (None, None),
+        ({"retry-after": "2"}, 2),
+        ({"retry-after-ms": "500"}, 0.5),
+        ({"retry-after": "soon"}, None),
+    ],
+)
+def test_get_retry_after(headers, expected):
+    assert get_retry_after(rate_limit_error(headers)) == expected
+
+
+@pytest.mark.parametrize("attempt", [0, 1, 5, 10])
+def test_backoff_delay(attempt):
+    assert 0 <= backoff_delay(attempt, base=1, cap=30) <= min(30, 2**attempt)
+
+
+def test_window_grows_additively():
+    limiter = AdaptiveConcurrencyLimiter(initial=2)
+    limiter.on_success(1)
+    limiter.on_success(1)
+    assert limiter.window == pytest.approx(2 + 1 / 2 + 1 / 2.5)
+
+
+def test_window_doesnt_grow_when_latency_spikes():
+    limiter = AdaptiveConcurrencyLimiter(initial=2, latency_tolerance=2)
+    limiter.on_success(1)
+    window = limiter.window
+    limiter.on_success(10)
+    assert limiter.window == window
+
+
+def test_window_shrinks_multiplicatively():
+    limiter = AdaptiveConcurrencyLimiter(initial=8, minimum=1, decrease=0.5)
+    limiter.on_throttle()
+    assert limiter.window == 4
+    for _ in range(5):
+        limiter.on_throttle()
+    assert limiter.window == 1
+
+
+def test_window_is_capped():
+    limiter = AdaptiveConcurrencyLimiter(initial=4, maximum=4)
+    limiter.on_success(1)
+    assert limiter.window == 4
+
+
+def test_window_starts_at_maximum_until_throttled():
+    limiter = AdaptiveConcurrencyLimiter(maximum=64)
+    assert limiter.window == 64
+    limiter.set_maximum(32)
+    assert limiter.window == 32
+    limiter.on_throttle()
+    limiter.set_maximum(64)
+    assert limiter.window == 16
+
+
+def test_slot_limits_in_flight_requests():
+    limiter = AdaptiveConcurrencyLimiter(initial=2, maximum=2)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*[request() for _ in range(6)])
+
+    asyncio.run(main())
+    assert peak == 2
+    assert limiter.in_flight == 0
+    assert limiter.throughput > 0
+
+
+def test_slot_honours_retry_after():
+    limiter = AdaptiveConcurrencyLimiter(initial=4)
+
+    async def main():
+        with pytest.raises(error.RateLimitError):
+            async with limiter.slot():
+                raise rate_limit_error({"retry-after": "0.05"})
+        assert limiter.window == 2
+        start = limiter.clock()
+        async with limiter.slot():
+            pass
+        return limiter.clock() - start
+
+    assert asyncio.run(main()) >= 0.04
+
+
+@pytest.mark.parametrize(
+    "e, attempt, retry",
+    [
+        (rate_limit_error(), 0, True),
+        (rate_limit_error(), 5, False),
+        (error.Timeout("Request timed out"), 0, True),
+        (error.ServiceUnavailableError("Overloaded"), 0, True),
+        (error.InvalidRequestError("Bad request", None), 0, False),
+    ],
+)
+def test_retry_delay(e, attempt, retry):
+    limiter = AdaptiveConcurrencyLimiter(max_retries=5)
+    assert (limiter.retry_delay(e, attempt) is not None) == retry
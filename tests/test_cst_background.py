@@ -0,0 +1,65 @@
+import libcst as cst
+from write_the.cst.background import elide_literals, keep_imports
+
+
+def test_elide_literals():
+    tree = cst.parse_module(
+        "MODELS = {'a': 1, 'b': 2}\n"
+        "SMALL = [1]\n"
+        "NAME: str = 'x' * 3\n"
+        "class Foo:\n"
+        "    CHOICES = ('one', 'two', 'three')\n"
+        "def foo():\n"
+        "    items = [1, 2, 3, 4, 5, 6]\n"
+    )
+    assert elide_literals(tree, max_length=10).code == (
+        "MODELS = ...\n"
+        "SMALL = [1]\n"
+        "NAME: str = 'x' * 3\n"
+        "class Foo:\n"
+        "    CHOICES = ...\n"
+        "def foo():\n"
+        "    items = [1, 2, 3, 4, 5, 6]\n"
+    )
+
+
+def test_elide_literals_keeps_classes():
+    tree = cst.parse_module(
+        "class Foo:\n"
+        "    CHOICES = ('one', 'two', 'three')\n"
+        "    class Bar:\n"
+        "        CHOICES = ('one', 'two', 'three')\n"
+    )
+    assert elide_literals(tree, max_length=10, keep=["Foo"]).code == tree.code
+    assert elide_literals(tree, max_length=10, keep=["Foo.Bar"]).code == (
+        "class Foo:\n"
+        "    CHOICES = ...\n"
+        "    class Bar:\n"
+        "        CHOICES = ('one', 'two', 'three')\n"
+    )
+
+
+def test_elide_literals_returns_tree_if_unchanged():
+    tree = cst.parse_module("X = [1]\n")
+    assert elide_literals(tree) is tree
+
+
+def test_keep_imports():
+    tree = cst.parse_module(
+        '"""Module."""\n'
+        "import os\n"
+        "from typing import List\n"
+        "X = 1\n"
+        "if True:\n"
+        "    import sys\n"
+        "def foo():\n"
+        "    pass\n"
+    )
+    assert keep_imports(tree).code == (
+        "import os\n"
+        "from typing import List\n"
+        "if True:\n"
+        "    import sys\n"
+        "def foo():\n"
+        "    pass\n"
+    )
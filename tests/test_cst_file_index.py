@@ -0,0 +1,197 @@
+import pytest
+import libcst as cst
+from write_the.cst.docstring_remover import remove_docstrings_from_tree
+from write_the.cst.file_index import FileIndex
+from write_the.cst.function_and_class_collector import get_node_names
+from write_the.cst.node_extractor import extract_node_from_tree, extract_nodes_from_tree
+from write_the.cst.node_remover import remove_nodes_from_tree
+from write_the.cst.utils import nodes_to_tree
+
+
+@pytest.fixture
+def tree():
+    return cst.parse_module(
+        """
+import os
+
+def foo():
+    \"\"\"Foo.\"\"\"
+    pass
+
+class Bar:
+    def baz(self):
+        def inner():
+            pass
+        return inner
+
+    def qux(self):
+        \"\"\"Qux.\"\"\"
+        pass
+
+def quux():
+    pass
+"""
+    )
+
+
+@pytest.fixture
+def index(tree):
+    return FileIndex(tree)
+
+
+def test_entries(index):
+    assert [e.name for e in index] == ["foo", "Bar", "Bar.baz", "Bar.inner", "Bar.qux", "quux"]
+    assert index["Bar.baz"].parent == "Bar"
+    assert index["Bar"].parent is None
+    assert index["foo"].has_docstring
+    assert not index["Bar.baz"].has_docstring
+    assert index["foo"].lines == (3, 6)
+    start, end = index["foo"].span
+    assert index.code[start:end] == '\ndef foo():\n    """Foo."""\n    pass\n'
+    assert index["Bar"].is_class
+    assert [n.name.value for n in index["Bar.inner"].enclosing] == ["Bar", "baz"]
+
+
+@pytest.mark.parametrize("force, update", [(True, False), (False, False), (False, True)])
+def test_node_names_match_collector(tree, index, force, update):
+    assert index.node_names(force, update) == get_node_names(tree, force, update)
+    assert get_node_names(tree, force, update, index=index) == get_node_names(
+        tree, force, update
+    )
+
+
+def test_extract_matches_extractor(tree, index):
+    names = ["quux", "Bar.qux", "foo"]
+    assert extract_nodes_from_tree(tree, names, index=index) == extract_nodes_from_tree(
+        tree, names
+    )
+    assert extract_node_from_tree(tree, "Bar", index=index) is index["Bar"].node
+    with pytest.raises(ValueError):
+        extract_node_from_tree(tree, "missing", index=index)
+
+
+@pytest.mark.parametrize("names", [["foo", "Bar.qux"], ["Bar"], ["Bar.inner", "quux"]])
+def test_remove_nodes_matches_remover(tree, index, names):
+    assert (
+        remove_nodes_from_tree(tree, names, index=index).code
+        == remove_nodes_from_tree(tree, names).code
+    )
+
+
+def test_remove_docstrings_matches_remover(tree, index):
+    names = ["foo", "Bar.qux"]
+    removed = remove_docstrings_from_tree(tree, names, index=index)
+    assert removed.code == remove_docstrings_from_tree(tree, names).code
+    assert '"""' not in removed.code
+
+
+@pytest.mark.parametrize(
+    "names", [[], ["foo"], ["Bar.baz", "quux"], ["Bar"], ["Bar.inner"], ["foo", "Bar", "quux"]]
+)
+def test_render_matches_transformers(tree, index, names):
+    assert index.render_without(names) == remove_nodes_from_tree(tree, names).code
+    if names:
+        assert index.render(names) == nodes_to_tree(extract_nodes_from_tree(tree, names)).code
+
+
+def test_render_without_emptied_block(tree, index):
+    # libcst fills emptied blocks with `pass`
+    names = ["Bar.baz", "Bar.qux"]
+    assert index.render_without(names) == remove_nodes_from_tree(tree, names).code
+    assert "pass" in index.render_without(names)
+
+
+def test_render_without_trailing_newline():
+    tree = cst.parse_module("def foo():\n    pass\n\ndef bar():\n    pass")
+    index = FileIndex(tree)
+    for names in (["foo"], ["bar"]):
+        assert index.render_without(names) == remove_nodes_from_tree(tree, names).code
+
+
+def test_index_of_another_tree_is_ignored(tree, index):
+    other = cst.parse_module("def foo():\n    pass\n")
+    assert remove_nodes_from_tree(other, ["foo"], index=index).code.strip() == ""
+    assert get_node_names(other, True, index=index) == ["foo"]
+
+
+def test_count_tokens(index):
+    class CountingTokenizer:
+        def __init__(self):
+            self.counted = []
+
+        def count_batch(self, texts):
+            self.counted.extend(texts)
+            return [len(text) for text in texts]
+
+    tokenizer = CountingTokenizer()
+    counts = index.count_tokens(tokenizer, ["foo", "quux"])
+    assert counts == [len(index["foo"].code), len(index["quux"].code)]
+    index.count_tokens(tokenizer, ["foo"])
+    assert len(tokenizer.counted) == 2
+
+
+def test_render_stubbed(tree, index):
+    code = index.render_stubbed(["Bar.baz"])
+    assert "def foo(): ...\n" in code
+    assert "def inner():\n            pass\n" in code
+    assert "def qux(self): ...\n" in code
+    compile(code, "<stubbed>", "exec")
+    assert index.render_stubbed(get_node_names(tree, True)) == tree.code
+
+
+def test_render_with_replacements(tree, index):
+    replacements = {"foo": "def foo(): ...\n", "Bar.qux": "def qux(self): ...\n"}
+    assert "def foo(): ...\n" in index.render(["foo"], replacements)
+    code = index.render_without(["Bar.baz"], replacements)
+    assert "def foo(): ...\n" in code
+    assert "    def qux(self): ...\n" in code
+    # Bar isn't replaced while one of its methods is rendered
+    code = index.render_without([], {"Bar": "class Bar: ...\n"})
+    assert "class Bar: ...\n" not in code
+    code = index.render_stubbed(["Bar.qux"], replacements)
+    assert "    def qux(self): ...\n" in code
+    compile(code, "<replaced>", "exec")
+
+
+def test_top_level_code_is_sliced(tree, index):
+    assert index["foo"].code == nodes_to_tree([index["foo"].node]).code
+    assert index["foo"]._code is None
+    assert index["Bar.baz"].code == nodes_to_tree([index["Bar.baz"].node]).code
+    assert index["Bar.baz"]._code is not None
+
+
+@pytest.mark.parametrize("names", [["foo"], ["Bar.baz", "quux"], ["Bar.qux", "Bar.inner"]])
+def test_release(tree, index, names):
+    expected = (
+        index.render(names),
+        index.render_without(names),
+        index.render_stubbed(names),
+        index.render_without(get_node_names(tree, True)),
+    )
+    index.release(names)
+    assert index.tree is None
+    assert all(e.node is None and e.block is None for e in index)
+    assert expected == (
+        index.render(names),
+        index.render_without(names),
+        index.render_stubbed(names),
+        index.render_without(get_node_names(tree, True)),
+    )
+    with pytest.raises(ValueError):
+        index["Bar.baz" if "Bar.baz" not in names else "Bar.qux"].code
+
+
+@pytest.mark.parametrize(
+    "lines, names",
+    [
+        ([(2, 2)], []),
+        ([(6, 6)], ["foo"]),
+        ([(8, 8)], ["Bar"]),
+        ([(11, 11)], ["Bar.inner"]),
+        ([(12, 12), (16, 16)], ["Bar.baz", "Bar.qux"]),
+        ([(6, 9)], ["foo", "Bar", "Bar.baz"]),
+        ([(1, 100)], ["foo", "Bar", "Bar.baz", "Bar.inner", "Bar.qux", "quux"]),
+    ],
+)
+def test_names_in_lines(index, lines, names):
+    assert index.names_in_lines(lines) == names
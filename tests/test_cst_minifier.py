@@ -0,0 +1,87 @@
+import ast
+
+import libcst as cst
+import pytest
+from write_the.cst.file_index import FileIndex
+from write_the.cst.minifier import minify_code, minify_tree, shorten_string
+
+
+SOURCE = '''"""A module."""
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from os import PathLike
+
+# a comment
+URL = "https://example.com/a/very/long/path/that/goes/on/and/on/and/on/for/a/while/yes.html"
+
+
+@decorator  # trailing comment
+def f(a,   b):
+    """Docstring of f."""
+    result = call(
+        a,
+        b,
+    )
+
+    if result:
+        return result
+    raise ValueError("no result")
+
+
+class A:
+    """Docstring of A."""
+
+    def m(self):
+        """Docstring of m."""
+        return 1
+'''
+
+
+def test_minify_tree():
+    code = minify_tree(cst.parse_module(SOURCE), ["f"]).code
+    ast.parse(code)
+    assert "#" not in code
+    assert "\n\n" not in code
+    assert "TYPE_CHECKING:" not in code
+    assert "A module." not in code
+    assert "Docstring of A." not in code and "Docstring of m." not in code
+    assert '"""Docstring of f."""' in code
+    assert "@decorator\ndef f(a, b):\n" in code
+    assert "result = call( a, b, )\n    if result:\n" in code
+    assert 'raise ValueError("no result")' in code
+    assert '...html"' not in code and '..."' in code
+
+
+def test_minify_tree_with_index():
+    tree = cst.parse_module(SOURCE)
+    code = minify_tree(tree, ["A.m"], index=FileIndex(tree)).code
+    assert "Docstring of m." in code
+    assert "Docstring of f." not in code
+
+
+def test_minify_tree_keeps_docstrings():
+    code = minify_tree(cst.parse_module(SOURCE), drop_docstrings=False).code
+    assert all(d in code for d in ("A module.", "Docstring of A.", "Docstring of m."))
+
+
+def test_minify_tree_keeps_type_checking_definitions():
+    source = "if TYPE_CHECKING:\n    class P:\n        pass\n"
+    assert "class P" in minify_tree(cst.parse_module(source)).code
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("'abc'", "'abc'"),
+        ("'abcdef'", "'abc...'"),
+        ('rb"""abcdef"""', 'rb"""abc..."""'),
+        ("'ab\\x41cd'", "'ab...'"),
+    ],
+)
+def test_shorten_string(value, expected):
+    assert shorten_string(value, max_length=3) == expected
+
+
+def test_minify_code_invalid():
+    assert minify_code("def (:") == "def (:"
@@ -0,0 +1,387 @@
+import pickle
+from types import SimpleNamespace
+
+import libcst as cst
+import pytest
+import write_the.tokenizer as tokenizer_module
+from write_the.cst.node_batcher import (
+    BatchFile,
+    CrossFileBatch,
+    FileNode,
+    LatencyModel,
+    NodeBatch,
+    create_batches,
+    create_cross_file_batches,
+    plan_balanced,
+    plan_first_fit_decreasing,
+    plan_greedy,
+    plan_latency,
+    split_qualified_name,
+)
+
+
+def make_nodes(*sizes):
+    return [SimpleNamespace(name=f"n{i}", tokens=size) for i, size in enumerate(sizes)]
+
+
+def create_batch(max_batch_size=None):
+    return NodeBatch(
+        tree=None,
+        background=SimpleNamespace(tokens=10),
+        max_tokens=110,
+        prompt_size=0,
+        max_batch_size=max_batch_size,
+    )
+
+
+def test_greedy_keeps_source_order():
+    batches = plan_greedy(make_nodes(60, 50, 40, 30, 20), create_batch)
+    assert [b.node_names for b in batches] == [["n0"], ["n1", "n2"], ["n3", "n4"]]
+
+
+def test_first_fit_decreasing_uses_fewer_batches():
+    batches = plan_first_fit_decreasing(make_nodes(60, 50, 40, 30, 20), create_batch)
+    assert [b.node_names for b in batches] == [["n0", "n2"], ["n1", "n3", "n4"]]
+    batches = plan_first_fit_decreasing(make_nodes(50, 60, 40, 50, 30), create_batch)
+    assert [b.node_names for b in batches] == [["n0", "n3"], ["n1", "n2"], ["n4"]]
+    # the background overhead counts towards every batch
+    assert all(b.tokens <= b.max_tokens for b in batches)
+
+
+def test_first_fit_decreasing_respects_max_batch_size():
+    batches = plan_first_fit_decreasing(
+        make_nodes(10, 10, 10, 10, 10), lambda: create_batch(max_batch_size=2)
+    )
+    assert [len(b.nodes) for b in batches] == [2, 2, 1]
+
+
+def test_first_fit_decreasing_raises_if_node_is_too_big():
+    with pytest.raises(ValueError):
+        plan_first_fit_decreasing(make_nodes(10, 101), create_batch)
+
+
+def test_fill():
+    batch = create_batch()
+    batch.add(SimpleNamespace(name="a", tokens=45))
+    assert batch.fill == pytest.approx(0.5)
+
+
+@pytest.fixture
+def approximate_tokens(monkeypatch):
+    monkeypatch.setattr(tokenizer_module, "get_encoding", lambda model_name: None)
+
+
+@pytest.mark.parametrize("planner", ["greedy", "ffd"])
+def test_create_batches(approximate_tokens, planner):
+    tree = cst.parse_module(
+        "".join(f"def f{i}():\n    return {'1 + ' * 20 * i}0\n\n" for i in range(6))
+    )
+    names = [f"f{i}" for i in range(6)]
+    batches = create_batches(
+        tree, names, max_tokens=200, prompt_size=20, response_size_per_node=10,
+        planner=planner,
+    )
+    assert sorted(n for b in batches for n in b.node_names) == names
+    assert all(b.tokens <= 200 for b in batches)
+
+
+def test_create_batches_unknown_planner(approximate_tokens):
+    tree = cst.parse_module("def f():\n    pass\n")
+    with pytest.raises(ValueError):
+        create_batches(tree, ["f"], 200, 20, 10, planner="unknown")
+    with pytest.raises(ValueError):
+        create_batches(tree, ["f"], 200, 20, 10, optimize="unknown")
+
+
+def test_create_batches_optimize_latency(approximate_tokens):
+    tree = cst.parse_module("".join(f"def f{i}():\n    pass\n\n" for i in range(4)))
+    names = [f"f{i}" for i in range(4)]
+    batches = create_batches(
+        tree, names, 4000, 20, 250, optimize="latency", concurrency=4
+    )
+    assert [b.node_names for b in batches] == [[name] for name in names]
+
+
+def test_create_batches_only_elides_literals_in_the_background(approximate_tokens):
+    choices = repr(tuple(f"choice{i}" for i in range(50)))
+    tree = cst.parse_module(
+        f"CHOICES = {choices}\n\n\nclass Form:\n    CHOICES = {choices}\n"
+    )
+    batches = create_batches(tree, ["Form"], 4000, 20, 10, send_node_context=False)
+    assert batches[0].code.count(choices) == 1
+    assert "CHOICES = ...\n" in batches[0].code
+
+
+def make_response_nodes(count, tokens=20, response_size=10):
+    return [
+        SimpleNamespace(name=f"n{i}", tokens=tokens, response_size=response_size)
+        for i in range(count)
+    ]
+
+
+def test_latency_model_completion_time():
+    model = LatencyModel(time_to_first_token=1, prefill_rate=10, output_rate=1)
+    batch = create_batch()
+    batch.add(SimpleNamespace(name="a", tokens=30, response_size=10))
+    # 1s overhead + 30 prompt tokens at 10/s + 10 output tokens at 1/s
+    assert model.request_time(batch) == pytest.approx(14)
+    assert model.completion_time([batch, batch], concurrency=2) == pytest.approx(14)
+    assert model.completion_time([batch, batch], concurrency=1) == pytest.approx(28)
+    limited = LatencyModel(1, 10, 1, tokens_per_minute=40)
+    # 80 tokens with a 40 tokens per minute budget
+    assert limited.completion_time([batch, batch], concurrency=2) == pytest.approx(60)
+
+
+def test_plan_latency_splits_with_spare_concurrency():
+    nodes = make_response_nodes(4)
+    assert len(plan_latency(nodes, create_batch, concurrency=1)) == 1
+    batches = plan_latency(nodes, create_batch, concurrency=4)
+    assert [b.node_names for b in batches] == [["n0"], ["n1"], ["n2"], ["n3"]]
+
+
+def test_plan_latency_keeps_batches_when_token_budget_is_tight():
+    nodes = make_response_nodes(4)
+    model = LatencyModel(tokens_per_minute=90)
+    # every extra batch resends the background, which the budget can't afford
+    assert len(plan_latency(nodes, create_batch, 4, model)) == 1
+
+
+def test_plan_balanced():
+    batches = plan_balanced(make_nodes(40, 30, 20, 10), create_batch, 2)
+    assert [b.node_names for b in batches] == [["n0", "n3"], ["n1", "n2"]]
+
+
+@pytest.mark.parametrize("background", [True, False])
+def test_code_is_memoized(approximate_tokens, background, monkeypatch):
+    tree = cst.parse_module("import os\n\ndef f():\n    pass\n\ndef g():\n    pass\n")
+    batches = create_batches(
+        tree, ["f", "g"], 4000, 20, 10, send_background_context=background,
+        send_node_context=False, remove_docstrings=False,
+    )
+    batch = batches[0]
+    code = batch.code
+    assert ("import os" in code) == background
+    calls = []
+    render = NodeBatch._render
+    monkeypatch.setattr(NodeBatch, "_render", lambda self: calls.append(1) or render(self))
+    assert batch.code == code
+    assert calls == []
+    first, second = batch.split()
+    assert "def g" not in first.code
+    assert "def f" not in second.code
+    assert len(calls) == 2
+
+
+def test_create_cross_file_batches(approximate_tokens):
+    trees = {
+        f"pkg/m{i}.py": cst.parse_module(f"import os\n\ndef f{i}(a):\n    return a\n")
+        for i in range(4)
+    }
+    names = {key: [f"f{i}"] for i, key in enumerate(trees)}
+    batches = create_cross_file_batches(trees, names, 4000, 100, 50)
+    assert len(batches) == 1
+    assert batches[0].node_names == [f"pkg/m{i}.py::f{i}" for i in range(4)]
+    assert batches[0].code.count("import os") == 4
+    assert "# File: pkg/m3.py\nimport os\n\ndef f3(a):" in batches[0].code
+    assert list(batches[0].file_batches()) == list(trees)
+
+
+def test_cross_file_batches_count_background_once_per_file(approximate_tokens):
+    trees = {"a.py": cst.parse_module("X = 1\n" * 50 + "def f():\n    pass\n\ndef g():\n    pass\n")}
+    one = create_cross_file_batches(trees, {"a.py": ["f"]}, 4000, 100, 50)[0]
+    two = create_cross_file_batches(trees, {"a.py": ["f", "g"]}, 4000, 100, 50)[0]
+    assert two.tokens - one.tokens == two.nodes[1].tokens
+
+
+def test_cross_file_batch_keeps_count_of_tokens_and_files():
+    a = BatchFile("a.py", create_batch, overhead=10)
+    b = BatchFile("b.py", create_batch, overhead=20)
+    nodes = [
+        FileNode(file, SimpleNamespace(name=name, tokens=5))
+        for file, name in [(a, "f"), (b, "g"), (a, "h")]
+    ]
+    batch = CrossFileBatch(max_tokens=65, prompt_size=15)
+    for node in nodes:
+        batch.add(node)
+    assert batch.tokens == 15 + 3 * 5 + 10 + 20
+    assert [f.key for f in batch.files] == ["a.py", "b.py"]
+    # another node of a file that is in the batch doesn't add its overhead again
+    assert batch.fits(FileNode(a, SimpleNamespace(name="i", tokens=5)))
+    c = BatchFile("c.py", create_batch, overhead=1)
+    assert not batch.fits(FileNode(c, SimpleNamespace(name="j", tokens=5)))
+    first, second = batch.split()
+    assert first.tokens == 15 + 5 + 10
+    assert second.tokens == 15 + 2 * 5 + 10 + 20
+
+
+def test_cross_file_batches_respect_max_tokens(approximate_tokens):
+    trees = {
+        f"m{i}.py": cst.parse_module(f"def f{i}():\n    return {'1 + ' * 30}0\n")
+        for i in range(6)
+    }
+    names = {key: [f"f{i}"] for i, key in enumerate(trees)}
+    batches = create_cross_file_batches(trees, names, 250, 20, 10)
+    assert 1 < len(batches) < 6
+    assert all(b.tokens <= 250 for b in batches)
+    assert sorted(n for b in batches for n in b.node_names) == sorted(
+        f"m{i}.py::f{i}" for i in range(6)
+    )
+
+
+def test_split_qualified_name():
+    assert split_qualified_name("/abs/m.py::C.m") == ("/abs/m.py", "C.m")
+
+
+@pytest.fixture
+def module_tree():
+    return cst.parse_module(
+        "import os\n\nMODELS = {" + ", ".join(f"'m{i}': {i}" for i in range(100)) + "}\n\n"
+        "def f():\n    return MODELS\n\n"
+        "def g():\n    return os.getcwd()\n"
+    )
+
+
+@pytest.mark.parametrize(
+    "level, background, code",
+    [
+        ("none", None, "def f():\n    return MODELS\n"),
+        ("imports", "import os\n", "import os\n\ndef f():\n    return MODELS\n"),
+        ("module", "MODELS = ...", "MODELS = ...\n\ndef f():\n    return MODELS\n"),
+        ("signatures", "def g(): ...", "def f():\n    return MODELS\n\ndef g(): ...\n"),
+        ("full", "return os.getcwd()", "def g():\n    return os.getcwd()\n"),
+    ],
+)
+def test_create_batches_background_levels(approximate_tokens, module_tree, level, background, code):
+    (batch,) = create_batches(module_tree, ["f"], 4000, 20, 10, background_level=level)
+    assert batch.background_level == level
+    if background is None:
+        assert batch.background is None
+    else:
+        assert background in batch.background.code
+    assert code in batch.code
+    assert "'m99'" not in batch.code
+
+
+def test_create_batches_background_budget(approximate_tokens, module_tree):
+    (batch,) = create_batches(
+        module_tree, ["f"], 4000, 20, 10, background_level="full", background_budget=5
+    )
+    assert batch.background_level == "imports"
+    assert batch.background.tokens <= 5
+
+
+def test_full_background_counts_nodes_once(approximate_tokens, module_tree):
+    (batch,) = create_batches(module_tree, ["f", "g"], 4000, 20, 10, background_level="full")
+    assert batch.tokens == 20 + batch.background.tokens + 2 * 10
+
+
+def test_create_batches_unknown_background_level(approximate_tokens, module_tree):
+    with pytest.raises(ValueError):
+        create_batches(module_tree, ["f"], 4000, 20, 10, background_level="unknown")
+
+
+def test_create_batches_shrinks_oversized_nodes(approximate_tokens):
+    tree = cst.parse_module(
+        "class Big:\n"
+        + "".join(f"    def m{i}(self):\n        return {'1 + ' * 40}0\n" for i in range(10))
+        + "\ndef huge():\n"
+        + "".join(f"    x{i} = {i}\n" for i in range(200))
+        + "    return x0\n"
+    )
+    names = ["Big", "huge"] + [f"Big.m{i}" for i in range(10)]
+    batches = create_batches(tree, names, 400, 20, 10, background_level="module")
+    nodes = {n.name: n for b in batches for n in b.nodes}
+    assert nodes["Big"].shrunk == "class skeleton"
+    assert nodes["huge"].shrunk.startswith("truncated")
+    assert nodes["Big.m0"].shrunk is None
+    assert all(b.tokens <= 400 for b in batches)
+    batch = next(b for b in batches if "huge" in b.node_names)
+    assert "statements truncated" in batch.code
+
+
+def test_create_batches_shrinks_oversized_signatures(approximate_tokens):
+    tree = cst.parse_module(
+        "def wide("
+        + ", ".join(f"a{i}: Dict[str, int] = {i}" for i in range(100))
+        + "):\n    return a0\n\n\ndef small():\n    pass\n"
+    )
+    batches = create_batches(tree, ["wide", "small"], 400, 20, 10)
+    nodes = {n.name: n for b in batches for n in b.nodes}
+    assert nodes["wide"].shrunk == "name only, signature truncated"
+    assert all(b.tokens <= 400 for b in batches)
+    batch = next(b for b in batches if "wide" in b.node_names)
+    assert "def wide(): ..." in batch.code
+
+
+def test_create_batches_minify(approximate_tokens):
+    tree = cst.parse_module(
+        "# " + "comment " * 50 + "\nimport os\n\n\n"
+        "def f(a):\n    # " + "note " * 50 + "\n    return a\n\n\n"
+        'def g():\n    """Documented already."""\n    return os.getcwd()\n'
+    )
+    (plain,) = create_batches(tree, ["f"], 4000, 20, 10, background_level="signatures")
+    (batch,) = create_batches(
+        tree, ["f"], 4000, 20, 10, background_level="signatures", minify=True
+    )
+    assert plain.saved_tokens == 0
+    assert "comment" not in batch.code and "note" not in batch.code
+    assert "Documented already." not in batch.code
+    assert "def f(a):\n    return a\n" in batch.code
+    assert batch.saved_tokens > 0
+    assert plain.tokens - batch.tokens == batch.saved_tokens
+    trees = {"a.py": tree, "b.py": tree}
+    (cross,) = create_cross_file_batches(
+        trees,
+        {"a.py": ["f"], "b.py": ["f"]},
+        4000,
+        20,
+        10,
+        background_level="signatures",
+        minify=True,
+    )
+    assert cross.saved_tokens == 2 * batch.saved_tokens
+
+
+@pytest.mark.parametrize("level", ["none", "imports", "module", "signatures", "full"])
+def test_create_batches_releases_trees(approximate_tokens, level):
+    tree = cst.parse_module(
+        "import os\n\nX = 1\n\n"
+        "class A:\n    def f(self):\n        return 1\n\n    def g(self):\n        return 2\n\n"
+        "def h():\n    return os.getcwd()\n"
+    )
+    names = ["A", "A.f", "A.g", "h"]
+    kwargs = dict(background_level=level, max_batch_size=2)
+    kept = create_batches(tree, names, 4000, 20, 10, release=False, **kwargs)
+    released = create_batches(tree, names, 4000, 20, 10, **kwargs)
+    assert all(b.tree is not None for b in kept)
+    assert all(b.tree is None and b.index.tree is None for b in released)
+    assert all(n.node is None for b in released for n in b.nodes)
+    if level != "none":
+        assert released[0].background.node is None
+    assert [b.code for b in released] == [b.code for b in kept]
+    assert [b.tokens for b in released] == [b.tokens for b in kept]
+
+
+def test_node_has_no_instance_dict(approximate_tokens):
+    (batch,) = create_batches(cst.parse_module("def f():\n    pass\n"), ["f"], 4000, 20, 10)
+    assert not hasattr(batch.nodes[0], "__dict__")
+    assert not hasattr(batch.background, "__dict__")
+
+
+@pytest.mark.parametrize("level", ["module", "signatures", "full"])
+def test_released_batches_can_be_pickled(approximate_tokens, level):
+    trees = {
+        f"m{i}.py": cst.parse_module(
+            f"import os\n\nclass A{i}:\n    def f(self):\n        return 1\n\ndef g{i}():\n    return 2\n"
+        )
+        for i in range(2)
+    }
+    names = {key: [f"A{i}", f"A{i}.f", f"g{i}"] for i, key in enumerate(trees)}
+    batches = create_batches(trees["m0.py"], names["m0.py"], 4000, 20, 10, background_level=level)
+    batches += create_cross_file_batches(trees, names, 4000, 20, 10, background_level=level)
+    copies = pickle.loads(pickle.dumps(batches))
+    assert [b.code for b in copies] == [b.code for b in batches]
+    assert [b.tokens for b in copies] == [b.tokens for b in batches]
+    assert [[h.code for h in b.split()] for b in copies] == [
+        [h.code for h in b.split()] for b in batches
+    ]
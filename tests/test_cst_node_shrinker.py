@@ -0,0 +1,87 @@
+import libcst as cst
+from write_the.cst.node_shrinker import (
+    class_skeleton,
+    shrink_node,
+    signature_stub,
+    truncate_body,
+)
+from write_the.cst.utils import get_code_from_node
+from write_the.tokenizer import approximate_count
+
+
+def big_function(statements):
+    return cst.parse_statement(
+        "def f(a):\n"
+        + "".join(f"    x{i} = a + {i}\n" for i in range(statements))
+        + "    return x0\n"
+    )
+
+
+def test_class_skeleton():
+    node = cst.parse_statement(
+        "class A:\n    X = 1\n\n    def f(self):\n        return 1\n\n    @property\n    def g(self):\n        return 2\n"
+    )
+    assert get_code_from_node(class_skeleton(node)) == (
+        "class A:\n    X = 1\n\n    def f(self): ...\n\n    @property\n    def g(self): ...\n"
+    )
+
+
+def test_truncate_body_keeps_signature_and_return():
+    node, removed = truncate_body(big_function(100), 60, approximate_count)
+    code = get_code_from_node(node)
+    assert removed > 0
+    assert code.startswith("def f(a):\n    x0 = a + 0\n")
+    assert f"    ...  # {removed} statements truncated\n    return x0\n" in code
+    assert approximate_count(code) <= 60
+
+
+def test_truncate_body_small_function():
+    node = big_function(2)
+    assert truncate_body(node, 1000, approximate_count) == (node, 0)
+
+
+def test_shrink_node_class():
+    node = cst.parse_statement(
+        "class A:\n"
+        + "".join(f"    def f{i}(self):\n        return {'1 + ' * 50}0\n" for i in range(5))
+    )
+    code, description = shrink_node(node, 100, approximate_count)
+    assert description == "class skeleton"
+    assert "def f4(self): ..." in code
+
+
+def test_shrink_node_class_truncates_skeleton():
+    node = cst.parse_statement(
+        "class A:\n" + "".join(f"    def f{i}(self): pass\n" for i in range(100))
+    )
+    code, description = shrink_node(node, 100, approximate_count)
+    assert description.startswith("class skeleton, truncated")
+    assert approximate_count(code) <= 100
+
+
+def big_signature(parameters):
+    return cst.parse_statement(
+        "@decorator\ndef f("
+        + ", ".join(f"a{i}: Dict[str, int] = {i}" for i in range(parameters))
+        + ") -> int:\n    return a0\n"
+    )
+
+
+def test_signature_stub():
+    node = big_signature(2)
+    assert get_code_from_node(signature_stub(node)) == (
+        "def f(a0: Dict[str, int] = 0, a1: Dict[str, int] = 1) -> int: ...\n"
+    )
+    assert get_code_from_node(signature_stub(node, keep_parameters=False)) == "def f(): ...\n"
+    node = cst.parse_statement("class A(Base, metaclass=Meta):\n    X = 1\n")
+    assert get_code_from_node(signature_stub(node, keep_parameters=False)) == "class A: ...\n"
+
+
+def test_shrink_node_oversized_signature():
+    node = big_signature(20)
+    code, description = shrink_node(node, 50, approximate_count, limit=200)
+    assert description == "signature only"
+    assert code.startswith("def f(a0: Dict[str, int] = 0") and "@decorator" not in code
+    code, description = shrink_node(node, 10, approximate_count)
+    assert description == "name only, signature truncated"
+    assert code == "def f(): ...\n"
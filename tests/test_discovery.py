@@ -0,0 +1,162 @@
+import pytest
+from write_the.discovery import (
+    count_up_to,
+    discover_python_files,
+    group_files,
+    is_generated,
+    iter_python_files,
+)
+
+
+def write(path, text="x = 1\n"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    (root / ".git").mkdir(parents=True)
+    write(root / "app.py")
+    write(root / "README.md", "# App\n")
+    write(root / "pkg" / "__init__.py")
+    write(root / "pkg" / "models.py")
+    write(root / "pkg" / "migrations" / "0001_initial.py")
+    write(root / ".venv" / "lib" / "site.py")
+    write(root / "build" / "lib" / "app.py")
+    write(root / "pkg" / "__pycache__" / "models.py")
+    return root
+
+
+def names(files, root):
+    return [f.relative_to(root).as_posix() for f in files]
+
+
+def test_iter_python_files_skips_default_excludes(project):
+    files = iter_python_files(project)
+    assert names(files, project) == [
+        "app.py",
+        "pkg/__init__.py",
+        "pkg/models.py",
+        "pkg/migrations/0001_initial.py",
+    ]
+
+
+def test_iter_python_files_is_lazy(project):
+    files = iter_python_files(project)
+    assert next(files) == project / "app.py"
+
+
+def test_iter_python_files_include_and_exclude(project):
+    files = iter_python_files(project, exclude=["migrations/"])
+    assert names(files, project) == ["app.py", "pkg/__init__.py", "pkg/models.py"]
+    files = iter_python_files(project, include=["pkg/**"], exclude=["__init__.py"])
+    assert names(files, project) == ["pkg/models.py", "pkg/migrations/0001_initial.py"]
+
+
+def test_iter_python_files_gitignore(project):
+    write(project / ".gitignore", "# ignored\nmigrations/\n")
+    write(project / "pkg" / ".gitignore", "models.py\n")
+    assert names(iter_python_files(project), project) == ["app.py", "pkg/__init__.py"]
+    # a subfolder of the repository follows the repository's .gitignore
+    assert names(iter_python_files(project / "pkg"), project) == ["pkg/__init__.py"]
+    files = iter_python_files(project, gitignore=False)
+    assert len(list(files)) == 4
+
+
+def test_iter_python_files_gitignore_negation(project):
+    write(project / ".gitignore", "pkg/*.py\n")
+    write(project / "pkg" / ".gitignore", "!models.py\n")
+    assert names(iter_python_files(project, exclude=["migrations/"]), project) == [
+        "app.py",
+        "pkg/models.py",
+    ]
+    # within a file the last matching pattern decides
+    write(project / "pkg" / ".gitignore", "!models.py\nmodels.py\n")
+    assert names(iter_python_files(project / "pkg", exclude=["migrations/"]), project) == []
+
+
+def test_iter_python_files_build_folders_inside_packages(project):
+    write(project / "pkg" / "build" / "steps.py")
+    write(project / "dist" / "app.py")
+    assert names(iter_python_files(project, exclude=["migrations/"]), project) == [
+        "app.py",
+        "pkg/__init__.py",
+        "pkg/models.py",
+        "pkg/build/steps.py",
+    ]
+
+
+def test_iter_python_files_outside_a_repository(tmp_path):
+    write(tmp_path / ".gitignore", "*.py\n")
+    write(tmp_path / "src" / "app.py")
+    assert list(iter_python_files(tmp_path / "src")) == [tmp_path / "src" / "app.py"]
+
+
+def test_iter_python_files_size_and_generated(project):
+    write(project / "big.py", "x = 1\n" * 100)
+    write(project / "api_pb2.py")
+    write(project / "schema.py", "# Code generated by a tool. DO NOT EDIT.\nx = 1\n")
+    skipped = []
+    files = iter_python_files(
+        project, max_size=100, on_skip=lambda path, reason: skipped.append((path.name, reason))
+    )
+    assert "big.py" not in names(files, project)
+    assert skipped == [
+        ("api_pb2.py", "generated"),
+        ("big.py", "larger than 100 bytes (600)"),
+        ("schema.py", "generated"),
+    ]
+    files = iter_python_files(project, max_size=None, skip_generated=False)
+    assert {"api_pb2.py", "big.py", "schema.py"} <= set(names(files, project))
+
+
+def test_iter_python_files_missing_directory(tmp_path):
+    assert list(iter_python_files(tmp_path / "missing")) == []
+
+
+@pytest.mark.parametrize(
+    "name, text, expected",
+    [
+        ("service_pb2_grpc.py", "", True),
+        ("models.py", "# @generated by a tool\n", True),
+        ("models.py", "'''Models.'''\n# auto-generated below\n", True),
+        ("models.py", "# Models, not to be generated again\n", False),
+        ("models.py", "x = 'do not edit'\n", False),
+    ],
+)
+def test_is_generated(tmp_path, name, text, expected):
+    assert is_generated(write(tmp_path / name, text)) == expected
+
+
+def test_discover_python_files(project):
+    explicit = project / ".venv" / "lib" / "site.py"
+    files = discover_python_files([explicit, project / "pkg"], exclude=["migrations/"])
+    assert names(files, project) == [
+        ".venv/lib/site.py",
+        "pkg/__init__.py",
+        "pkg/models.py",
+    ]
+
+
+def test_count_up_to():
+    count, items = count_up_to(iter(range(10)), 3)
+    assert count == 3
+    assert list(items) == list(range(10))
+    count, items = count_up_to(iter(range(2)), 3)
+    assert count == 2
+    assert list(items) == [0, 1]
+
+
+def test_group_files(tmp_path):
+    files = [write(tmp_path / f"m{i}.py", "x = 1\n" * (i + 1)) for i in range(5)]
+    groups = list(group_files(iter(files), max_files=2, max_bytes=1000))
+    assert groups == [files[:2], files[2:4], files[4:]]
+    # 6 + 12 + 18 bytes, then 24 and 30
+    groups = list(group_files(files, max_files=10, max_bytes=40))
+    assert groups == [files[:3], files[3:4], files[4:]]
+    # a file larger than the limit is a group of its own
+    assert list(group_files(files[4:], max_bytes=1)) == [files[4:]]
+    assert list(group_files([tmp_path / "missing.py"])) == [[tmp_path / "missing.py"]]
+    assert list(group_files([])) == []
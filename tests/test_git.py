@@ -0,0 +1,106 @@
+import shutil
+import subprocess
+import pytest
+from write_the.errors import GitError
+from write_the.git import changed_lines, map_lines, parse_diff
+
+DIFF = """diff --git a/src/calc.py b/src/calc.py
+index 1111111..2222222 100644
+--- a/src/calc.py
++++ b/src/calc.py
+@@ -2 +2 @@ def add(a, b):
+-    return a + b
++    return b + a
+@@ -10,2 +9,0 @@ class Calc:
+-    x = 1
+-    y = 2
+@@ -20,0 +19,3 @@ class Calc:
++++ not a header
++    def mul(self, a, b):
++        return a * b
+diff --git a/old.py b/old.py
+deleted file mode 100644
+--- a/old.py
++++ /dev/null
+@@ -1 +0,0 @@
+-x = 1
+diff --git "a/caf\\303\\251.py" "b/caf\\303\\251.py"
+new file mode 100644
+--- /dev/null
++++ "b/caf\\303\\251.py"
+@@ -0,0 +1,2 @@
++def f():
++    pass
+"""
+
+
+def test_parse_diff():
+    assert parse_diff(DIFF) == {
+        "src/calc.py": [(2, 2), (9, 9), (19, 21)],
+        "café.py": [(1, 2)],
+    }
+
+
+@pytest.mark.parametrize(
+    "ranges, expected",
+    [
+        # before the hunks
+        ([(1, 1)], [(1, 1)]),
+        # after 2 lines added after line 2
+        ([(3, 4)], [(5, 6)]),
+        # after line 5 became 3 lines
+        ([(8, 8)], [(12, 12)]),
+        # inside the changed line
+        ([(5, 5)], [(7, 9)]),
+        # across the removed lines 9 and 10, which followed line 10 of the new file
+        ([(8, 11)], [(12, 13)]),
+    ],
+)
+def test_map_lines(ranges, expected):
+    hunks = [(2, 0, 3, 2), (5, 1, 7, 3), (9, 2, 10, 0)]
+    assert map_lines(ranges, hunks) == expected
+
+
+def git(repo, *args):
+    subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    if shutil.which("git") is None:
+        pytest.skip("git isn't installed")
+    git(tmp_path, "init", "-q")
+    git(tmp_path, "config", "user.email", "write-the@example.com")
+    git(tmp_path, "config", "user.name", "write-the")
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.py").write_text("def a():\n    return 1\n")
+    (tmp_path / "src" / "b.py").write_text("def b():\n    return 2\n")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "init")
+    return tmp_path
+
+
+def test_changed_lines(repo):
+    a = repo / "src" / "a.py"
+    a.write_text("def a():\n    return 1\n\n\ndef c():\n    return 3\n")
+    assert changed_lines(since="HEAD", cwd=repo) == {a.resolve(): [(3, 6)]}
+    assert changed_lines(staged=True, cwd=repo) == {}
+    git(repo, "add", "src/a.py")
+    assert changed_lines(staged=True, cwd=repo) == {a.resolve(): [(3, 6)]}
+    assert changed_lines(since="HEAD", paths=["src/b.py"], cwd=repo) == {}
+
+
+def test_changed_lines_staged_with_unstaged_changes_above(repo):
+    a = repo / "src" / "a.py"
+    a.write_text("def a():\n    return 1\n\n\ndef c():\n    return 3\n")
+    git(repo, "add", "src/a.py")
+    # lines 3-6 of the index are lines 7-10 of the working tree
+    a.write_text("import os\n\n\n\n" + a.read_text())
+    assert changed_lines(staged=True, cwd=repo) == {a.resolve(): [(7, 10)]}
+
+
+def test_changed_lines_errors(repo, tmp_path_factory):
+    with pytest.raises(GitError, match="bad revision"):
+        changed_lines(since="no-such-ref", cwd=repo)
+    with pytest.raises(GitError):
+        changed_lines(since="HEAD", cwd=tmp_path_factory.mktemp("not_a_repo"))
@@ -0,0 +1,99 @@
+import libcst as cst
+import pytest
+import write_the.manifest as manifest_module
+from write_the.cst.function_and_class_collector import get_node_names
+from write_the.manifest import Manifest, hash_nodes, unchanged_nodes
+
+SOURCE = '''class Calc:
+    """A calculator."""
+
+    def add(self, a, b):
+        """Adds."""
+        return a + b
+
+    @property
+    def value(self):
+        return 1
+
+    @value.setter
+    def value(self, v):
+        pass
+
+
+def sub(a, b):
+    return a - b
+'''
+
+
+def test_hash_nodes_names_nodes_like_the_collector():
+    names = get_node_names(cst.parse_module(SOURCE), force=True)
+    assert sorted(hash_nodes(SOURCE)) == sorted(set(names))
+
+
+@pytest.mark.parametrize(
+    "edit",
+    [
+        ("return a + b", "return (a  +  b)  # sum"),
+        ("def sub(a, b):", "def sub(\n    a,\n    b,\n):"),
+        ("return a - b", "return a - b\n\n\n# trailing comment"),
+    ],
+)
+def test_hash_nodes_ignores_formatting(edit):
+    assert hash_nodes(SOURCE) == hash_nodes(SOURCE.replace(*edit))
+
+
+def test_hash_nodes_code_and_docstring_changes():
+    hashes = hash_nodes(SOURCE)
+    changed = hash_nodes(SOURCE.replace("return a + b", "return b + a"))
+    assert changed["Calc.add"][0] != hashes["Calc.add"][0]
+    assert changed["sub"] == hashes["sub"]
+    # documenting a method doesn't change its class
+    documented = hash_nodes(SOURCE.replace("return a - b", '"""Subtracts."""\n    return a - b'))
+    assert documented["sub"][0] == hashes["sub"][0]
+    assert documented["sub"][1] is not None and hashes["sub"][1] is None
+    documented = hash_nodes(SOURCE.replace("return 1", '"""One."""\n        return 1'))
+    assert documented["Calc"] == hashes["Calc"]
+    # a class is hashed from the signatures of its methods, not their bodies
+    assert changed["Calc"] == hashes["Calc"]
+    changed = hash_nodes(SOURCE.replace("def add(self, a, b):", "def add(self, a, b=0):"))
+    assert changed["Calc"][0] != hashes["Calc"][0]
+
+
+def test_hash_nodes_of_invalid_code():
+    assert hash_nodes("def f(:\n") == {}
+
+
+def test_unchanged_nodes():
+    recorded = hash_nodes(SOURCE)
+    source = SOURCE.replace("return a - b", "return b - a").replace('"""Adds."""', '"""Sums."""')
+    # edited docstrings aren't changes
+    assert sorted(unchanged_nodes(source, recorded)) == ["Calc", "Calc.add"]
+    assert unchanged_nodes(source, {}) == []
+    # removed docstrings are
+    source = SOURCE.replace('    """Adds."""\n', "")
+    assert unchanged_nodes(source, recorded) == ["Calc"]
+
+
+def test_manifest_round_trip(tmp_path):
+    path = tmp_path / ".write-the" / "manifest"
+    file = tmp_path / "src" / "calc.py"
+    manifest = Manifest(path, root=tmp_path)
+    assert manifest.key(file) == "src/calc.py"
+    manifest.record(file, hash_nodes(SOURCE))
+    # only the nodes with docstrings are recorded
+    assert sorted(manifest.get(file)) == ["Calc", "Calc.add"]
+    manifest.save()
+    assert Manifest(path, root=tmp_path).get(file) == manifest.get(file)
+    assert Manifest(path, root=tmp_path).get(tmp_path / "other.py") == {}
+
+
+def test_manifest_ignores_other_versions(tmp_path, monkeypatch):
+    path = tmp_path / "manifest"
+    manifest = Manifest(path, root=tmp_path)
+    manifest.record(tmp_path / "calc.py", hash_nodes(SOURCE))
+    manifest.save()
+    monkeypatch.setattr(manifest_module, "PYTHON_VERSION", "2.7")
+    assert Manifest(path, root=tmp_path).files == {}
+    path.write_text("not json")
+    assert Manifest(path, root=tmp_path).files == {}
+    assert Manifest(tmp_path / "missing", root=tmp_path).files == {}
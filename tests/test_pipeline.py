@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from write_the.pipeline import Stage, max_items_in_flight, run_pipeline
+
+
+def test_run_pipeline():
+    results = []
+
+    async def double(item):
+        await asyncio.sleep(0)
+        return item * 2
+
+    async def drop_odd(item):
+        return item if item % 4 == 0 else None
+
+    async def collect(item):
+        results.append(item)
+
+    stages = [Stage(double, workers=3), Stage(drop_odd), Stage(collect)]
+    asyncio.run(run_pipeline(range(10), stages))
+    assert sorted(results) == [0, 4, 8, 12, 16]
+
+
+def test_run_pipeline_bounds_items_in_flight():
+    in_flight = 0
+    peak = 0
+
+    def items():
+        nonlocal in_flight, peak
+        for i in range(100):
+            in_flight += 1
+            peak = max(peak, in_flight)
+            yield i
+
+    async def slow(item):
+        await asyncio.sleep(0.001)
+        return item
+
+    async def done(item):
+        nonlocal in_flight
+        in_flight -= 1
+
+    stages = [Stage(slow, workers=2), Stage(slow, workers=4), Stage(done)]
+    asyncio.run(run_pipeline(items(), stages))
+    assert in_flight == 0
+    # plus the item the feeder holds while it waits for room
+    assert peak <= max_items_in_flight(stages) + 1
+
+
+def test_run_pipeline_raises_and_stops():
+    processed = []
+
+    async def fail(item):
+        if item == 3:
+            raise RuntimeError("boom")
+        return item
+
+    async def collect(item):
+        processed.append(item)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run_pipeline(range(1000), [Stage(fail), Stage(collect)]))
+    assert len(processed) < 10
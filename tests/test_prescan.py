@@ -0,0 +1,67 @@
+import libcst as cst
+import pytest
+import write_the.prescan as prescan
+from write_the.cst.function_and_class_collector import get_node_names
+from write_the.prescan import has_candidate_nodes, prescan_files
+
+SOURCES = {
+    "documented": 'def f():\n    """Doc."""\n\nclass A:\n    """Doc."""\n    def m(self):\n        """Doc."""\n',
+    "undocumented_method": 'class A:\n    """Doc."""\n    async def m(self):\n        pass\n',
+    "nested": 'if True:\n    try:\n        def f():\n            pass\n    except Exception:\n        pass\n',
+    "no_nodes": "import os\n\nX = 1\n",
+    "bytes_docstring": 'def f():\n    b"""Doc."""\n',
+    "concatenated": 'def f():\n    "Doc " "string."\n',
+    "suite": 'def f(): "Doc."\n',
+}
+
+
+@pytest.mark.parametrize("name", SOURCES)
+@pytest.mark.parametrize("force, update", [(False, False), (False, True), (True, False)])
+def test_has_candidate_nodes_never_misses(name, force, update):
+    source = SOURCES[name]
+    expected = bool(get_node_names(cst.parse_module(source), force, update))
+    assert has_candidate_nodes(source, force, update) >= expected
+
+
+@pytest.mark.parametrize(
+    "name, force, update, expected",
+    [
+        ("documented", False, False, False),
+        ("documented", False, True, True),
+        ("undocumented_method", False, False, True),
+        ("nested", False, False, True),
+        ("no_nodes", True, False, False),
+        ("bytes_docstring", False, False, False),
+    ],
+)
+def test_has_candidate_nodes(name, force, update, expected):
+    assert has_candidate_nodes(SOURCES[name], force, update) == expected
+
+
+def test_has_candidate_nodes_is_conservative():
+    # libcst doesn't see these as docstrings
+    assert has_candidate_nodes(SOURCES["concatenated"], False)
+    assert has_candidate_nodes(SOURCES["suite"], False)
+    # leave code ast can't parse to libcst
+    assert has_candidate_nodes("def f(:\n", False, True)
+
+
+def test_has_candidate_nodes_with_node_names():
+    source = "class A:\n    def m(self):\n        pass\n\n    class B:\n        pass\n\n    def n(self):\n        pass\n"
+    assert has_candidate_nodes(source, True, node_names=["A.m"])
+    # named like the FunctionAndClassCollector names them
+    assert get_node_names(cst.parse_module(source), True) == ["A", "B", "A.m", "n"]
+    assert has_candidate_nodes(source, True, node_names=["n"])
+    assert not has_candidate_nodes(source, True, node_names=["A.n", "missing"])
+
+
+@pytest.mark.parametrize("min_files", [1, 100])
+def test_prescan_files(tmp_path, monkeypatch, min_files):
+    monkeypatch.setattr(prescan, "PROCESS_POOL_MIN_FILES", min_files)
+    files = []
+    for name, source in SOURCES.items():
+        files.append(tmp_path / f"{name}.py")
+        files[-1].write_text(source)
+    candidates, skipped = prescan_files(files, force=False, max_workers=2)
+    assert [f.stem for f in skipped] == ["documented", "no_nodes", "bytes_docstring"]
+    assert candidates == [f for f in files if f not in skipped]
@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+from write_the.scheduler import Scheduler, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_token_bucket_starts_full(clock):
+    bucket = TokenBucket(10, 1, clock=clock)
+    assert bucket.delay(10) == 0
+
+
+def test_token_bucket_delay(clock):
+    bucket = TokenBucket(10, 2, clock=clock)
+    bucket.consume(10)
+    assert bucket.delay(4) == 2
+    clock.time = 1
+    assert bucket.delay(4) == 1
+
+
+def test_token_bucket_refills_to_capacity(clock):
+    bucket = TokenBucket(10, 2, clock=clock)
+    bucket.consume(10)
+    clock.time = 100
+    bucket.refill()
+    assert bucket.tokens == 10
+
+
+def test_token_bucket_clamps_to_capacity(clock):
+    bucket = TokenBucket(10, 1, clock=clock)
+    assert bucket.delay(100) == 0
+
+
+def test_scheduler_unlimited_model():
+    scheduler = Scheduler()
+    assert not scheduler.is_limited("gpt-4")
+    asyncio.run(scheduler.acquire("gpt-4", 1000))
+    assert scheduler.max_queue_depth == 0
+
+
+def test_scheduler_limits_are_per_model():
+    scheduler = Scheduler()
+    scheduler.set_limits("gpt-4", rpm=1)
+    assert scheduler.is_limited("gpt-4")
+    assert not scheduler.is_limited("gpt-3.5-turbo")
+
+
+def test_scheduler_delays_requests_over_budget():
+    scheduler = Scheduler()
+    scheduler.set_limits("gpt-4", tpm=600)
+    asyncio.run(scheduler.acquire("gpt-4", 600))
+    assert scheduler.delay("gpt-4", 10) == pytest.approx(1, rel=0.1)
+    assert scheduler.delay("gpt-3.5-turbo", 10) == 0
+
+
+def test_scheduler_reports_queue_depth():
+    scheduler = Scheduler()
+    scheduler.set_limits("gpt-4", rpm=1)
+
+    async def main():
+        tasks = [asyncio.ensure_future(scheduler.acquire("gpt-4", 1)) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        assert scheduler.queue_depth == 4
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(main())
+    assert scheduler.queue_depth == 0
+    assert scheduler.max_queue_depth == 4
+
+
+def test_scheduler_locks_are_per_event_loop():
+    scheduler = Scheduler()
+    scheduler.set_limits("gpt-4", rpm=60)
+
+    async def main():
+        await scheduler.acquire("gpt-4", 1)
+        return scheduler.lock("gpt-4")
+
+    first = asyncio.run(main())
+    second = asyncio.run(main())
+    assert first is not second
+
+
+def test_get_limits():
+    scheduler = Scheduler()
+    assert scheduler.get_limits("gpt-4") == (None, None)
+    scheduler.set_limits("gpt-4", rpm=10, tpm=1000)
+    assert scheduler.get_limits("gpt-4") == (10, 1000)
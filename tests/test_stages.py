@@ -0,0 +1,113 @@
+import pytest
+import write_the.tokenizer as tokenizer_module
+from write_the.errors import FileSkippedError
+from write_the.manifest import hash_nodes
+from write_the.stages import (
+    apply_docstrings_to_source,
+    plan_docs_for_file,
+    plan_docs_for_files,
+    prepare_source_for_tests,
+)
+
+
+@pytest.fixture
+def approximate_tokens(monkeypatch):
+    monkeypatch.setattr(tokenizer_module, "get_encoding", lambda model_name: None)
+
+
+def test_plan_docs_for_file(approximate_tokens, tmp_path):
+    file = tmp_path / "add.py"
+    file.write_text("def add(a,b):\n    return a+b\n")
+    source_code, node_names, batches = plan_docs_for_file(
+        file, pretty=True, max_tokens=4000, prompt_size=100, model="gpt-4"
+    )
+    assert source_code == "def add(a, b):\n    return a + b\n"
+    assert node_names == ["add"]
+    assert [b.node_names for b in batches] == [["add"]]
+    assert batches[0].tree is None
+    result = apply_docstrings_to_source(source_code, {"add": "Adds."}, node_names)
+    assert "Adds." in result
+
+
+def test_plan_docs_for_file_without_nodes(approximate_tokens, tmp_path):
+    file = tmp_path / "done.py"
+    file.write_text('def done():\n    """Done."""\n')
+    with pytest.raises(FileSkippedError):
+        plan_docs_for_file(file, max_tokens=4000, prompt_size=100, model="gpt-4")
+
+
+def test_plan_docs_for_files(approximate_tokens, tmp_path):
+    files = []
+    for name, code in [("a", "def a():\n    pass\n"), ("b", 'def b():\n    """B."""\n')]:
+        files.append(tmp_path / f"{name}.py")
+        files[-1].write_text(code)
+    sources, names, batches, failed = plan_docs_for_files(
+        files, max_tokens=4000, prompt_size=100, model="gpt-4"
+    )
+    key = files[0].as_posix()
+    assert list(sources) == list(names) == [key]
+    assert batches[0].node_names == [f"{key}::a"]
+    assert failed == {}
+
+
+def test_plan_docs_for_files_with_unparsable_files(approximate_tokens, tmp_path):
+    good, bad = tmp_path / "good.py", tmp_path / "bad.py"
+    good.write_text("def good():\n    pass\n")
+    bad.write_text("def bad(a:\n    pass\n")
+    options = dict(max_tokens=4000, prompt_size=100, model="gpt-4")
+    sources, names, batches, failed = plan_docs_for_files([bad, good], **options)
+    assert list(names) == [good.as_posix()]
+    assert list(failed) == [bad.as_posix()]
+    assert "Syntax Error" in failed[bad.as_posix()]
+    # the failures are returned even when no other file has nodes
+    good.write_text('def good():\n    """Good."""\n')
+    sources, names, batches, failed = plan_docs_for_files([bad, good], **options)
+    assert names == {} and batches == [] and list(failed) == [bad.as_posix()]
+    with pytest.raises(FileSkippedError):
+        plan_docs_for_files([good], **options)
+
+
+def test_prepare_source_for_tests(tmp_path):
+    file = tmp_path / "add.py"
+    file.write_text('def add(a,b):\n    """Adds."""\n    return a+b  # sum\n')
+    assert prepare_source_for_tests(file) == (
+        'def add(a, b):\n    """Adds."""\n    return a + b  # sum\n'
+    )
+    assert prepare_source_for_tests(file, minify=True) == (
+        'def add(a, b):\n    """Adds."""\n    return a + b\n'
+    )
+
+
+def test_plan_docs_for_file_changed_only(approximate_tokens, tmp_path):
+    file = tmp_path / "calc.py"
+    file.write_text(
+        'def add(a, b):\n    """Adds."""\n    return a + b\n\n\n'
+        'def sub(a, b):\n    """Subtracts."""\n    return a - b\n'
+    )
+    recorded = hash_nodes(file.read_text())
+    options = dict(max_tokens=4000, prompt_size=100, model="gpt-4", update=True)
+    with pytest.raises(FileSkippedError, match="No changed nodes"):
+        plan_docs_for_file(file, recorded=recorded, **options)
+    file.write_text(file.read_text().replace("a - b", "b - a"))
+    _, node_names, _ = plan_docs_for_file(file, recorded=recorded, **options)
+    assert node_names == ["sub"]
+    # given nodes are documented whether they changed or not
+    _, node_names, _ = plan_docs_for_file(
+        file, recorded=recorded, node_names=["add"], **options
+    )
+    assert node_names == ["add"]
+
+
+def test_plan_docs_for_file_changed_lines(approximate_tokens, tmp_path):
+    file = tmp_path / "calc.py"
+    # formatting moves `sub` up, the lines are those of the file as it is
+    file.write_text("def add(a,b):\n    return a+b\n\n\n\n\ndef sub(a,b):\n    return a-b\n")
+    options = dict(max_tokens=4000, prompt_size=100, model="gpt-4")
+    _, node_names, _ = plan_docs_for_file(file, pretty=True, lines=[(8, 8)], **options)
+    assert node_names == ["sub"]
+    with pytest.raises(FileSkippedError, match="No changed nodes"):
+        plan_docs_for_file(file, lines=[(30, 30)], **options)
+    sources, names, _, _ = plan_docs_for_files(
+        [file], lines={file.as_posix(): [(1, 2)]}, **options
+    )
+    assert names == {file.as_posix(): ["add"]}
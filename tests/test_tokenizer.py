@@ -0,0 +1,164 @@
+import pickle
+import pytest
+import write_the.tokenizer as tokenizer_module
+from write_the.tokenizer import (
+    Tokenizer,
+    add_counts,
+    approximate_count,
+    get_encoding,
+    get_encoding_cache_path,
+    get_tokenizer,
+    pop_new_counts,
+    set_offline,
+    warmup,
+)
+
+
+class FakeEncoding:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text, **kwargs):
+        self.encoded.append(text)
+        return text.split()
+
+    def encode_batch(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return [text.split() for text in texts]
+
+
+@pytest.fixture
+def encoding(monkeypatch):
+    encoding = FakeEncoding()
+    monkeypatch.setattr(tokenizer_module, "get_encoding", lambda model_name: encoding)
+    return encoding
+
+
+def test_count(encoding):
+    tokenizer = Tokenizer()
+    assert tokenizer.count("a b c") == 3
+    assert tokenizer.count("a b c") == 3
+    assert encoding.encoded == ["a b c"]
+
+
+def test_count_batch(encoding):
+    tokenizer = Tokenizer()
+    tokenizer.count("a")
+    assert tokenizer.count_batch(["a", "a b", "a b c", "a b"]) == [1, 2, 3, 2]
+    assert encoding.encoded == ["a", "a b", "a b c"]
+
+
+def test_max_entries(encoding):
+    tokenizer = Tokenizer(max_entries=2)
+    tokenizer.count_batch(["a", "a b", "a b c"])
+    assert len(tokenizer.counts) == 2
+
+
+def test_save_and_load(encoding, tmp_path):
+    tokenizer = Tokenizer()
+    tokenizer.count("a b")
+    tokenizer.save(tmp_path / "tokens.json")
+    loaded = Tokenizer()
+    loaded.load(tmp_path / "tokens.json")
+    assert loaded.count("a b") == 2
+    assert encoding.encoded == ["a b"]
+
+
+def test_save_replaces_the_file(encoding, tmp_path, monkeypatch):
+    path = tmp_path / "tokens.json"
+    tokenizer = Tokenizer()
+    tokenizer.count("a b")
+    tokenizer.save(path)
+
+    def interrupted(counts, f):
+        f.write('{"trunc')
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(tokenizer_module.json, "dump", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            tokenizer.save(path)
+    # the saved counts are untouched
+    loaded = Tokenizer()
+    loaded.load(path)
+    assert loaded.counts == tokenizer.counts
+
+
+def test_load_missing_file(tmp_path):
+    tokenizer = Tokenizer()
+    tokenizer.load(tmp_path / "missing.json")
+    assert tokenizer.counts == {}
+
+
+def test_get_tokenizer_is_shared():
+    assert get_tokenizer("gpt-4") is get_tokenizer("gpt-4")
+    assert get_tokenizer("gpt-4") is not get_tokenizer("gpt-3.5-turbo")
+
+
+def test_new_counts_round_trip(encoding, monkeypatch):
+    monkeypatch.setattr(tokenizer_module, "_tokenizers", {})
+    get_tokenizer("gpt-4").count("a b")
+    assert pop_new_counts() == {}
+    # in a worker process
+    monkeypatch.setattr(tokenizer_module, "_collecting", True)
+    get_tokenizer("gpt-4").count("a b c")
+    new_counts = pop_new_counts()
+    assert list(new_counts) == ["gpt-4"] and list(new_counts["gpt-4"].values()) == [3]
+    assert pop_new_counts() == {}
+    # in the main process
+    monkeypatch.setattr(tokenizer_module, "_tokenizers", {})
+    add_counts(new_counts)
+    assert get_tokenizer("gpt-4").counts == new_counts["gpt-4"]
+
+
+def test_pickled_tokenizer_is_the_shared_one(encoding):
+    tokenizer = Tokenizer("gpt-4")
+    tokenizer.count("a b c")
+    assert pickle.loads(pickle.dumps(tokenizer)) is get_tokenizer("gpt-4")
+
+
+@pytest.fixture
+def no_encoding(monkeypatch):
+    monkeypatch.setattr(tokenizer_module, "get_encoding", lambda model_name: None)
+
+
+def test_approximate_count_overestimates():
+    text = "def add(a, b):\n    return a + b\n"
+    assert approximate_count(text) >= len(text) / 4
+    assert approximate_count("") == 0
+
+
+def test_count_falls_back_to_approximate(no_encoding):
+    tokenizer = Tokenizer()
+    text = "def add(a, b):\n    return a + b\n"
+    assert tokenizer.approximate
+    assert tokenizer.count(text) == approximate_count(text)
+    assert tokenizer.count_batch([text, "a"]) == [
+        approximate_count(text),
+        approximate_count("a"),
+    ]
+    # approximate counts aren't persisted with the exact ones
+    assert tokenizer.counts == {}
+
+
+def test_offline_without_cached_encoding(monkeypatch, tmp_path):
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path))
+    set_offline(True)
+    try:
+        assert get_encoding("gpt-4") is None
+    finally:
+        set_offline(False)
+
+
+def test_warmup_from_source(monkeypatch, tmp_path):
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path / "cache"))
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "cl100k_base.tiktoken").write_text("YQ== 0\n")
+    cached = warmup(["cl100k_base"], source=source)
+    assert cached["cl100k_base"] == get_encoding_cache_path("cl100k_base")
+    assert cached["cl100k_base"].read_text() == "YQ== 0\n"
+    with pytest.raises(FileNotFoundError):
+        warmup(["p50k_base"], source=source)
+    with pytest.raises(ValueError):
+        warmup(["unknown"], source=source)
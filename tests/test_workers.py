@@ -0,0 +1,74 @@
+import asyncio
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+import write_the.tokenizer as tokenizer_module
+import write_the.workers as workers
+from write_the.errors import WorkerError
+from write_the.stages import plan_docs_for_file
+from write_the.workers import cpu_pool, get_cpu_workers, run_in_worker
+
+
+@pytest.mark.parametrize(
+    "cpu_workers, files, expected",
+    [(None, 10, 4), (None, 1, 0), (2, 10, 2), (8, 3, 3), (1, 1, 1), (0, 10, 0)],
+)
+def test_get_cpu_workers(monkeypatch, cpu_workers, files, expected):
+    monkeypatch.setattr(workers.os, "cpu_count", lambda: 4)
+    assert get_cpu_workers(cpu_workers, files) == expected
+
+
+def test_cpu_pool_without_workers():
+    with cpu_pool(0) as executor:
+        assert executor is None
+    assert asyncio.run(run_in_worker(executor, pow, 2, 3)) == 8
+
+
+def test_run_in_worker(tmp_path):
+    file = tmp_path / "add.py"
+    file.write_text("def add(a, b):\n    return a + b\n")
+    options = dict(max_tokens=4000, prompt_size=100, model="gpt-4")
+
+    async def plan(executor):
+        return await run_in_worker(executor, plan_docs_for_file, file, **options)
+
+    with cpu_pool(1) as executor:
+        source_code, node_names, batches = asyncio.run(plan(executor))
+    expected = plan_docs_for_file(file, **options)
+    assert (source_code, node_names) == expected[:2]
+    assert [b.code for b in batches] == [b.code for b in expected[2]]
+
+
+class BrokenPool:
+    def submit(self, fn, *args, **kwargs):
+        raise BrokenProcessPool("A process in the process pool was terminated abruptly")
+
+
+def test_run_in_worker_falls_back_to_main_process():
+    assert asyncio.run(run_in_worker(BrokenPool(), pow, 2, 3)) == 8
+
+
+class InlinePool:
+    def __init__(self, error=None):
+        self.error = error
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def test_run_in_worker_sends_token_counts_back(monkeypatch):
+    monkeypatch.setattr(tokenizer_module, "_tokenizers", {})
+    monkeypatch.setattr(workers, "pop_new_counts", lambda: {"gpt-4": {"abc": 7}})
+    assert asyncio.run(run_in_worker(InlinePool(), pow, 2, 3)) == 8
+    assert tokenizer_module.get_tokenizer("gpt-4").counts == {"abc": 7}
+
+
+def test_run_in_worker_fails_when_the_worker_dies():
+    pool = InlinePool(BrokenProcessPool("A process in the process pool was terminated abruptly"))
+    with pytest.raises(WorkerError):
+        asyncio.run(run_in_worker(pool, pow, 2, 3))
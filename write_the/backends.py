@@ -0,0 +1,278 @@
+import ast
+import asyncio
+import os
+import random
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .llm import LLM
+
+
+class Backend:
+    """
+    The interface for the services that generate LLM responses.
+    """
+
+    name: str
+
+    async def complete(self, llm: "LLM", **inputs) -> str:
+        """
+        Generates the response to a prompt.
+
+        Args:
+          llm (LLM): The LLM making the request.
+          **inputs (dict): The prompt template variables.
+
+        Returns:
+          str: The generated text.
+        """
+        raise NotImplementedError()
+
+    async def stream(self, llm: "LLM", **inputs) -> AsyncIterator[str]:
+        """
+        Generates the response to a prompt, yielding the text as it is generated.
+
+        Args:
+          llm (LLM): The LLM making the request.
+          **inputs (dict): The prompt template variables.
+
+        Yields:
+          str: The next chunk of generated text.
+        """
+        yield await self.complete(llm, **inputs)
+
+
+class OpenAIBackend(Backend):
+    """
+    A backend that sends requests to the OpenAI API.
+    """
+
+    name = "openai"
+
+    async def complete(self, llm: "LLM", **inputs) -> str:
+        return await llm.chain.apredict(**inputs)
+
+    async def stream(self, llm: "LLM", **inputs) -> AsyncIterator[str]:
+        prompt = llm.prompt.format(**inputs)
+        async for chunk in llm.chain.llm.astream(prompt):
+            yield getattr(chunk, "content", chunk)
+
+
+def parse_latency(spec: str) -> Tuple[str, Tuple[float, ...]]:
+    """
+    Parses a latency distribution in the form `name:param,param`.
+
+    Args:
+      spec (str): The distribution, one of `fixed:seconds`, `uniform:low,high`, `normal:mean,stddev` or `lognormal:mu,sigma`.
+
+    Returns:
+      Tuple[str, Tuple[float, ...]]: The name and parameters of the distribution.
+
+    Raises:
+      ValueError: If the distribution is not supported.
+
+    Examples:
+      >>> parse_latency("uniform:0.5,2")
+      ('uniform', (0.5, 2.0))
+    """
+    name, _, params = spec.partition(":")
+    values = tuple(float(p) for p in params.split(",") if p)
+    expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+    if name not in expected or len(values) != expected[name]:
+        raise ValueError(f"Invalid latency distribution: {spec}!")
+    return name, values
+
+
+class FakeBackend(Backend):
+    """
+    A deterministic, offline backend that returns valid responses for benchmarking and load testing.
+
+    Responses are generated from the request itself (docstrings for the requested nodes, a test
+    per function or the unchanged code for conversions). Latency, generation speed and errors
+    are emulated from the configured distributions.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: str = "fixed:0",
+        tokens_per_second: Optional[float] = None,
+        rate_limit_rate: float = 0,
+        context_error_rate: float = 0,
+        retry_after: float = 1,
+        seed: Optional[int] = 0,
+    ):
+        """
+        Initializes the FakeBackend.
+
+        Args:
+          latency (str, optional): The distribution of the time to the first token. Defaults to "fixed:0".
+          tokens_per_second (Optional[float], optional): The emulated generation speed. Defaults to None (instant).
+          rate_limit_rate (float, optional): The fraction of requests that fail with a rate limit error. Defaults to 0.
+          context_error_rate (float, optional): The fraction of requests that fail with a context length error. Defaults to 0.
+          retry_after (float, optional): The `Retry-After` sent with rate limit errors. Defaults to 1.
+          seed (Optional[int], optional): The seed for the random number generator. Defaults to 0.
+        """
+        self.latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.context_error_rate = context_error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.requests = 0
+
+    @classmethod
+    def from_env(cls) -> "FakeBackend":
+        """
+        Creates a FakeBackend configured by `WRITE_THE_FAKE_*` environment variables.
+
+        Returns:
+          FakeBackend: The backend.
+        """
+        env = os.environ
+        tokens_per_second = env.get("WRITE_THE_FAKE_TPS")
+        seed = env.get("WRITE_THE_FAKE_SEED", "0")
+        return cls(
+            latency=env.get("WRITE_THE_FAKE_LATENCY", "fixed:0"),
+            tokens_per_second=float(tokens_per_second) if tokens_per_second else None,
+            rate_limit_rate=float(env.get("WRITE_THE_FAKE_RATE_LIMIT", 0)),
+            context_error_rate=float(env.get("WRITE_THE_FAKE_CONTEXT_ERROR", 0)),
+            retry_after=float(env.get("WRITE_THE_FAKE_RETRY_AFTER", 1)),
+            seed=int(seed) if seed else None,
+        )
+
+    def sample_latency(self) -> float:
+        """
+        Samples the time to the first token.
+
+        Returns:
+          float: The latency in seconds.
+        """
+        name, params = self.latency
+        if name == "fixed":
+            return params[0]
+        if name == "uniform":
+            return self.random.uniform(*params)
+        if name == "normal":
+            return max(0.0, self.random.gauss(*params))
+        return self.random.lognormvariate(*params)
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        return max(1, len(text) // 4)
+
+    def respond(self, **inputs) -> str:
+        """
+        Creates a valid response for a request.
+
+        Args:
+          **inputs (dict): The prompt template variables.
+
+        Returns:
+          str: The docstrings, tests or converted code requested.
+        """
+        code = inputs.get("code", "")
+        if "nodes" in inputs:
+            return "\n".join(
+                f"{node}:\n  Fake docstring for {node}.\n" for node in inputs["nodes"]
+            )
+        if "path" in inputs:
+            try:
+                names = [
+                    node.name
+                    for node in ast.walk(ast.parse(code))
+                    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+                ]
+            except SyntaxError:
+                names = []
+            tests = [f"def test_{name}():\n    assert True\n" for name in names]
+            return "\n\n".join(tests or ["def test_placeholder():\n    assert True\n"])
+        return f"{code}\n```"
+
+    async def _request(self, llm: "LLM", **inputs) -> str:
+        from openai import error
+
+        self.requests += 1
+        await asyncio.sleep(self.sample_latency())
+        if self.random.random() < self.rate_limit_rate:
+            raise error.RateLimitError(
+                "Rate limit reached (fake backend).",
+                headers={"retry-after": str(self.retry_after)},
+            )
+        prompt_tokens = self.count_tokens(llm.prompt.format(**inputs))
+        if (
+            prompt_tokens > llm.max_tokens
+            or self.random.random() < self.context_error_rate
+        ):
+            raise error.InvalidRequestError(
+                f"This model's maximum context length is {llm.max_tokens} tokens. "
+                f"However, your messages resulted in {prompt_tokens} tokens (fake backend).",
+                None,
+                code="context_length_exceeded",
+            )
+        return self.respond(**inputs)
+
+    async def complete(self, llm: "LLM", **inputs) -> str:
+        response = await self._request(llm, **inputs)
+        if self.tokens_per_second:
+            await asyncio.sleep(self.count_tokens(response) / self.tokens_per_second)
+        return response
+
+    async def stream(self, llm: "LLM", **inputs) -> AsyncIterator[str]:
+        response = await self._request(llm, **inputs)
+        for line in response.splitlines(keepends=True):
+            if self.tokens_per_second:
+                await asyncio.sleep(self.count_tokens(line) / self.tokens_per_second)
+            yield line
+
+
+backends: Dict[str, type] = {
+    OpenAIBackend.name: OpenAIBackend,
+    FakeBackend.name: FakeBackend,
+}
+_backend: Optional[Backend] = None
+
+
+def create_backend(name: str) -> Backend:
+    """
+    Creates a backend by name.
+
+    Args:
+      name (str): The name of the backend.
+
+    Returns:
+      Backend: The backend. The fake backend is configured from the environment.
+
+    Raises:
+      ValueError: If the backend doesn't exist.
+    """
+    if name not in backends:
+        raise ValueError(f"Backend '{name}' not found!")
+    if name == FakeBackend.name:
+        return FakeBackend.from_env()
+    return backends[name]()
+
+
+def get_backend() -> Backend:
+    """
+    Gets the process-wide backend, selected by the `WRITE_THE_BACKEND` environment variable on first use.
+
+    Returns:
+      Backend: The backend. Defaults to the OpenAI backend.
+    """
+    global _backend
+    if _backend is None:
+        _backend = create_backend(os.environ.get("WRITE_THE_BACKEND", "openai"))
+    return _backend
+
+
+def set_backend(backend: Backend) -> None:
+    """
+    Sets the process-wide backend.
+
+    Args:
+      backend (Backend): The backend to use for every LLM request.
+    """
+    global _backend
+    _backend = backend
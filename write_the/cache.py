@@ -0,0 +1,192 @@
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+
+class LLMCache:
+    """
+    A persistent, content-addressed cache of LLM responses backed by SQLite.
+
+    Entries are evicted least-recently-used first once the cache grows past
+    `max_size` bytes, and entries older than `max_age` seconds are dropped.
+    """
+
+    filename = "responses.sqlite3"
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path],
+        max_size: int = 256 * 1024 * 1024,
+        max_age: float = 30 * 24 * 60 * 60,
+        offline: bool = False,
+    ):
+        """
+        Initializes the LLMCache, creating the database if it doesn't exist.
+
+        Args:
+          cache_dir (Union[str, Path]): The directory to store the cache database in.
+          max_size (int, optional): The maximum size of the cached responses in bytes. Defaults to 256 MiB.
+          max_age (float, optional): The maximum age of a cached response in seconds. Defaults to 30 days.
+          offline (bool, optional): Whether only cached responses may be used. Defaults to False.
+
+        Side Effects:
+          Creates `cache_dir` and the cache database if they don't exist.
+          Evicts expired entries.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.cache_dir / self.filename
+        self.max_size = max_size
+        self.max_age = max_age
+        self.offline = offline
+        self._connection = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._connection.commit()
+        self.evict()
+
+    @staticmethod
+    def key(
+        model_name: str,
+        temperature: float,
+        template: str,
+        inputs: dict,
+        backend: str = "openai",
+    ) -> str:
+        """
+        Creates a cache key from everything that determines an LLM response.
+
+        Args:
+          model_name (str): The name of the model.
+          temperature (float): The sampling temperature.
+          template (str): The prompt template.
+          inputs (dict): The template variables.
+          backend (str, optional): The name of the backend generating the response. Defaults to "openai".
+
+        Returns:
+          str: The hex digest identifying the request.
+
+        Examples:
+          >>> LLMCache.key("gpt-4", 0, "{code}", {"code": "pass"}) == LLMCache.key("gpt-4", 0, "{code}", {"code": "pass"})
+          True
+        """
+        template_hash = hashlib.sha256(template.encode()).hexdigest()
+        payload = json.dumps(
+            {
+                "backend": backend,
+                "model_name": model_name,
+                "temperature": temperature,
+                "template": template_hash,
+                "inputs": inputs,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Retrieves a cached response and marks it as recently used.
+
+        Args:
+          key (str): The cache key.
+
+        Returns:
+          Optional[str]: The cached response or None if it is missing or expired.
+        """
+        row = self._connection.execute(
+            "SELECT value, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        now = time.time()
+        if now - created > self.max_age:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._connection.commit()
+            return None
+        self._connection.execute(
+            "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+        )
+        self._connection.commit()
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Stores a response in the cache.
+
+        Args:
+          key (str): The cache key.
+          value (str): The response to store.
+
+        Side Effects:
+          Evicts the least recently used entries if the cache is over `max_size`.
+        """
+        now = time.time()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value.encode()), now, now),
+        )
+        self._connection.commit()
+        if self.size > self.max_size:
+            self.evict()
+
+    @property
+    def size(self) -> int:
+        """
+        Gets the total size of the cached responses.
+
+        Returns:
+          int: The size of the cached responses in bytes.
+        """
+        (size,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        return size
+
+    def evict(self) -> None:
+        """
+        Removes expired entries and then least recently used entries until the cache fits in `max_size`.
+        """
+        self._connection.execute(
+            "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)
+        )
+        excess = self.size - self.max_size
+        if excess > 0:
+            rows = self._connection.execute(
+                "SELECT key, size FROM responses ORDER BY accessed ASC"
+            ).fetchall()
+            keys = []
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                keys.append((key,))
+                excess -= size
+            self._connection.executemany("DELETE FROM responses WHERE key = ?", keys)
+        self._connection.commit()
+
+    def clear(self) -> None:
+        """
+        Removes every entry from the cache.
+        """
+        self._connection.execute("DELETE FROM responses")
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        return count
+
+    def close(self) -> None:
+        self._connection.close()
@@ -2,19 +2,29 @@ import typer
 import os
 from write_the.models import models
 from write_the.__about__ import __version__
-from write_the.commands import write_the_tests, write_the_mkdocs, write_the_converters
+from write_the.discovery import (
+    CROSS_FILE_GROUP_BYTES,
+    CROSS_FILE_GROUP_FILES,
+    DEFAULT_MAX_SIZE,
+    count_up_to,
+    discover_python_files,
+    group_files,
+)
 from write_the.utils import list_python_files
 from pathlib import Path
-from rich.console import Console
-from rich.syntax import Syntax
-from rich.progress import Progress, SpinnerColumn, TextColumn
 from typing import List, Optional
-from black import InvalidInput
-from asyncio import run, gather
 from functools import wraps
 
-from .tasks import async_cli_task
-from .model import get_default_model, set_default_model
+from .model import (
+    get_cache_dir,
+    get_default_model,
+    get_rate_limits,
+    get_tiktoken_dir,
+    set_default_model,
+)
+
+# langchain, openai, tiktoken, black, libcst and rich are imported inside the
+# commands that use them so that startup stays fast (see tests/test_cli_startup.py).
 
 
 class AsyncTyper(typer.Typer):
@@ -22,6 +32,8 @@ class AsyncTyper(typer.Typer):
         def decorator(async_func):
             @wraps(async_func)
             def sync_func(*_args, **_kwargs):
+                from asyncio import run
+
                 return run(async_func(*_args, **_kwargs))
 
             self.command(*args, **kwargs)(sync_func)
@@ -39,6 +51,51 @@ def _get_model_callback(value: str):
         raise typer.BadParameter(f"Model '{value}' not found!")
     return value
 
+def _get_cache(cache: bool, cache_dir: Optional[Path], cache_only: bool):
+    from write_the.cache import LLMCache
+    from write_the.tokenizer import set_offline
+
+    if cache_only and not cache:
+        raise typer.BadParameter("--cache-only can't be used with --no-cache.")
+    if not cache:
+        return None
+    if cache_only:
+        set_offline(True)
+    return LLMCache(cache_dir or get_cache_dir(), offline=cache_only)
+
+def _get_changed_lines(since: Optional[str], staged: bool, paths: List[Path]):
+    from write_the.errors import GitError
+    from write_the.git import changed_lines
+
+    if since is None and not staged:
+        return None
+    try:
+        return changed_lines(since=since, staged=staged, paths=paths)
+    except GitError as e:
+        raise typer.BadParameter(f"Can't get the changes from git: {e}")
+
+def _set_rate_limits(model: str, rpm: Optional[int], tpm: Optional[int]) -> None:
+    from write_the.scheduler import get_scheduler
+
+    config_rpm, config_tpm = get_rate_limits(model)
+    get_scheduler().set_limits(model, rpm=rpm or config_rpm, tpm=tpm or config_tpm)
+
+def _get_planner_callback(value: str):
+    if value not in ("greedy", "ffd"):
+        raise typer.BadParameter(f"Planner '{value}' not found!")
+    return value
+
+def _get_optimize_callback(value: str):
+    if value not in ("tokens", "latency"):
+        raise typer.BadParameter(f"Can't optimize for '{value}'!")
+    return value
+
+def _get_background_level_callback(value: Optional[str]):
+    if value not in (None, "none", "imports", "module", "signatures", "full"):
+        raise typer.BadParameter(f"Background level '{value}' not found!")
+    return value
+
+
 def _print_version(ctx: typer.Context, value: bool):
     if value:
         typer.echo(__version__)
@@ -55,11 +112,35 @@ def callback(
         is_eager=True,
         callback=_print_version,
         show_default=False,
-    )
+    ),
+    backend: str = typer.Option(
+        "openai",
+        "--backend",
+        envvar="WRITE_THE_BACKEND",
+        help="The backend that generates responses (openai or fake). The fake backend is configured with WRITE_THE_FAKE_* environment variables.",
+    ),
+    offline: bool = typer.Option(
+        False,
+        "--offline",
+        envvar="WRITE_THE_OFFLINE",
+        help="Never download tokenizer files. Token counts are approximated if the tokenizer isn't cached (see `write-the warmup`).",
+    ),
 ):
     """
     AI-powered Code Generation and Refactoring Tool
     """
+    # keep tokenizer files next to the config rather than in the temp directory
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", str(get_tiktoken_dir()))
+    if offline:
+        from write_the.tokenizer import set_offline
+
+        set_offline(True)
+    from write_the.backends import create_backend, set_backend
+
+    try:
+        set_backend(create_backend(backend))
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--backend")
 
 
 @app.async_command()
@@ -92,6 +173,23 @@ async def docs(
         "-g",
         help="Send background (other code) with nodes.",
     ),
+    background_level: Optional[str] = typer.Option(
+        None,
+        "--background-level",
+        help="How much of the rest of the file to send: none, imports, module (module-level code), signatures (plus stubs of the other nodes) or full (the whole file). Defaults to module, none with --no-background and full with --context.",
+        callback=_get_background_level_callback,
+    ),
+    background_budget: Optional[int] = typer.Option(
+        None,
+        "--background-budget",
+        help="Maximum background tokens per request. Lower levels are used for files whose background doesn't fit.",
+        min=0,
+    ),
+    minify: bool = typer.Option(
+        False,
+        "--minify/--no-minify",
+        help="Strip comments, blank lines, long strings and the docstrings of other nodes from the code sent, and report the tokens saved.",
+    ),
     force: bool = typer.Option(
         False,
         "--force/--no-force",
@@ -104,9 +202,89 @@ async def docs(
         "-u",
         help="Update the existing docstrings.",
     ),
+    changed_only: bool = typer.Option(
+        False,
+        "--changed-only",
+        help="Only document nodes whose code (ignoring formatting, comments and docstrings) changed since the last --save --changed-only (or --manifest), as recorded in .write-the/manifest.",
+    ),
+    record_manifest: bool = typer.Option(
+        False,
+        "--manifest",
+        help="Record the saved nodes in .write-the/manifest for later --changed-only runs (--changed-only records them too).",
+    ),
+    since: Optional[str] = typer.Option(
+        None,
+        "--since",
+        help="Only document the functions and classes with lines changed since a git commit, branch or tag (e.g. origin/main).",
+    ),
+    staged: bool = typer.Option(
+        False,
+        "--staged",
+        help="Only document the functions and classes with staged changes (e.g. in a pre-commit hook).",
+    ),
+    include: List[str] = typer.Option(
+        None,
+        "--include",
+        help="Only document the files in folders matching these gitignore-style patterns (relative to the folder), e.g. 'api/**'.",
+    ),
+    exclude: List[str] = typer.Option(
+        None,
+        "--exclude",
+        help="Skip the files and folders matching these gitignore-style patterns (relative to the folder), e.g. 'migrations/'. Environments, caches and build folders are always skipped.",
+    ),
+    gitignore: bool = typer.Option(
+        True,
+        "--gitignore/--no-gitignore",
+        help="Skip the files and folders ignored by git.",
+    ),
+    max_size: int = typer.Option(
+        DEFAULT_MAX_SIZE,
+        "--max-size",
+        help="Skip files in folders larger than this many bytes (0 for no limit).",
+        min=0,
+    ),
+    skip_generated: bool = typer.Option(
+        True,
+        "--skip-generated/--keep-generated",
+        help="Skip generated files in folders (e.g. *_pb2.py, or files with a 'DO NOT EDIT' or '@generated' comment).",
+    ),
     batch: bool = typer.Option(
         False, "--batch/--no-batch", "-b", help="Send each node as a separate request."
     ),
+    stream: bool = typer.Option(
+        False,
+        "--stream/--no-stream",
+        help="Stream the responses and collect docstrings as they arrive.",
+    ),
+    planner: str = typer.Option(
+        "ffd",
+        "--planner",
+        help="How nodes are packed into requests: ffd (first-fit-decreasing, fewest requests) or greedy (source order).",
+        callback=_get_planner_callback,
+    ),
+    optimize: str = typer.Option(
+        "tokens",
+        "--optimize",
+        help="Minimise the tokens sent (fewest requests) or the latency (split files into parallel requests, resending the background).",
+        callback=_get_optimize_callback,
+    ),
+    cross_file: bool = typer.Option(
+        False,
+        "--cross-file/--per-file",
+        help="Pack the nodes of different files into shared requests (fewer requests for many small files).",
+    ),
+    max_concurrency: int = typer.Option(
+        32,
+        "--max-concurrency",
+        help="Maximum number of requests in flight. The actual limit adapts to throttling and latency.",
+        min=1,
+    ),
+    cpu_workers: Optional[int] = typer.Option(
+        None,
+        "--cpu-workers",
+        help="Worker processes that load, format, parse and plan files while requests are in flight. 0 does it in the main process. Defaults to the number of CPUs (at most one per file).",
+        min=0,
+    ),
     model: str = typer.Option(
         None,
         "--model",
@@ -114,44 +292,196 @@ async def docs(
         help="The model to use for generating the docstrings.",
         callback=_get_model_callback,
     ),
+    cache: bool = typer.Option(
+        True,
+        "--cache/--no-cache",
+        help="Reuse cached responses for unchanged requests.",
+    ),
+    cache_dir: Optional[Path] = typer.Option(
+        None,
+        "--cache-dir",
+        help="Path to the response cache. Defaults to the write-the app directory.",
+        file_okay=False,
+    ),
+    cache_only: bool = typer.Option(
+        False,
+        "--cache-only",
+        help="Only use cached responses (offline mode).",
+    ),
+    pool_size: int = typer.Option(
+        100,
+        "--pool-size",
+        help="Maximum number of open connections to the API.",
+        min=1,
+    ),
+    keep_alive: float = typer.Option(
+        30,
+        "--keep-alive",
+        help="Seconds to keep idle connections to the API open.",
+        min=0,
+    ),
+    rpm: Optional[int] = typer.Option(
+        None,
+        "--rpm",
+        help="Maximum requests per minute. Defaults to the rate_limits in the config.",
+        min=1,
+    ),
+    tpm: Optional[int] = typer.Option(
+        None,
+        "--tpm",
+        help="Maximum tokens per minute. Defaults to the rate_limits in the config.",
+        min=1,
+    ),
 ):
     """
     Document your code with AI.
     """
-    files = []
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+    from write_the.clients import client_session
+    from write_the.concurrency import get_limiter
+    from write_the.manifest import Manifest
+    from write_the.tokenizer import save_tokenizers, set_tokenizer_cache_dir
+    from write_the.workers import cpu_pool, get_cpu_workers
+    from .progress import RequestStatsColumn
+    from .tasks import async_cli_groups_task, async_cli_pipeline_task, report_skipped
+
+    llm_cache = _get_cache(cache, cache_dir, cache_only)
+    _set_rate_limits(model, rpm, tpm)
+    if llm_cache:
+        set_tokenizer_cache_dir(llm_cache.cache_dir)
+    get_limiter().set_maximum(max_concurrency)
     for f in file:
-        if f.is_dir():
-            files.extend(list_python_files(f))
+        if not f.is_dir() and f.suffix != ".py":
+            raise typer.BadParameter("File must be a .py file or a directory.")
+    progress = None
+    found_skipped = []
+
+    def on_skip(path: Path, reason: str):
+        # files skipped while the folders are walked, reported once the progress display is up
+        if progress is None:
+            found_skipped.append((path, reason))
         else:
-            if f.suffix != ".py":
-                raise typer.BadParameter("File must be a .py file or a directory.")
-            files.append(f)
-    with Progress(
+            report_skipped(progress, [path], f" - {reason.capitalize()}, skipping file...")
+
+    files = discover_python_files(
+        file,
+        include=include or (),
+        exclude=exclude or (),
+        gitignore=gitignore,
+        max_size=max_size or None,
+        skip_generated=skip_generated,
+        on_skip=on_skip,
+    )
+    # only the files (and below, the nodes) touched by the changes
+    changed_lines = _get_changed_lines(since, staged, file)
+    if changed_lines is not None:
+        files = (f for f in files if f.resolve() in changed_lines)
+    # the folders are walked as the pipeline has room for more files (files without
+    # nodes to document are skipped by the plan stage before libcst parses them),
+    # only enough files are counted to share out the requests and worker processes
+    count, files = count_up_to(
+        files, max(max_concurrency, cpu_workers or os.cpu_count() or 1) + 1
+    )
+    print_status = count > 1
+    workers = get_cpu_workers(cpu_workers, count)
+    # the hashes of saved nodes are recorded for later --changed-only runs
+    manifest = Manifest() if changed_only or record_manifest else None
+    with cpu_pool(workers) as executor, Progress(
         SpinnerColumn(),
         TextColumn("{task.description}"),
+        RequestStatsColumn(),
         transient=True,
         auto_refresh=True,
     ) as progress:
-        tasks = []
-        print_status = len(files) > 1
-        for file in files:
-            tasks.append(
-                async_cli_task(
-                    file,
-                    nodes=nodes,
-                    force=force,
-                    update=update,
-                    save=save,
-                    context=context,
-                    background=background,
-                    pretty=pretty,
-                    batch=batch,
-                    print_status=print_status,
-                    progress=progress,
-                    model=model,
-                )
+        progress.add_task(description="", total=None, stats=True)
+        for path, reason in found_skipped:
+            on_skip(path, reason)
+        options = dict(
+            nodes=nodes,
+            force=force,
+            update=update,
+            save=save,
+            context=context,
+            background=background,
+            pretty=pretty,
+            batch=batch,
+            print_status=print_status,
+            progress=progress,
+            model=model,
+            cache=llm_cache,
+            stream=stream,
+            planner=planner,
+            optimize=optimize,
+            background_level=background_level,
+            background_budget=background_budget,
+            minify=minify,
+            executor=executor,
+            manifest=manifest,
+            changed_only=changed_only,
+            changed_lines=changed_lines,
+        )
+        if cross_file and count > 1:
+            # bounded groups of files are packed into shared requests, several groups
+            # are parsed and planned at once
+            task = async_cli_groups_task(
+                group_files(files, CROSS_FILE_GROUP_FILES, CROSS_FILE_GROUP_BYTES),
+                cpu_workers=max(1, workers),
+                concurrency=max_concurrency,
+                **options,
+            )
+        else:
+            # files stream through bounded stages rather than all being loaded at once
+            task = async_cli_pipeline_task(
+                files,
+                concurrency=max(1, max_concurrency // max(1, count)),
+                cpu_workers=max(1, workers),
+                request_workers=max_concurrency,
+                **options,
             )
-        await gather(*tasks)
+        try:
+            async with client_session(pool_size=pool_size, keep_alive=keep_alive):
+                await task
+        finally:
+            # keep what was saved even if the run is interrupted
+            if save and manifest is not None and manifest.files:
+                manifest.save()
+    save_tokenizers()
+
+
+@app.command()
+def warmup(
+    encodings: List[str] = typer.Option(
+        None,
+        "--encoding",
+        "-e",
+        help="The tokenizer encodings to cache (e.g. cl100k_base). Defaults to the encodings of the supported models.",
+    ),
+    source: Optional[Path] = typer.Option(
+        None,
+        "--source",
+        help="Copy `<encoding>.tiktoken` files from this folder instead of downloading them.",
+        exists=True,
+        file_okay=False,
+    ),
+):
+    """
+    Cache the tokenizer files so write-the can run without network access.
+    """
+    from write_the.tokenizer import get_model_encoding_name, warmup as warmup_encodings
+
+    if not encodings:
+        encodings = sorted({get_model_encoding_name(m) for m in models})
+    failed = False
+    for encoding in encodings:
+        try:
+            path = warmup_encodings([encoding], source=source)[encoding]
+        except Exception as e:
+            failed = True
+            typer.secho(f"❌ {encoding}: {e}", fg="red")
+        else:
+            typer.secho(f"✅ {encoding}: {path}", fg="green")
+    if failed:
+        raise typer.Exit(1)
 
 
 @app.command()
@@ -170,11 +500,29 @@ def mkdocs(
         "-o",
         help="Path to save output (docs/ and yaml). Defaults to current directory.",
     ),
+    include: List[str] = typer.Option(
+        None,
+        "--include",
+        help="Only add the modules matching these gitignore-style patterns (relative to the code folder), e.g. 'api/**'.",
+    ),
+    exclude: List[str] = typer.Option(
+        None,
+        "--exclude",
+        help="Skip the modules and folders matching these gitignore-style patterns (relative to the code folder), e.g. 'migrations/'. Environments, caches and build folders are always skipped.",
+    ),
 ):
     """
     Generate a mkdocs website for a project including the API reference.
     """
-    write_the_mkdocs(code_dir=code_dir, readme=readme, out_dir=out_dir)
+    from write_the.commands import write_the_mkdocs
+
+    write_the_mkdocs(
+        code_dir=code_dir,
+        readme=readme,
+        out_dir=out_dir,
+        include=include or (),
+        exclude=exclude or (),
+    )
 
 
 @app.async_command()
@@ -207,6 +555,53 @@ async def tests(
         "-e",
         help="Save empty files if a test creation fails. This will prevent write-the from regenerating failed test creations.",
     ),
+    minify: bool = typer.Option(
+        False,
+        "--minify/--no-minify",
+        help="Strip comments, blank lines and long strings from the code sent (docstrings are kept).",
+    ),
+    since: Optional[str] = typer.Option(
+        None,
+        "--since",
+        help="Only write tests for the files changed since a git commit, branch or tag (e.g. origin/main).",
+    ),
+    staged: bool = typer.Option(
+        False,
+        "--staged",
+        help="Only write tests for the files with staged changes (e.g. in a pre-commit hook).",
+    ),
+    include: List[str] = typer.Option(
+        None,
+        "--include",
+        help="Only write tests for the files in the folder matching these gitignore-style patterns, e.g. 'api/**'.",
+    ),
+    exclude: List[str] = typer.Option(
+        None,
+        "--exclude",
+        help="Skip the files and folders matching these gitignore-style patterns (relative to the folder), e.g. 'migrations/'. Environments, caches and build folders are always skipped.",
+    ),
+    gitignore: bool = typer.Option(
+        True,
+        "--gitignore/--no-gitignore",
+        help="Skip the files and folders ignored by git.",
+    ),
+    max_size: int = typer.Option(
+        DEFAULT_MAX_SIZE,
+        "--max-size",
+        help="Skip files in the folder larger than this many bytes (0 for no limit).",
+        min=0,
+    ),
+    skip_generated: bool = typer.Option(
+        True,
+        "--skip-generated/--keep-generated",
+        help="Skip generated files in the folder (e.g. *_pb2.py, or files with a 'DO NOT EDIT' or '@generated' comment).",
+    ),
+    cpu_workers: Optional[int] = typer.Option(
+        None,
+        "--cpu-workers",
+        help="Worker processes that load and format files and the generated tests. 0 does it in the main process. Defaults to the number of CPUs (at most one per file).",
+        min=0,
+    ),
     model: str = typer.Option(
         None,
         "--model",
@@ -214,64 +609,137 @@ async def tests(
         help="The model to use for generating the tests.",
         callback=_get_model_callback,
     ),
+    cache: bool = typer.Option(
+        True,
+        "--cache/--no-cache",
+        help="Reuse cached responses for unchanged requests.",
+    ),
+    cache_dir: Optional[Path] = typer.Option(
+        None,
+        "--cache-dir",
+        help="Path to the response cache. Defaults to the write-the app directory.",
+        file_okay=False,
+    ),
+    cache_only: bool = typer.Option(
+        False,
+        "--cache-only",
+        help="Only use cached responses (offline mode).",
+    ),
+    pool_size: int = typer.Option(
+        100,
+        "--pool-size",
+        help="Maximum number of open connections to the API.",
+        min=1,
+    ),
+    keep_alive: float = typer.Option(
+        30,
+        "--keep-alive",
+        help="Seconds to keep idle connections to the API open.",
+        min=0,
+    ),
+    rpm: Optional[int] = typer.Option(
+        None,
+        "--rpm",
+        help="Maximum requests per minute. Defaults to the rate_limits in the config.",
+        min=1,
+    ),
+    tpm: Optional[int] = typer.Option(
+        None,
+        "--tpm",
+        help="Maximum tokens per minute. Defaults to the rate_limits in the config.",
+        min=1,
+    ),
 ):
     """
     Generate tests for your code.
     """
+    from black import InvalidInput
+    from rich.console import Console
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+    from rich.syntax import Syntax
+    from write_the.clients import client_session
+    from write_the.errors import CacheMissError, WorkerError
+    from write_the.commands import write_the_tests
+    from write_the.workers import cpu_pool, get_cpu_workers
+
+    llm_cache = _get_cache(cache, cache_dir, cache_only)
+    _set_rate_limits(model, rpm, tpm)
     current_tests = list_python_files(tests_dir)
-    if file.is_dir():
-        files = list_python_files(file)
-    else:
-        if file.suffix != ".py":
-            raise typer.BadParameter("File must be a .py file or a directory.")
-        files = [file]
-    for file in files:
-        if file.stem.startswith("_"):
-            continue
-        parts = list(file.parts[1:-1])
-        parts = ["test"] + parts
-        test_file = f"{'_'.join(parts)}_{file.stem}.py"
-        if group:
-            parts.append(test_file)
-            test_file = Path(os.path.join(*parts))
-        test_file_path = tests_dir / test_file
-        if (
-            test_file_path.exists()
-            and (not force and save)
-            or (test_file in current_tests)
-        ):
-            continue
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            transient=True,
-        ) as progress:
-            failed = False
-            progress.add_task(description=f"{file}", total=None)
-            try:
-                result = await write_the_tests(file, model=model)
-            except InvalidInput:
-                failed = True
-                result = ""
-            progress.stop()
-            if len(files) > 1 or save or failed:
-                icon = "❌" if failed else "✅"
-                colour = "red" if failed else "green"
-                typer.secho(f"{icon} {file}", fg=colour)
-            if failed and not empty:
-                continue
-            if save:
-                # create test file
-                tests_dir.mkdir(exist_ok=True)
-                test_file_path.parent.mkdir(exist_ok=True, parents=True)
-                with open(test_file_path, "w") as f:
-                    f.writelines(result)
-            elif pretty:
-                syntax = Syntax(result, "python")
-                console = Console()
-                console.print(syntax)
-            else:
-                typer.echo(result)
+    if not file.is_dir() and file.suffix != ".py":
+        raise typer.BadParameter("File must be a .py file or a directory.")
+
+    def on_skip(path: Path, reason: str):
+        typer.secho(f"⏭️ {path} - {reason.capitalize()}, skipping file...", fg="yellow")
+
+    files = discover_python_files(
+        [file],
+        include=include or (),
+        exclude=exclude or (),
+        gitignore=gitignore,
+        max_size=max_size or None,
+        skip_generated=skip_generated,
+        on_skip=on_skip,
+    )
+    changed_lines = _get_changed_lines(since, staged, [file])
+    if changed_lines is not None:
+        files = (f for f in files if f.resolve() in changed_lines)
+    # the folder is walked as the files are processed
+    count, files = count_up_to(files, (cpu_workers or os.cpu_count() or 1) + 1)
+    with cpu_pool(get_cpu_workers(cpu_workers, count)) as executor:
+        async with client_session(pool_size=pool_size, keep_alive=keep_alive):
+            for file in files:
+                if file.stem.startswith("_"):
+                    continue
+                parts = list(file.parts[1:-1])
+                parts = ["test"] + parts
+                test_file = f"{'_'.join(parts)}_{file.stem}.py"
+                if group:
+                    parts.append(test_file)
+                    test_file = Path(os.path.join(*parts))
+                test_file_path = tests_dir / test_file
+                if (
+                    test_file_path.exists()
+                    and (not force and save)
+                    or (test_file in current_tests)
+                ):
+                    continue
+                with Progress(
+                    SpinnerColumn(),
+                    TextColumn("[progress.description]{task.description}"),
+                    transient=True,
+                ) as progress:
+                    failed = False
+                    progress.add_task(description=f"{file}", total=None)
+                    try:
+                        result = await write_the_tests(
+                            file,
+                            model=model,
+                            cache=llm_cache,
+                            minify=minify,
+                            executor=executor,
+                        )
+                    except (InvalidInput, CacheMissError, WorkerError):
+                        failed = True
+                        result = ""
+                    progress.stop()
+                    if count > 1 or save or failed:
+                        icon = "❌" if failed else "✅"
+                        colour = "red" if failed else "green"
+                        typer.secho(f"{icon} {file}", fg=colour)
+                    if failed and not empty:
+                        continue
+                    if save:
+                        # create test file
+                        tests_dir.mkdir(exist_ok=True)
+                        test_file_path.parent.mkdir(exist_ok=True, parents=True)
+                        with open(test_file_path, "w") as f:
+                            f.writelines(result)
+                    elif pretty:
+                        syntax = Syntax(result, "python")
+                        console = Console()
+                        console.print(syntax)
+                    else:
+                        typer.echo(result)
 
 
 @app.async_command()
@@ -307,10 +775,60 @@ async def convert(
         help="The model to use for generating the tests.",
         callback=_get_model_callback,
     ),
+    cache: bool = typer.Option(
+        True,
+        "--cache/--no-cache",
+        help="Reuse cached responses for unchanged requests.",
+    ),
+    cache_dir: Optional[Path] = typer.Option(
+        None,
+        "--cache-dir",
+        help="Path to the response cache. Defaults to the write-the app directory.",
+        file_okay=False,
+    ),
+    cache_only: bool = typer.Option(
+        False,
+        "--cache-only",
+        help="Only use cached responses (offline mode).",
+    ),
+    pool_size: int = typer.Option(
+        100,
+        "--pool-size",
+        help="Maximum number of open connections to the API.",
+        min=1,
+    ),
+    keep_alive: float = typer.Option(
+        30,
+        "--keep-alive",
+        help="Seconds to keep idle connections to the API open.",
+        min=0,
+    ),
+    rpm: Optional[int] = typer.Option(
+        None,
+        "--rpm",
+        help="Maximum requests per minute. Defaults to the rate_limits in the config.",
+        min=1,
+    ),
+    tpm: Optional[int] = typer.Option(
+        None,
+        "--tpm",
+        help="Maximum tokens per minute. Defaults to the rate_limits in the config.",
+        min=1,
+    ),
 ):
     """
     Convert input file to a different format.
     """
+    from black import InvalidInput
+    from rich.console import Console
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+    from rich.syntax import Syntax
+    from write_the.clients import client_session
+    from write_the.errors import CacheMissError
+    from write_the.commands import write_the_converters
+
+    llm_cache = _get_cache(cache, cache_dir, cache_only)
+    _set_rate_limits(model, rpm, tpm)
     if not force and (out_file and out_file.exists()):
         typer.secho("Output file exists!", fg="red")
         return typer.Exit(1)
@@ -329,13 +847,15 @@ async def convert(
         failed = False
         progress.add_task(description=f"converting {in_file.name} to {output_format}", total=None)
         try:
-            result = await write_the_converters(
-                in_file,
-                input_format=input_format,
-                output_format=output_format,
-                model=model
-            )
-        except InvalidInput:
+            async with client_session(pool_size=pool_size, keep_alive=keep_alive):
+                result = await write_the_converters(
+                    in_file,
+                    input_format=input_format,
+                    output_format=output_format,
+                    model=model,
+                    cache=llm_cache,
+                )
+        except (InvalidInput, CacheMissError):
             failed = True
             result = ""
         progress.stop()
@@ -13,6 +13,16 @@ def get_config_path():
             json.dump({}, f)
     return config_path
 
+def get_cache_dir():
+    APP_NAME = "write-the"
+    app_dir = typer.get_app_dir(APP_NAME)
+    return Path(app_dir) / "cache"
+
+def get_tiktoken_dir():
+    APP_NAME = "write-the"
+    app_dir = typer.get_app_dir(APP_NAME)
+    return Path(app_dir) / "tiktoken"
+
 def get_default_model():
     config_path = get_config_path()
     try:
@@ -32,4 +42,14 @@ def set_default_model(model: str):
         pass
     config["default_model"] = model
     with open(config_path, "w") as f:
-        json.dump(config, f)
\ No newline at end of file
+        json.dump(config, f)
+
+def get_rate_limits(model: str):
+    config_path = get_config_path()
+    try:
+        with open(config_path, "r") as f:
+            config = json.load(f)
+        limits = config["rate_limits"][model]
+        return limits.get("rpm"), limits.get("tpm")
+    except Exception:
+        return None, None
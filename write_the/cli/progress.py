@@ -0,0 +1,32 @@
+from rich.progress import ProgressColumn, Task
+from rich.text import Text
+from write_the.concurrency import get_limiter
+from write_the.scheduler import get_scheduler
+
+
+class RequestStatsColumn(ProgressColumn):
+    """
+    A progress column that shows the state of the concurrency limiter and request scheduler on the stats task.
+    """
+
+    def render(self, task: Task) -> Text:
+        """
+        Renders the concurrency window, throughput and queue depth for the stats task.
+
+        Args:
+          task (Task): The task to render.
+
+        Returns:
+          Text: The request stats if `task` is the stats task, otherwise empty text.
+        """
+        if not task.fields.get("stats"):
+            return Text("")
+        limiter = get_limiter()
+        scheduler = get_scheduler()
+        return Text(
+            f"window: {limiter.window:.1f} | "
+            f"in flight: {limiter.in_flight} | "
+            f"{limiter.throughput:.2f} req/s | "
+            f"queued: {scheduler.queue_depth} (peak {scheduler.max_queue_depth})",
+            style="dim",
+        )
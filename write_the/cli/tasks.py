@@ -1,11 +1,26 @@
-from write_the.commands import write_the_docs
-from write_the.errors import FileSkippedError
-from write_the.utils import create_tree, format_source_code, load_source_code
+from write_the.commands.docs import (
+    DocsPlan,
+    apply_docs_for_path,
+    plan_docs_for_path,
+    request_docstrings,
+    write_the_docs_for_paths,
+)
+from write_the.cache import LLMCache
+from write_the.errors import CacheMissError, FileSkippedError, WorkerError
+from write_the.git import LineRange
+from write_the.manifest import Manifest, hash_nodes
+from write_the.pipeline import Stage, run_pipeline
+from write_the.workers import run_in_worker
 from rich.syntax import Syntax
-from rich.progress import Progress
-from typing import List
+from rich.progress import Progress, TaskID
+from asyncio import CancelledError, gather
+from typing import Dict, Iterable, List, Optional, Tuple
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from openai.error import InvalidRequestError
+from black import InvalidInput
+from libcst import ParserSyntaxError
 
 
 async def async_cli_task(
@@ -21,6 +36,18 @@ async def async_cli_task(
     print_status: bool,
     progress: Progress,
     model: str = "gpt-3.5-turbo-instruct",
+    cache: Optional[LLMCache] = None,
+    stream: bool = False,
+    planner: str = "ffd",
+    optimize: str = "tokens",
+    concurrency: int = 1,
+    background_level: Optional[str] = None,
+    background_budget: Optional[int] = None,
+    minify: bool = False,
+    executor: Optional[ProcessPoolExecutor] = None,
+    manifest: Optional[Manifest] = None,
+    changed_only: bool = False,
+    changed_lines: Optional[Dict[Path, List[LineRange]]] = None,
 ) -> None:
     """
     Executes a task asynchronously.
@@ -38,55 +65,371 @@ async def async_cli_task(
       print_status (bool): Whether to print the status.
       progress (Progress): The progress object.
       model (str, optional): The model to use for the task. Defaults to "gpt-3.5-turbo-instruct".
+      cache (Optional[LLMCache], optional): The cache of LLM responses to use. Defaults to None.
+      stream (bool, optional): Whether to stream the responses and show docstrings as they arrive. Defaults to False.
+      planner (str, optional): The batch planning strategy. Defaults to "ffd".
+      optimize (str, optional): Whether to minimise the "tokens" sent or the "latency" of the file. Defaults to "tokens".
+      concurrency (int, optional): The number of requests available to the file. Defaults to 1.
+      background_level (Optional[str], optional): How much of the rest of the file to send. Defaults to the level of background and context.
+      background_budget (Optional[int], optional): The maximum number of background tokens per request. Defaults to None.
+      minify (bool, optional): Whether to minify the code sent and report the tokens saved. Defaults to False.
+      executor (Optional[ProcessPoolExecutor], optional): The pool that loads, parses and plans the file. Defaults to None, doing it on the event loop.
+      manifest (Optional[Manifest], optional): The manifest the hashes of the saved nodes are recorded in. Defaults to None.
+      changed_only (bool, optional): Whether to only document the nodes whose code or docstring changed since they were recorded in the manifest. Defaults to False.
+      changed_lines (Optional[Dict[Path, List[LineRange]]], optional): The ranges of lines changed in each file, keyed by resolved path (see `changed_lines`), to only document the nodes containing them. Defaults to None.
 
     Returns:
       None
 
     Side Effects:
       Writes to the file if save is True.
-      Prints the pass/fail status if print_status is True.
+      Prints the pass/fail status (with the number of requests and how full they were) if print_status is True or nodes were shrunk to fit.
       Pretty prints the result if pretty is True.
 
     Examples:
       >>> await async_cli_task(file, nodes, update, force, save, context, background, pretty, batch, print_status, progress)
       None
     """
-    task_id = progress.add_task(description=f"{file}", total=None)
-    failed = False
-    skipped = False
-    source_code = load_source_code(file=file)
-    if pretty:
-        source_code = format_source_code(source_code)
-    tree = create_tree(source_code)
-    max_batch_size = None
-    msg = ""
-    if batch:
-        max_batch_size = 1
+    await async_cli_pipeline_task(
+        [file],
+        nodes=nodes,
+        update=update,
+        force=force,
+        save=save,
+        context=context,
+        background=background,
+        pretty=pretty,
+        batch=batch,
+        print_status=print_status,
+        progress=progress,
+        model=model,
+        cache=cache,
+        stream=stream,
+        planner=planner,
+        optimize=optimize,
+        concurrency=concurrency,
+        background_level=background_level,
+        background_budget=background_budget,
+        minify=minify,
+        executor=executor,
+        manifest=manifest,
+        changed_only=changed_only,
+        changed_lines=changed_lines,
+    )
+
+
+@dataclass
+class _FileJob:
+    """
+    A file going through the stages of `async_cli_pipeline_task`.
+    """
+
+    file: Path
+    task_id: TaskID
+    plan: Optional[DocsPlan] = None
+    docstrings: Optional[dict] = None
+    result: Optional[str] = None
+    hashes: Optional[dict] = None
+    msg: str = ""
+    shrunk: bool = False
+    failed: bool = False
+    skipped: bool = False
+
+    def record(self, error: Exception) -> None:
+        self.msg = f" - {error}"
+        if isinstance(error, FileSkippedError):
+            self.skipped = True
+        else:
+            self.failed = True
+        # nothing else is done with the file
+        self.plan = self.docstrings = None
+
+
+# the errors that fail a file without stopping the other files
+_FILE_ERRORS = (
+    ValueError,
+    InvalidRequestError,
+    CacheMissError,
+    FileSkippedError,
+    WorkerError,
+    # files black or libcst can't parse
+    InvalidInput,
+    ParserSyntaxError,
+)
+
+
+async def async_cli_pipeline_task(
+    files: Iterable[Path],
+    nodes: List,
+    update: bool,
+    force: bool,
+    save: bool,
+    context: bool,
+    background: bool,
+    pretty: bool,
+    batch: bool,
+    print_status: bool,
+    progress: Progress,
+    model: str = "gpt-3.5-turbo-instruct",
+    cache: Optional[LLMCache] = None,
+    stream: bool = False,
+    planner: str = "ffd",
+    optimize: str = "tokens",
+    concurrency: int = 1,
+    background_level: Optional[str] = None,
+    background_budget: Optional[int] = None,
+    minify: bool = False,
+    executor: Optional[ProcessPoolExecutor] = None,
+    manifest: Optional[Manifest] = None,
+    changed_only: bool = False,
+    changed_lines: Optional[Dict[Path, List[LineRange]]] = None,
+    cpu_workers: int = 1,
+    request_workers: int = 1,
+) -> None:
+    """
+    Executes a task for each file in a pipeline, so only a bounded number of files is in memory at once.
+
+    Args:
+      files (Iterable[Path]): The files to process, consumed as the pipeline has room for them.
+      nodes (List): The nodes to process in each file.
+      update (bool): Whether to update the task.
+      force (bool): Whether to force the task.
+      save (bool): Whether to save the task.
+      context (bool): Whether to include context.
+      background (bool): Whether to run the task in the background.
+      pretty (bool): Whether to format the output.
+      batch (bool): Whether to run in batch mode.
+      print_status (bool): Whether to print the status.
+      progress (Progress): The progress object.
+      model (str, optional): The model to use for the task. Defaults to "gpt-3.5-turbo-instruct".
+      cache (Optional[LLMCache], optional): The cache of LLM responses to use. Defaults to None.
+      stream (bool, optional): Whether to stream the responses and show docstrings as they arrive. Defaults to False.
+      planner (str, optional): The batch planning strategy. Defaults to "ffd".
+      optimize (str, optional): Whether to minimise the "tokens" sent or the "latency" of each file. Defaults to "tokens".
+      concurrency (int, optional): The number of requests available to each file. Defaults to 1.
+      background_level (Optional[str], optional): How much of the rest of each file to send. Defaults to the level of background and context.
+      background_budget (Optional[int], optional): The maximum number of background tokens per request. Defaults to None.
+      minify (bool, optional): Whether to minify the code sent and report the tokens saved. Defaults to False.
+      executor (Optional[ProcessPoolExecutor], optional): The pool that loads, parses and plans the files. Defaults to None, doing it on the event loop.
+      manifest (Optional[Manifest], optional): The manifest the hashes of the saved nodes are recorded in. Defaults to None.
+      changed_only (bool, optional): Whether to only document the nodes whose code or docstring changed since they were recorded in the manifest. Defaults to False.
+      changed_lines (Optional[Dict[Path, List[LineRange]]], optional): The ranges of lines changed in each file, keyed by resolved path (see `changed_lines`), to only document the nodes containing them. Defaults to None.
+      cpu_workers (int, optional): The number of files planned (and the number of files docstrings are added to) at the same time. Defaults to 1.
+      request_workers (int, optional): The number of files whose requests are in flight at the same time. Defaults to 1.
+
+    Returns:
+      None
+
+    Side Effects:
+      Writes to the files if save is True.
+      Prints the pass/fail status of each file if print_status is True or nodes were shrunk to fit.
+      Pretty prints the results if pretty is True.
+
+    Notes:
+      Files go through the stages plan (read, format, parse and plan the batches), request, apply
+      (add the docstrings) and report (print or write the result). The queue in front of each
+      stage is bounded, so a slow stage holds up the stages before it instead of files piling up.
+    """
+    planning = dict(
+        context=context,
+        background=background,
+        max_batch_size=1 if batch else None,
+        planner=planner,
+        optimize=optimize,
+        concurrency=concurrency,
+        background_level=background_level,
+        background_budget=background_budget,
+        minify=minify,
+    )
+
+    async def plan(file: Path) -> _FileJob:
+        job = _FileJob(file, progress.add_task(description=f"{file}", total=None))
+        try:
+            job.plan = await plan_docs_for_path(
+                file,
+                node_names=nodes,
+                update=update,
+                force=force,
+                save=save,
+                pretty=pretty,
+                model=model,
+                cache=cache,
+                executor=executor,
+                recorded=manifest.get(file) if manifest and changed_only else None,
+                lines=(
+                    None if changed_lines is None else changed_lines.get(file.resolve(), [])
+                ),
+                **planning,
+            )
+        except _FILE_ERRORS as e:
+            job.record(e)
+        else:
+            job.msg, job.shrunk = _describe_batches(job.plan.batches)
+            progress.update(job.task_id, description=f"{file}{job.msg}")
+        return job
+
+    async def request(job: _FileJob) -> _FileJob:
+        if job.plan is None:
+            return job
+        received = []
+
+        def on_docstring(name, docstring):
+            received.append(name)
+            progress.update(
+                job.task_id, description=f"{job.file} - {len(received)} documented ({name})"
+            )
+
+        job.docstrings = {}
+        try:
+            await request_docstrings(
+                job.plan.llm, job.plan.batches, stream, on_docstring, job.docstrings
+            )
+        except _FILE_ERRORS as e:
+            job.record(e)
+        except CancelledError:
+            if job.docstrings:
+                # in this process, the pool may be shutting down too
+                result = await apply_docs_for_path(job.plan, job.docstrings)
+                progress.remove_task(job.task_id)
+                _report_cancelled(
+                    progress, job.file, result, len(job.docstrings), save, pretty, manifest
+                )
+            raise
+        else:
+            # the batches aren't needed once their docstrings are in
+            job.plan.batches = []
+        return job
+
+    async def apply(job: _FileJob) -> _FileJob:
+        if job.plan is None:
+            return job
+        try:
+            job.result = await apply_docs_for_path(job.plan, job.docstrings, executor)
+        except _FILE_ERRORS as e:
+            job.record(e)
+        else:
+            if save and manifest is not None:
+                job.hashes = await _hash_nodes(executor, job.result)
+        job.plan = job.docstrings = None
+        return job
+
+    async def report(job: _FileJob) -> None:
+        progress.remove_task(job.task_id)
+        progress.refresh()
+        _report(
+            progress,
+            job.file,
+            job.result,
+            job.msg,
+            job.failed,
+            job.skipped,
+            save,
+            pretty,
+            print_status or job.shrunk,
+        )
+        if job.hashes is not None:
+            # only once the file is written
+            manifest.record(job.file, job.hashes)
+
+    await run_pipeline(
+        files,
+        [
+            Stage(plan, workers=cpu_workers),
+            Stage(request, workers=request_workers),
+            Stage(apply, workers=cpu_workers),
+            Stage(report),
+        ],
+    )
+
+
+async def _hash_nodes(
+    executor: Optional[ProcessPoolExecutor], source_code: str
+) -> Optional[dict]:
     try:
-        result = await write_the_docs(
-            tree,
-            node_names=nodes,
-            update=update,
-            force=force,
-            save=save,
-            context=context,
-            background=background,
-            pretty=pretty,
-            max_batch_size=max_batch_size,
-            model=model,
+        return await run_in_worker(executor, hash_nodes, source_code)
+    except WorkerError:
+        # the file is still written, it just isn't recorded in the manifest
+        return None
+
+
+def _describe_batches(batches) -> Tuple[str, bool]:
+    fill = sum(b.fill for b in batches) / len(batches)
+    msg = f" - {len(batches)} request{'s' if len(batches) > 1 else ''} ({fill:.0%} full)"
+    shrunk = [
+        f"{n.name} ({n.shrunk})"
+        for b in batches
+        for n in b.nodes
+        if getattr(n, "shrunk", None)
+    ]
+    saved = [getattr(b, "saved_tokens", 0) for b in batches]
+    if any(saved):
+        msg += f" - minified: saved {sum(saved)} tokens ({sum(saved) // len(saved)} per request)"
+    if shrunk:
+        msg += f" - shrunk to fit: {', '.join(shrunk)}"
+    return msg, bool(shrunk)
+
+
+def _report_cancelled(
+    progress: Progress,
+    file: Path,
+    result: str,
+    received: int,
+    save: bool,
+    pretty: bool,
+    manifest: Optional[Manifest],
+) -> None:
+    # keeps the docstrings received before the run was cancelled
+    _report(
+        progress,
+        file,
+        result,
+        f" - Cancelled, kept {received} docstring{'s' if received > 1 else ''}",
+        failed=False,
+        skipped=False,
+        save=save,
+        pretty=pretty,
+        print_status=True,
+    )
+    if save and manifest is not None:
+        manifest.record(file, hash_nodes(result))
+
+
+def report_skipped(
+    progress: Progress, files: List[Path], msg: str = " - No nodes found, skipping file..."
+) -> None:
+    """
+    Reports files that were skipped before being processed.
+
+    Args:
+      progress (Progress): The progress object.
+      files (List[Path]): The skipped files.
+      msg (str, optional): Why the files were skipped. Defaults to " - No nodes found, skipping file...".
+    """
+    for file in files:
+        _report(
+            progress,
+            file,
+            None,
+            msg,
+            failed=False,
+            skipped=True,
+            save=False,
+            pretty=False,
+            print_status=True,
         )
-    except ValueError as e:
-        msg = f" - {e}"
-        failed = True
-    except InvalidRequestError as e:
-        msg = f" - {e}"
-        failed = True
-    except FileSkippedError as e:
-        msg = f" - {e}"
-        skipped = True
-    
-    progress.remove_task(task_id)
-    progress.refresh()
+
+
+def _report(
+    progress: Progress,
+    file: Path,
+    result: Optional[str],
+    msg: str,
+    failed: bool,
+    skipped: bool,
+    save: bool,
+    pretty: bool,
+    print_status: bool,
+) -> None:
     if print_status or save or failed or skipped:
         if skipped:
             icon = "⏭️"
@@ -112,3 +455,214 @@ async def async_cli_task(
         progress.print(syntax)
     else:
         progress.print(result, highlight=False, markup=False)
+
+
+async def async_cli_files_task(
+    files: List[Path],
+    nodes: List,
+    update: bool,
+    force: bool,
+    save: bool,
+    context: bool,
+    background: bool,
+    pretty: bool,
+    batch: bool,
+    print_status: bool,
+    progress: Progress,
+    model: str = "gpt-3.5-turbo-instruct",
+    cache: Optional[LLMCache] = None,
+    stream: bool = False,
+    planner: str = "ffd",
+    optimize: str = "tokens",
+    concurrency: int = 1,
+    background_level: Optional[str] = None,
+    background_budget: Optional[int] = None,
+    minify: bool = False,
+    executor: Optional[ProcessPoolExecutor] = None,
+    manifest: Optional[Manifest] = None,
+    changed_only: bool = False,
+    changed_lines: Optional[Dict[Path, List[LineRange]]] = None,
+) -> None:
+    """
+    Executes a task for several files asynchronously, packing their nodes into shared requests.
+
+    Args:
+      files (List[Path]): The files to process.
+      nodes (List): The nodes to process in each file.
+      update (bool): Whether to update the task.
+      force (bool): Whether to force the task.
+      save (bool): Whether to save the task.
+      context (bool): Whether to include context.
+      background (bool): Whether to send the background of each file.
+      pretty (bool): Whether to format the output.
+      batch (bool): Whether to run in batch mode.
+      print_status (bool): Whether to print the status.
+      progress (Progress): The progress object.
+      model (str, optional): The model to use for the task. Defaults to "gpt-3.5-turbo-instruct".
+      cache (Optional[LLMCache], optional): The cache of LLM responses to use. Defaults to None.
+      stream (bool, optional): Whether to stream the responses and show docstrings as they arrive. Defaults to False.
+      planner (str, optional): The batch planning strategy. Defaults to "ffd".
+      optimize (str, optional): Whether to minimise the "tokens" sent or the "latency". Defaults to "tokens".
+      concurrency (int, optional): The number of requests available. Defaults to 1.
+      background_level (Optional[str], optional): How much of the rest of each file to send. Defaults to the level of background and context.
+      background_budget (Optional[int], optional): The maximum number of background tokens of a file per request. Defaults to None.
+      minify (bool, optional): Whether to minify the code sent and report the tokens saved. Defaults to False.
+      executor (Optional[ProcessPoolExecutor], optional): The pool that loads, parses and plans the files. Defaults to None, doing it on the event loop.
+      manifest (Optional[Manifest], optional): The manifest the hashes of the saved nodes are recorded in. Defaults to None.
+      changed_only (bool, optional): Whether to only document the nodes whose code or docstring changed since they were recorded in the manifest. Defaults to False.
+      changed_lines (Optional[Dict[Path, List[LineRange]]], optional): The ranges of lines changed in each file, keyed by resolved path (see `changed_lines`), to only document the nodes containing them. Defaults to None.
+
+    Returns:
+      None
+
+    Side Effects:
+      Writes to the files if save is True.
+      Prints the number of requests shared by the files and the pass/fail status of each file if print_status is True.
+      Pretty prints the results if pretty is True.
+    """
+    description = f"{len(files)} files"
+    task_id = progress.add_task(description=description, total=None)
+    failed = False
+    skipped = False
+    msg = ""
+    shrunk = False
+    received = []
+    failed_files = {}
+
+    def on_docstring(name, docstring):
+        received.append(name)
+        progress.update(task_id, description=f"{description} - {len(received)} documented ({name})")
+
+    def on_batches(batches):
+        nonlocal msg, shrunk
+        msg, shrunk = _describe_batches(batches)
+        progress.update(task_id, description=f"{description}{msg}")
+
+    def on_cancelled(partial_results, docstrings):
+        progress.remove_task(task_id)
+        for key, result in partial_results.items():
+            _report_cancelled(
+                progress, Path(key), result, len(docstrings[key]), save, pretty, manifest
+            )
+
+    results = {}
+    try:
+        results = await write_the_docs_for_paths(
+            files,
+            node_names=nodes,
+            update=update,
+            force=force,
+            save=save,
+            context=context,
+            background=background,
+            pretty=pretty,
+            max_batch_size=1 if batch else None,
+            model=model,
+            cache=cache,
+            stream=stream,
+            on_docstring=on_docstring,
+            planner=planner,
+            on_batches=on_batches,
+            optimize=optimize,
+            concurrency=concurrency,
+            background_level=background_level,
+            background_budget=background_budget,
+            minify=minify,
+            executor=executor,
+            recorded=(
+                {file.as_posix(): manifest.get(file) for file in files}
+                if manifest and changed_only
+                else None
+            ),
+            lines=(
+                {file.as_posix(): changed_lines.get(file.resolve(), []) for file in files}
+                if changed_lines is not None
+                else None
+            ),
+            on_cancelled=on_cancelled,
+            on_failed=failed_files.__setitem__,
+        )
+    except (
+        ValueError,
+        InvalidRequestError,
+        CacheMissError,
+        WorkerError,
+        InvalidInput,
+        ParserSyntaxError,
+    ) as e:
+        msg = f" - {e}"
+        failed = True
+    except FileSkippedError as e:
+        msg = f" - {e}"
+        skipped = True
+
+    hashes = {}
+    if save and manifest is not None and results:
+        keys = list(results)
+        hashed = await gather(*[_hash_nodes(executor, results[key]) for key in keys])
+        hashes = {key: h for key, h in zip(keys, hashed) if h is not None}
+
+    progress.remove_task(task_id)
+    progress.refresh()
+    if (print_status or shrunk) and not (failed or skipped) and results:
+        progress.print(f"{description}{msg}", style="bold")
+    for file in files:
+        result = results.get(file.as_posix())
+        if file.as_posix() in failed_files:
+            # the other files were still documented
+            _report(
+                progress,
+                file,
+                None,
+                f" - {failed_files[file.as_posix()]}",
+                failed=True,
+                skipped=False,
+                save=save,
+                pretty=pretty,
+                print_status=print_status,
+            )
+            continue
+        if failed or skipped:
+            file_msg = msg
+        elif result is None:
+            file_msg = " - No nodes found, skipping file..."
+        else:
+            file_msg = ""
+        _report(
+            progress,
+            file,
+            result,
+            file_msg,
+            failed,
+            skipped or (not failed and result is None),
+            save,
+            pretty,
+            print_status,
+        )
+        if file.as_posix() in hashes:
+            manifest.record(file, hashes[file.as_posix()])
+
+
+async def async_cli_groups_task(
+    groups: Iterable[List[Path]], cpu_workers: int = 1, **options
+) -> None:
+    """
+    Executes `async_cli_files_task` for groups of files, a bounded number of groups at a time.
+
+    Args:
+      groups (Iterable[List[Path]]): The groups of files whose nodes share requests (see `group_files`), consumed as the pipeline has room for them.
+      cpu_workers (int, optional): The number of groups in flight, each planned in its own worker process. Defaults to 1.
+      **options: The options of `async_cli_files_task`.
+
+    Returns:
+      None
+
+    Notes:
+      Only the trees of the groups in flight are held in memory, and the groups are parsed in
+      parallel, rather than the whole run being parsed and planned by one worker.
+    """
+
+    async def document(group: List[Path]) -> None:
+        await async_cli_files_task(group, **options)
+
+    await run_pipeline(groups, [Stage(document, workers=cpu_workers)])
@@ -0,0 +1,75 @@
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
+
+import aiohttp
+import openai
+from langchain.chat_models import ChatOpenAI
+from langchain.llms import OpenAI
+from langchain.schema.language_model import BaseLanguageModel
+
+_clients: Dict[Tuple[str, float], BaseLanguageModel] = {}
+
+
+def get_client(model_name: str, temperature: float = 0) -> BaseLanguageModel:
+    """
+    Gets the shared client for a model, creating it on first use.
+
+    Args:
+      model_name (str): The name of the model.
+      temperature (float, optional): The sampling temperature. Defaults to 0.
+
+    Returns:
+      BaseLanguageModel: The client for the model.
+
+    Notes:
+      The clients don't retry failed requests, retries are handled by the concurrency limiter.
+
+    Examples:
+      >>> get_client("gpt-4") is get_client("gpt-4")
+      True
+    """
+    key = (model_name, temperature)
+    if key not in _clients:
+        if "-instruct" in model_name:
+            _clients[key] = OpenAI(
+                temperature=temperature,
+                max_tokens=-1,
+                model_name=model_name,
+                max_retries=1,
+            )
+        else:
+            _clients[key] = ChatOpenAI(
+                temperature=temperature, model_name=model_name, max_retries=1
+            )
+    return _clients[key]
+
+
+def clear_clients() -> None:
+    """
+    Removes all the shared clients.
+    """
+    _clients.clear()
+
+
+@asynccontextmanager
+async def client_session(pool_size: int = 100, keep_alive: float = 30):
+    """
+    Keeps one pooled HTTP session open for every OpenAI request made inside the context.
+
+    Args:
+      pool_size (int, optional): The maximum number of open connections. Defaults to 100.
+      keep_alive (float, optional): Seconds to keep idle connections open. Defaults to 30.
+
+    Yields:
+      aiohttp.ClientSession: The shared session.
+
+    Notes:
+      Tasks created inside the context (e.g. with `asyncio.gather`) inherit the session.
+    """
+    connector = aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=keep_alive)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        token = openai.aiosession.set(session)
+        try:
+            yield session
+        finally:
+            openai.aiosession.reset(token)
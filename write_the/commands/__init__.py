@@ -1,4 +1,21 @@
-from .converters import write_the_converters
-from .docs import write_the_docs
-from .mkdocs import write_the_mkdocs
-from .tests import write_the_tests
+from importlib import import_module
+
+# The commands are imported on first use so the CLI doesn't load langchain,
+# openai and libcst for commands that don't need them.
+_commands = {
+    "write_the_converters": ".converters",
+    "write_the_docs": ".docs",
+    "write_the_docs_for_files": ".docs",
+    "write_the_docs_for_path": ".docs",
+    "write_the_docs_for_paths": ".docs",
+    "write_the_mkdocs": ".mkdocs",
+    "write_the_tests": ".tests",
+}
+
+__all__ = list(_commands)
+
+
+def __getattr__(name):
+    if name in _commands:
+        return getattr(import_module(_commands[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
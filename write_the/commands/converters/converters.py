@@ -3,7 +3,7 @@ from .prompts import write_converters_for_file_prompt
 from write_the.llm import LLM
 
 
-async def write_the_converters(filename: Path, input_format: str, output_format: str, model: str = "gpt-3.5-turbo-instruct") -> str:
+async def write_the_converters(filename: Path, input_format: str, output_format: str, model: str = "gpt-3.5-turbo-instruct", cache=None) -> str:
     """
     Formats and runs the tests for a given file.
 
@@ -12,6 +12,7 @@ async def write_the_converters(filename: Path, input_format: str, output_format:
       input_format (str): The input format of the file.
       output_format (str): The format to convert the file to.
       model (str, optional): The model to use for conversion. Defaults to "gpt-3.5-turbo-instruct".
+      cache (LLMCache, optional): The cache of LLM responses to use. Defaults to None.
 
     Returns:
       str: The converted output.
@@ -23,7 +24,7 @@ async def write_the_converters(filename: Path, input_format: str, output_format:
     with open(filename, "r") as file:
         source_text = file.read()
 
-    llm = LLM(write_converters_for_file_prompt, model_name=model)
+    llm = LLM(write_converters_for_file_prompt, model_name=model, cache=cache)
     result = await llm.run(code=source_text, input_format=input_format, output_format=output_format)
 
     formatted_text = result.strip()
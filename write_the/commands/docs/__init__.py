@@ -1 +1,10 @@
-from .docs import write_the_docs
+from .docs import (
+    DocsPlan,
+    apply_docs_for_path,
+    plan_docs_for_path,
+    request_docstrings,
+    write_the_docs,
+    write_the_docs_for_files,
+    write_the_docs_for_path,
+    write_the_docs_for_paths,
+)
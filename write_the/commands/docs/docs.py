@@ -1,16 +1,102 @@
 import asyncio
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, List
 import libcst as cst
-from black import format_str, FileMode
-
-from write_the.cst import nodes_to_tree
-from write_the.cst.docstring_adder import add_docstrings_to_tree
-from write_the.cst.function_and_class_collector import get_node_names
-from write_the.cst.node_extractor import extract_nodes_from_tree
-from write_the.cst.node_batcher import create_batches
-from write_the.commands.docs.utils import extract_block
-from write_the.errors import FileSkippedError
+
+from write_the.cst.node_batcher import LatencyModel, NodeBatch, split_qualified_name
+from write_the.commands.docs.utils import BlockStreamParser, extract_block
+from write_the.concurrency import is_context_length_error
 from write_the.llm import LLM
-from .prompts import write_docstrings_for_nodes_prompt, update_docstrings_for_nodes_prompt
+from write_the.scheduler import get_scheduler
+from write_the.stages import (
+    apply_docstrings,
+    apply_docstrings_to_source,
+    plan_cross_file_docs,
+    plan_docs,
+    plan_docs_for_file,
+    plan_docs_for_files,
+)
+from write_the.workers import run_in_worker
+from .prompts import (
+    write_docstrings_for_nodes_prompt,
+    update_docstrings_for_nodes_prompt,
+    write_docstrings_for_files_prompt,
+    update_docstrings_for_files_prompt,
+)
+
+
+async def stream_batch(llm: LLM, batch: NodeBatch, on_docstring) -> dict:
+    """
+    Streams the docstrings for a batch, handing each one over as soon as it is complete.
+
+    Args:
+      llm (LLM): The LLM to request the docstrings from.
+      batch (NodeBatch): The batch of nodes to document.
+      on_docstring (Callable[[str, str], None]): Called with the node name and docstring of each completed docstring.
+
+    Returns:
+      dict: The docstrings for the nodes in the batch, keyed by node name.
+    """
+    parser = BlockStreamParser(batch.node_names)
+    docstrings = {}
+    async for chunk in llm.stream(
+        code=batch.code, nodes=batch.node_names, tokens=batch.tokens
+    ):
+        for name, docstring in parser.feed(chunk).items():
+            docstrings[name] = docstring
+            on_docstring(name, docstring)
+    for name, docstring in parser.close().items():
+        docstrings[name] = docstring
+        on_docstring(name, docstring)
+    return docstrings
+
+
+async def run_batch(llm: LLM, batch: NodeBatch, on_docstring=None) -> dict:
+    """
+    Requests the docstrings for a batch, splitting it if it overflows the context window.
+
+    Args:
+      llm (LLM): The LLM to request the docstrings from.
+      batch (NodeBatch): The batch of nodes to document.
+      on_docstring (Callable[[str, str], None], optional): Stream the response and call this with the node name and docstring of each completed docstring. Defaults to None.
+
+    Returns:
+      dict: The docstrings for the nodes in the batch, keyed by node name.
+
+    Raises:
+      InvalidRequestError: If a batch with a single node overflows the context window.
+
+    Notes:
+      A batch that overflows the context window is bisected and both halves are requested concurrently.
+      When streaming, the nodes already received aren't requested again.
+      Transient errors are retried by the LLM (see `AdaptiveConcurrencyLimiter.retry_delay`).
+    """
+    docstrings = {}
+
+    def receive(name, docstring):
+        docstrings[name] = docstring
+        on_docstring(name, docstring)
+
+    try:
+        if on_docstring is None:
+            result = await llm.run(
+                code=batch.code, nodes=batch.node_names, tokens=batch.tokens
+            )
+            return extract_block(result, batch.node_names)
+        await stream_batch(llm, batch, receive)
+        return docstrings
+    except Exception as e:
+        if not is_context_length_error(e) or len(batch.nodes) < 2:
+            raise
+    batch = replace(batch, nodes=[n for n in batch.nodes if n.name not in docstrings])
+    if not batch.nodes:
+        return docstrings
+    batches = batch.split() if len(batch.nodes) > 1 else [batch]
+    results = await asyncio.gather(*[run_batch(llm, b, on_docstring) for b in batches])
+    for result in results:
+        docstrings.update(result)
+    return docstrings
 
 
 async def write_the_docs(
@@ -24,6 +110,16 @@ async def write_the_docs(
     pretty=False,
     max_batch_size=False,
     model="gpt-3.5-turbo-instruct",
+    cache=None,
+    stream=False,
+    on_docstring=None,
+    planner="ffd",
+    on_batches=None,
+    optimize="tokens",
+    concurrency=1,
+    background_level=None,
+    background_budget=None,
+    minify=False,
 ) -> str:
     """
     Generates docstrings for a given tree of nodes using a specified model.
@@ -39,6 +135,16 @@ async def write_the_docs(
       pretty (bool, optional): Whether to format the code. Defaults to False.
       max_batch_size (bool, optional): Max number of nodes in each batch. Defaults to False.
       model (str, optional): The model to use for the generation. Defaults to "gpt-3.5-turbo-instruct".
+      cache (LLMCache, optional): The cache of LLM responses to use. Defaults to None.
+      stream (bool, optional): Whether to stream the responses and collect docstrings as they arrive. Defaults to False.
+      on_docstring (Callable[[str, str], None], optional): Called with the node name and docstring of each docstring as it arrives when streaming. Defaults to None.
+      planner (str, optional): The batch planning strategy ("greedy" or "ffd"). Defaults to "ffd".
+      on_batches (Callable[[List[NodeBatch]], None], optional): Called with the planned batches before they are requested. Defaults to None.
+      optimize (str, optional): Whether to minimise the "tokens" sent or the "latency" of the file. Defaults to "tokens".
+      concurrency (int, optional): The number of requests available to this file, used to optimise latency. Defaults to 1.
+      background_level (str, optional): How much of the rest of the file to send ("none", "imports", "module", "signatures" or "full"). Defaults to the level of `background` and `context`.
+      background_budget (int, optional): The maximum number of background tokens per request, lower levels are used until it fits. Defaults to None.
+      minify (bool, optional): Whether to minify the code sent (strip comments, collapse whitespace, shorten strings and drop the docstrings of other nodes). Defaults to False.
 
     Returns:
       str: The source code with the generated docstrings.
@@ -61,48 +167,513 @@ async def write_the_docs(
           \"\"\"
           return a + b"
     """
-    extract_specific_nodes = False
-    if node_names:
-        extract_specific_nodes = True
-        force = True
-    else:
-        node_names = get_node_names(tree, force=force, update=update)
-    if not node_names:
-        raise FileSkippedError("No nodes found, skipping file...")
-    if update:
-        remove_docstrings = False
-        llm = LLM(update_docstrings_for_nodes_prompt, model_name=model)
+    extract_specific_nodes = bool(node_names)
+    llm, latency_model = _create_llm(update, model, cache)
+    node_names, batches = plan_docs(
+        tree,
+        max_tokens=llm.max_tokens,
+        prompt_size=llm.prompt_size,
+        node_names=node_names,
+        update=update,
+        force=force,
+        context=context,
+        background=background,
+        max_batch_size=max_batch_size,
+        model=model,
+        planner=planner,
+        optimize=optimize,
+        concurrency=concurrency,
+        latency_model=latency_model,
+        background_level=background_level,
+        background_budget=background_budget,
+        minify=minify,
+    )
+    if on_batches:
+        on_batches(batches)
+    docstring_dict = await request_docstrings(llm, batches, stream, on_docstring)
+    return apply_docstrings(
+        tree,
+        docstring_dict,
+        node_names,
+        extract_specific_nodes=extract_specific_nodes,
+        save=save,
+        force=force or extract_specific_nodes,
+        update=update,
+        pretty=pretty,
+    )
+
+
+def _create_llm(update: bool, model: str, cache, cross_file: bool = False):
+    if cross_file:
+        prompt = (
+            update_docstrings_for_files_prompt
+            if update
+            else write_docstrings_for_files_prompt
+        )
     else:
-        remove_docstrings = True
-        llm = LLM(write_docstrings_for_nodes_prompt, model_name=model)
+        prompt = (
+            update_docstrings_for_nodes_prompt
+            if update
+            else write_docstrings_for_nodes_prompt
+        )
+    llm = LLM(prompt, model_name=model, cache=cache)
+    rpm, tpm = get_scheduler().get_limits(model)
+    return llm, LatencyModel(requests_per_minute=rpm, tokens_per_minute=tpm)
 
-    batches = create_batches(
-        tree=tree,
-        node_names=node_names,
+
+async def request_docstrings(
+    llm: LLM, batches, stream=False, on_docstring=None, received=None
+) -> dict:
+    """
+    Requests the docstrings for every batch concurrently.
+
+    Args:
+      llm (LLM): The LLM to request the docstrings from.
+      batches (List[NodeBatch]): The batches to request.
+      stream (bool, optional): Whether to stream the responses. Defaults to False.
+      on_docstring (Callable[[str, str], None], optional): Called with the node name and docstring of each docstring as it arrives when streaming. Defaults to None.
+      received (dict, optional): The dict the docstrings are added to as they arrive. Defaults to a new dict.
+
+    Returns:
+      dict: The docstrings, keyed by node name.
+
+    Notes:
+      Docstrings are added to `received` as soon as they are complete (when streaming) or
+      their batch is (otherwise), so a caller that is cancelled still holds them.
+    """
+    docstring_dict = {} if received is None else received
+
+    def receive(name, docstring):
+        docstring_dict[name] = docstring
+        if on_docstring:
+            on_docstring(name, docstring)
+
+    async def request(batch):
+        if stream:
+            await run_batch(llm, batch, on_docstring=receive)
+        else:
+            docstring_dict.update(await run_batch(llm, batch))
+
+    await asyncio.gather(*[request(batch) for batch in batches])
+    return docstring_dict
+
+
+async def write_the_docs_for_files(
+    trees: Dict[str, cst.Module],
+    node_names=[],
+    update=False,
+    force=False,
+    save=False,
+    context=False,
+    background=True,
+    pretty=False,
+    max_batch_size=False,
+    model="gpt-3.5-turbo-instruct",
+    cache=None,
+    stream=False,
+    on_docstring=None,
+    planner="ffd",
+    on_batches=None,
+    optimize="tokens",
+    concurrency=1,
+    background_level=None,
+    background_budget=None,
+    minify=False,
+) -> Dict[str, str]:
+    """
+    Generates docstrings for several trees, packing the nodes of different files into shared requests.
+
+    Args:
+      trees (Dict[str, cst.Module]): The trees to write docs for, keyed by file (e.g. its path).
+      node_names (list, optional): The list of nodes names to write docs for in each file that has them. Defaults to an empty list.
+      update (bool, optional): Whether to update existing docstrings. Defaults to False.
+      force (bool, optional): Whether to force writing of docs. Defaults to False.
+      save (bool, optional): Whether to save the docs. Defaults to False.
+      context (bool, optional): Whether to include context nodes. Defaults to False.
+      background (bool, optional): Whether to send the background of each file. Defaults to True.
+      pretty (bool, optional): Whether to format the code. Defaults to False.
+      max_batch_size (bool, optional): Max number of nodes in each batch. Defaults to False.
+      model (str, optional): The model to use for the generation. Defaults to "gpt-3.5-turbo-instruct".
+      cache (LLMCache, optional): The cache of LLM responses to use. Defaults to None.
+      stream (bool, optional): Whether to stream the responses. Defaults to False.
+      on_docstring (Callable[[str, str], None], optional): Called with the file-qualified node name and docstring of each docstring as it arrives when streaming. Defaults to None.
+      planner (str, optional): The batch planning strategy ("greedy" or "ffd"). Defaults to "ffd".
+      on_batches (Callable[[List[CrossFileBatch]], None], optional): Called with the planned batches before they are requested. Defaults to None.
+      optimize (str, optional): Whether to minimise the "tokens" sent or the "latency". Defaults to "tokens".
+      concurrency (int, optional): The number of requests available, used to optimise latency. Defaults to 1.
+      background_level (str, optional): How much of the rest of each file to send ("none", "imports", "module", "signatures" or "full"). Defaults to the level of `background` and `context`.
+      background_budget (int, optional): The maximum number of background tokens of a file per request. Defaults to None.
+      minify (bool, optional): Whether to minify the code sent. Defaults to False.
+
+    Returns:
+      Dict[str, str]: The source code with the generated docstrings of each file with nodes to document. Files that failed aren't included.
+
+    Raises:
+      FileSkippedError: If no nodes are found in any of the files and none of them failed.
+
+    Notes:
+      Nodes are named `<file>::<node>` in the requests and the docstrings are routed back to the tree of each file.
+      Token budgets are enforced per request, counting the background of each file in a request once.
+    """
+    extract_specific_nodes = bool(node_names)
+    llm, latency_model = _create_llm(update, model, cache, cross_file=True)
+    names, batches = plan_cross_file_docs(
+        trees,
         max_tokens=llm.max_tokens,
         prompt_size=llm.prompt_size,
-        response_size_per_node=250,  # a guess... TODO: smarter
+        node_names=node_names,
+        update=update,
+        force=force,
+        context=context,
+        background=background,
         max_batch_size=max_batch_size,
-        send_background_context=background,
-        send_node_context=context,
-        remove_docstrings=remove_docstrings
+        model=model,
+        planner=planner,
+        optimize=optimize,
+        concurrency=concurrency,
+        latency_model=latency_model,
+        background_level=background_level,
+        background_budget=background_budget,
+        minify=minify,
+    )
+    if on_batches:
+        on_batches(batches)
+    docstrings_per_file = await _request_docstrings_per_file(
+        llm, batches, names, stream, on_docstring
+    )
+    return {
+        key: apply_docstrings(
+            trees[key],
+            docstrings_per_file[key],
+            names[key],
+            extract_specific_nodes=extract_specific_nodes,
+            save=save,
+            force=force or extract_specific_nodes,
+            update=update,
+            pretty=pretty,
+        )
+        for key in names
+    }
+
+
+async def _request_docstrings_per_file(
+    llm: LLM, batches, names, stream=False, on_docstring=None, received=None
+) -> Dict[str, Dict[str, str]]:
+    docstring_dict = await request_docstrings(
+        llm, batches, stream, on_docstring, received
+    )
+    return _split_per_file(docstring_dict, names)
+
+
+def _split_per_file(docstring_dict: dict, names) -> Dict[str, Dict[str, str]]:
+    docstrings_per_file = {key: {} for key in names}
+    for qualified_name, docstring in docstring_dict.items():
+        key, name = split_qualified_name(qualified_name)
+        docstrings_per_file[key][name] = docstring
+    return docstrings_per_file
+
+
+async def write_the_docs_for_path(
+    file: Path,
+    node_names=[],
+    update=False,
+    force=False,
+    save=False,
+    pretty=False,
+    model="gpt-3.5-turbo-instruct",
+    cache=None,
+    stream=False,
+    on_docstring=None,
+    on_batches=None,
+    executor=None,
+    **options,
+) -> str:
+    """
+    Generates docstrings for a file, loading, parsing and planning it in a worker process.
+
+    Args:
+      file (Path): The file to write docs for.
+      node_names (list, optional): The list of nodes names to write docs for. Defaults to an empty list.
+      update (bool, optional): Whether to update existing docstrings. Defaults to False.
+      force (bool, optional): Whether to force writing of docs. Defaults to False.
+      save (bool, optional): Whether to save the docs. Defaults to False.
+      pretty (bool, optional): Whether to format the code. Defaults to False.
+      model (str, optional): The model to use for the generation. Defaults to "gpt-3.5-turbo-instruct".
+      cache (LLMCache, optional): The cache of LLM responses to use. Defaults to None.
+      stream (bool, optional): Whether to stream the responses. Defaults to False.
+      on_docstring (Callable[[str, str], None], optional): Called with the node name and docstring of each docstring as it arrives when streaming. Defaults to None.
+      on_batches (Callable[[List[NodeBatch]], None], optional): Called with the planned batches before they are requested. Defaults to None.
+      executor (ProcessPoolExecutor, optional): The pool that runs the CPU-bound stages. Defaults to None, running them in this process.
+      **options: The planning options of `write_the_docs` (context, background, max_batch_size, planner, optimize, concurrency, background_level, background_budget and minify) and the `recorded` hashes and changed `lines` of `plan_docs_for_path`.
+
+    Returns:
+      str: The source code with the generated docstrings.
+
+    Raises:
+      FileSkippedError: If no nodes are found.
+
+    Notes:
+      Only the path, the source code, the docstrings and the released batches cross process
+      boundaries, so the event loop is free to send requests while files are parsed.
+    """
+    plan = await plan_docs_for_path(
+        file,
+        node_names=node_names,
+        update=update,
+        force=force,
+        save=save,
+        pretty=pretty,
+        model=model,
+        cache=cache,
+        executor=executor,
+        **options,
+    )
+    if on_batches:
+        on_batches(plan.batches)
+    docstring_dict = await request_docstrings(plan.llm, plan.batches, stream, on_docstring)
+    return await apply_docs_for_path(plan, docstring_dict, executor=executor)
+
+
+@dataclass
+class DocsPlan:
+    """
+    The planned requests for the docstrings of a file.
+
+    Args:
+      llm (LLM): The LLM to request the docstrings from.
+      source_code (str): The (formatted) source code of the file.
+      node_names (List[str]): The names of the nodes to document.
+      batches (List[NodeBatch]): The batches to request.
+      extract_specific_nodes (bool): Whether only the given nodes are rendered when not saving.
+      save (bool): Whether the docs are saved to the file.
+      force (bool): Whether existing docstrings are replaced.
+      update (bool): Whether existing docstrings are updated.
+      pretty (bool): Whether the code is formatted.
+    """
+
+    llm: LLM
+    source_code: str
+    node_names: List[str]
+    batches: List[NodeBatch]
+    extract_specific_nodes: bool = False
+    save: bool = False
+    force: bool = False
+    update: bool = False
+    pretty: bool = False
+
+
+async def plan_docs_for_path(
+    file: Path,
+    node_names=[],
+    update=False,
+    force=False,
+    save=False,
+    pretty=False,
+    model="gpt-3.5-turbo-instruct",
+    cache=None,
+    executor=None,
+    recorded=None,
+    lines=None,
+    **options,
+) -> DocsPlan:
+    """
+    Loads, parses and plans the requests for a file in a worker process (the first step of `write_the_docs_for_path`).
+
+    Args:
+      file (Path): The file to write docs for.
+      node_names (list, optional): The list of nodes names to write docs for. Defaults to an empty list.
+      update (bool, optional): Whether to update existing docstrings. Defaults to False.
+      force (bool, optional): Whether to force writing of docs. Defaults to False.
+      save (bool, optional): Whether to save the docs. Defaults to False.
+      pretty (bool, optional): Whether to format the code. Defaults to False.
+      model (str, optional): The model to use for the generation. Defaults to "gpt-3.5-turbo-instruct".
+      cache (LLMCache, optional): The cache of LLM responses to use. Defaults to None.
+      executor (ProcessPoolExecutor, optional): The pool that runs the CPU-bound stages. Defaults to None, running them in this process.
+      recorded (Dict[str, NodeHash], optional): The hashes recorded in the manifest for the file, to only document the nodes that changed since. Defaults to None.
+      lines (List[Tuple[int, int]], optional): The ranges of lines changed in the file (see `changed_lines`), to only document the nodes containing them. Defaults to None.
+      **options: The planning options of `write_the_docs`.
+
+    Returns:
+      DocsPlan: The plan, holding the source code and released batches but no tree.
+
+    Raises:
+      FileSkippedError: If no nodes are found.
+    """
+    llm, latency_model = _create_llm(update, model, cache)
+    source_code, planned_names, batches = await run_in_worker(
+        executor,
+        plan_docs_for_file,
+        file,
+        pretty=pretty,
+        max_tokens=llm.max_tokens,
+        prompt_size=llm.prompt_size,
+        node_names=node_names,
+        update=update,
+        force=force,
+        model=model,
+        latency_model=latency_model,
+        recorded=recorded,
+        lines=lines,
+        **options,
+    )
+    return DocsPlan(
+        llm=llm,
+        source_code=source_code,
+        node_names=planned_names,
+        batches=batches,
+        extract_specific_nodes=bool(node_names),
+        save=save,
+        force=force or bool(node_names),
+        update=update,
+        pretty=pretty,
+    )
+
+
+async def apply_docs_for_path(plan: DocsPlan, docstrings: dict, executor=None) -> str:
+    """
+    Adds the docstrings received for a plan to its source code in a worker process (the last step of `write_the_docs_for_path`).
+
+    Args:
+      plan (DocsPlan): The plan of the file.
+      docstrings (dict): The docstrings, keyed by node name.
+      executor (ProcessPoolExecutor, optional): The pool that runs the CPU-bound stages. Defaults to None, running them in this process.
+
+    Returns:
+      str: The source code with the generated docstrings.
+    """
+    return await run_in_worker(
+        executor,
+        apply_docstrings_to_source,
+        plan.source_code,
+        docstrings,
+        plan.node_names,
+        extract_specific_nodes=plan.extract_specific_nodes,
+        save=plan.save,
+        force=plan.force,
+        update=plan.update,
+        pretty=plan.pretty,
+    )
+
+
+async def write_the_docs_for_paths(
+    files: List[Path],
+    node_names=[],
+    update=False,
+    force=False,
+    save=False,
+    pretty=False,
+    model="gpt-3.5-turbo-instruct",
+    cache=None,
+    stream=False,
+    on_docstring=None,
+    on_batches=None,
+    executor=None,
+    recorded=None,
+    lines=None,
+    on_cancelled=None,
+    on_failed=None,
+    **options,
+) -> Dict[str, str]:
+    """
+    Generates docstrings for several files in shared requests, planning them in a worker process.
+
+    Args:
+      files (List[Path]): The files to write docs for, keyed by their POSIX path in the results.
+      node_names (list, optional): The list of nodes names to write docs for in each file that has them. Defaults to an empty list.
+      update (bool, optional): Whether to update existing docstrings. Defaults to False.
+      force (bool, optional): Whether to force writing of docs. Defaults to False.
+      save (bool, optional): Whether to save the docs. Defaults to False.
+      pretty (bool, optional): Whether to format the code. Defaults to False.
+      model (str, optional): The model to use for the generation. Defaults to "gpt-3.5-turbo-instruct".
+      cache (LLMCache, optional): The cache of LLM responses to use. Defaults to None.
+      stream (bool, optional): Whether to stream the responses. Defaults to False.
+      on_docstring (Callable[[str, str], None], optional): Called with the file-qualified node name and docstring of each docstring as it arrives when streaming. Defaults to None.
+      on_batches (Callable[[List[CrossFileBatch]], None], optional): Called with the planned batches before they are requested. Defaults to None.
+      executor (ProcessPoolExecutor, optional): The pool that runs the CPU-bound stages. Defaults to None, running them in this process.
+      recorded (Dict[str, Dict[str, NodeHash]], optional): The hashes recorded in the manifest for each file, keyed by POSIX path, to only document the nodes that changed since. Defaults to None.
+      lines (Dict[str, List[Tuple[int, int]]], optional): The ranges of lines changed in each file (see `changed_lines`), keyed by POSIX path, to only document the nodes containing them. Defaults to None.
+      on_cancelled (Callable[[Dict[str, str], Dict[str, dict]], None], optional): Called, if the requests are cancelled, with the source code with the docstrings received so far and those docstrings, of each file that has any, before the cancellation is raised. Defaults to None.
+      on_failed (Callable[[str, str], None], optional): Called with the POSIX path and the error of each file that couldn't be read, formatted or parsed, before the other files are requested. Defaults to None.
+      **options: The planning options of `write_the_docs_for_files`.
+
+    Returns:
+      Dict[str, str]: The source code with the generated docstrings of each file with nodes to document. Files that failed aren't included.
+
+    Raises:
+      FileSkippedError: If no nodes are found in any of the files and none of them failed.
+
+    Notes:
+      The files are planned together in one worker, the docstrings are added to each file in parallel.
+    """
+    extract_specific_nodes = bool(node_names)
+    llm, latency_model = _create_llm(update, model, cache, cross_file=True)
+    sources, names, batches, failed = await run_in_worker(
+        executor,
+        plan_docs_for_files,
+        files,
+        pretty=pretty,
+        max_tokens=llm.max_tokens,
+        prompt_size=llm.prompt_size,
+        node_names=node_names,
+        update=update,
+        force=force,
+        model=model,
+        latency_model=latency_model,
+        recorded=recorded,
+        lines=lines,
+        **options,
+    )
+    if on_failed:
+        for key, error in failed.items():
+            on_failed(key, error)
+    if not batches:
+        # every file with nodes failed
+        return {}
+    if on_batches:
+        on_batches(batches)
+    received = {}
+    try:
+        docstrings_per_file = await _request_docstrings_per_file(
+            llm, batches, names, stream, on_docstring, received
+        )
+    except asyncio.CancelledError:
+        if on_cancelled is not None and received:
+            received_per_file = {
+                key: docstrings
+                for key, docstrings in _split_per_file(received, names).items()
+                if docstrings
+            }
+            # in this process, the pool may be shutting down too
+            partial_results = {
+                key: apply_docstrings_to_source(
+                    sources[key],
+                    docstrings,
+                    names[key],
+                    extract_specific_nodes=extract_specific_nodes,
+                    save=save,
+                    force=force or extract_specific_nodes,
+                    update=update,
+                    pretty=pretty,
+                )
+                for key, docstrings in received_per_file.items()
+            }
+            on_cancelled(partial_results, received_per_file)
+        raise
+    results = await asyncio.gather(
+        *[
+            run_in_worker(
+                executor,
+                apply_docstrings_to_source,
+                sources[key],
+                docstrings_per_file[key],
+                names[key],
+                extract_specific_nodes=extract_specific_nodes,
+                save=save,
+                force=force or extract_specific_nodes,
+                update=update,
+                pretty=pretty,
+            )
+            for key in names
+        ]
     )
-    promises = []
-    node_names_list = []
-    for batch in batches:
-        node_names = batch.node_names
-        code = batch.code
-        promises.append((llm.run(code=code, nodes=node_names)))
-        node_names_list.append(node_names)
-    # Can i yield here so batches can be logged?
-    results = await asyncio.gather(*promises)
-    docstring_dict = {}
-    for node_names, result in zip(node_names_list, results):
-        docstring_dict.update(extract_block(result, node_names))
-    modified_tree = add_docstrings_to_tree(tree, docstring_dict, force=force or update)
-    if not save and extract_specific_nodes:
-        extracted_nodes = extract_nodes_from_tree(modified_tree, node_names)
-        modified_tree = nodes_to_tree(extracted_nodes)
-    if pretty:
-        return format_str(modified_tree.code, mode=FileMode())
-    return modified_tree.code
+    return dict(zip(names, results))
@@ -81,4 +81,77 @@ Updated docstrings for {nodes}:
 
 update_docstrings_for_nodes_prompt = PromptTemplate(
     input_variables=["code", "nodes"], template=update_docs_template
-)
\ No newline at end of file
+)
+files_docs_template = """
+Provide Google style docstrings for the given code from several files.
+Include description, parameter types, exceptions, side effects, notes, and examples.
+Return only the docstrings, with file-qualified function/class names as yaml keys.
+Use the file::name format for functions and classes and the file::Class.method format for methods.
+
+Example:
+# File: maths.py
+def add(a, b):
+  return a + b
+Formatted docstrings for maths.py::add:
+maths.py::add:
+  Sums 2 numbers.
+
+  Args:
+    a (int): The first number to add.
+    b (int): The second number to add.
+
+  Returns:
+    int: The sum of a and b.
+
+  Examples:
+    >>> add(1, 2)
+    3
+
+Code:
+{code}
+Formatted docstrings for {nodes}:
+"""
+write_docstrings_for_files_prompt = PromptTemplate(
+    input_variables=["code", "nodes"], template=files_docs_template
+)
+
+update_files_docs_template = """
+Update the Google style docstrings to match the code from several files.
+Add, update or remove description, parameter types, exceptions, side effects, notes, examples, etc. if required.
+Return only the docstrings, with file-qualified function/class names as yaml keys.
+Use the file::name format for functions and classes and the file::Class.method format for methods.
+
+Example:
+# File: maths.py
+def add(first, second, third=0):
+  \"\"\"
+  Sums 2 numbers.
+
+  Args:
+    a (int): The first number to add.
+    b (int): The second number to add.
+
+  Returns:
+    int: The sum of a and b.
+  \"\"\"
+  return first + second + third
+Updated docstrings for maths.py::add:
+maths.py::add:
+  Sums up to 3 numbers.
+
+  Args:
+    first (int): The first number to add.
+    second (int): The second number to add.
+    third (int, optional): The third number to add. Defaults to 0.
+
+  Returns:
+    int: The sum of first, second, and third.
+
+Code:
+{code}
+Updated docstrings for {nodes}:
+"""
+
+update_docstrings_for_files_prompt = PromptTemplate(
+    input_variables=["code", "nodes"], template=update_files_docs_template
+)
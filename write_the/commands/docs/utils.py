@@ -15,17 +15,77 @@ def pad_with_newline_if_needed(s):
     return s
 
 
+# a block ends where the next unindented key starts, file-qualified keys
+# (`path/to/file.py::name`) may start with a path
+NEXT_KEY = r"\n[\w./]"
+# keys can't be the end of a longer key (e.g. `add` of `Calculator.add`)
+KEY_START = r"(?<![\w./:])"
+
+
 def extract_block(text, class_function_names):
     results = {}
     for name in class_function_names:
-        pattern = rf"({name}:[\s\S]*?)(?=(\n\w|\Z))"
+        pattern = rf"({KEY_START}{re.escape(name)}:[\s\S]*?)(?=({NEXT_KEY}|\Z))"
         match = re.search(pattern, text)
         if match:
-            block = match.group(1).lstrip(f"{name}:")
+            block = match.group(1)[len(name) + 1 :]
             results[name] = pad_with_newline_if_needed(block)
     return results
 
 
+class BlockStreamParser:
+    """
+    Incrementally extracts docstring blocks from LLM output as it is streamed.
+
+    A block is complete once the next top-level key starts, the final block is
+    completed when the stream is closed.
+    """
+
+    def __init__(self, class_function_names):
+        """
+        Initializes the BlockStreamParser.
+
+        Args:
+          class_function_names (list[str]): The names of the nodes to extract docstrings for.
+        """
+        self.pending = list(class_function_names)
+        self.text = ""
+
+    def feed(self, chunk: str) -> dict:
+        """
+        Adds a chunk of streamed text and extracts any blocks that are now complete.
+
+        Args:
+          chunk (str): The next chunk of text.
+
+        Returns:
+          dict: The newly completed docstrings, keyed by node name.
+        """
+        self.text += chunk
+        if "\n" not in self.text[-len(chunk) - 1 :]:
+            return {}
+        completed = [
+            name
+            for name in self.pending
+            if re.search(rf"{KEY_START}{re.escape(name)}:[\s\S]*?{NEXT_KEY}", self.text)
+        ]
+        return self._extract(completed)
+
+    def close(self) -> dict:
+        """
+        Extracts the remaining blocks at the end of the stream.
+
+        Returns:
+          dict: The remaining docstrings, keyed by node name.
+        """
+        return self._extract(list(self.pending))
+
+    def _extract(self, names) -> dict:
+        results = extract_block(self.text, names)
+        self.pending = [name for name in self.pending if name not in results]
+        return results
+
+
 def process_nodes(tree: cst.Module, nodes, context, extract_specific_nodes) -> str:
     """
     Processes a tree of nodes.
@@ -2,13 +2,18 @@ import sys
 
 from pathlib import Path
 from collections import defaultdict
-from write_the.utils import list_python_files
+from write_the.discovery import iter_python_files
 
 from .templates import action_template, mkdocs_template
 
 
 def write_the_mkdocs(
-    code_dir: Path, readme: Path = None, out_dir: Path = Path("."), project_name=None
+    code_dir: Path,
+    readme: Path = None,
+    out_dir: Path = Path("."),
+    project_name=None,
+    include=(),
+    exclude=(),
 ):
     """
     Generates a mkdocs project from a directory of python files.
@@ -18,6 +23,8 @@ def write_the_mkdocs(
       readme (Path, optional): The readme file to include in the project. Defaults to None.
       out_dir (Path, optional): The directory to write the project to. Defaults to the current directory.
       project_name (str, optional): The name of the project. Defaults to the name of the code_dir.
+      include (Sequence[str], optional): Gitignore-style patterns of the only modules to add. Defaults to every module.
+      exclude (Sequence[str], optional): Gitignore-style patterns of modules and folders to leave out, as well as environments, caches, build folders and files ignored by git. Defaults to none.
 
     Notes:
       If readme is not provided, the project will not have a home page.
@@ -30,7 +37,10 @@ def write_the_mkdocs(
     Returns:
       None
     """
-    files = list_python_files(code_dir)
+    # large and generated modules still belong in the reference
+    files = iter_python_files(
+        code_dir, include=include, exclude=exclude, max_size=None, skip_generated=False
+    )
     groups = [path.stem for path in code_dir.glob("*") if not path.stem.startswith("_")]
 
     if not project_name:
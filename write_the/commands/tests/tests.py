@@ -1,16 +1,27 @@
 from pathlib import Path
-from black import format_str, FileMode
 from .prompts import write_tests_for_file_prompt
 from write_the.llm import LLM
+from write_the.stages import prepare_source_for_tests
+from write_the.utils import format_source_code
+from write_the.workers import run_in_worker
 
 
-async def write_the_tests(filename: Path, model="gpt-3.5-turbo-instruct") -> str:
+async def write_the_tests(
+    filename: Path,
+    model="gpt-3.5-turbo-instruct",
+    cache=None,
+    minify=False,
+    executor=None,
+) -> str:
     """
     Formats and runs the tests for a given file using a specified model.
 
     Args:
       filename (Path): The path to the file to be tested.
       model (str): The model to use for the generation. Defaults to "gpt-3.5-turbo-instruct".
+      cache (LLMCache, optional): The cache of LLM responses to use. Defaults to None.
+      minify (bool, optional): Whether to strip comments, blank lines and long strings from the code sent. Docstrings are kept. Defaults to False.
+      executor (ProcessPoolExecutor, optional): The pool that loads and formats the code. Defaults to None, doing it in this process.
 
     Returns:
       str: The formatted and tested code.
@@ -22,10 +33,10 @@ async def write_the_tests(filename: Path, model="gpt-3.5-turbo-instruct") -> str
     Note:
       This function is asynchronous and should be awaited when called.
     """
-    with open(filename, "r") as file:
-        source_code = file.read()
-    source_code = format_str(source_code, mode=FileMode())
-    llm = LLM(write_tests_for_file_prompt, model_name=model)
+    source_code = await run_in_worker(
+        executor, prepare_source_for_tests, filename, minify=minify
+    )
+    llm = LLM(write_tests_for_file_prompt, model_name=model, cache=cache)
     result = await llm.run(code=source_code, path=filename)
     code = (
         result.strip()
@@ -34,4 +45,4 @@ async def write_the_tests(filename: Path, model="gpt-3.5-turbo-instruct") -> str
         .lstrip("```")
         .rstrip("```")
     )
-    return format_str(code, mode=FileMode())
+    return await run_in_worker(executor, format_source_code, code)
@@ -0,0 +1,293 @@
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+
+from openai import error
+
+
+def is_rate_limit_error(e: BaseException) -> bool:
+    """
+    Checks if an exception was caused by the API throttling requests.
+
+    Args:
+      e (BaseException): The exception to check.
+
+    Returns:
+      bool: Whether the exception is a rate limit error.
+    """
+    return isinstance(e, error.RateLimitError)
+
+
+def is_timeout_error(e: BaseException) -> bool:
+    """
+    Checks if an exception was caused by a request timing out.
+
+    Args:
+      e (BaseException): The exception to check.
+
+    Returns:
+      bool: Whether the exception is a timeout error.
+    """
+    return isinstance(e, (error.Timeout, asyncio.TimeoutError))
+
+
+def is_context_length_error(e: BaseException) -> bool:
+    """
+    Checks if an exception was caused by a request overflowing the context window of the model.
+
+    Args:
+      e (BaseException): The exception to check.
+
+    Returns:
+      bool: Whether the exception is a context length error.
+    """
+    if not isinstance(e, error.InvalidRequestError):
+        return False
+    return e.code == "context_length_exceeded" or "maximum context length" in str(e)
+
+
+def is_transient_error(e: BaseException) -> bool:
+    """
+    Checks if an exception was caused by a temporary problem that a retry may fix.
+
+    Args:
+      e (BaseException): The exception to check.
+
+    Returns:
+      bool: Whether the exception is a transient error.
+    """
+    return (
+        is_rate_limit_error(e)
+        or is_timeout_error(e)
+        or isinstance(
+            e,
+            (error.APIError, error.APIConnectionError, error.ServiceUnavailableError),
+        )
+    )
+
+
+def get_retry_after(e: BaseException) -> Optional[float]:
+    """
+    Gets the delay requested by the `Retry-After` header of an API error.
+
+    Args:
+      e (BaseException): The exception to check.
+
+    Returns:
+      Optional[float]: The number of seconds to wait or None if the header is missing.
+    """
+    headers = getattr(e, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def backoff_delay(attempt: int, base: float = 1, cap: float = 60) -> float:
+    """
+    Gets an exponential backoff delay with full jitter.
+
+    Args:
+      attempt (int): The number of the retry, starting at 0.
+      base (float, optional): The delay of the first retry in seconds. Defaults to 1.
+      cap (float, optional): The maximum delay in seconds. Defaults to 60.
+
+    Returns:
+      float: The number of seconds to wait.
+
+    Examples:
+      >>> 0 <= backoff_delay(3, base=1, cap=60) <= 8
+      True
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of in-flight requests with an additive-increase/multiplicative-decrease window.
+
+    The window starts at its maximum, so requests go out as fast as they did without a
+    limiter until the API pushes back. It is cut multiplicatively when requests are
+    throttled or time out and grows by roughly one request per window of successful
+    requests while latency stays stable.
+    """
+
+    def __init__(
+        self,
+        initial: Optional[float] = None,
+        minimum: float = 1,
+        maximum: float = 64,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        max_retries: int = 5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initializes the AdaptiveConcurrencyLimiter.
+
+        Args:
+          initial (Optional[float], optional): The initial window size. Defaults to the maximum.
+          minimum (float, optional): The minimum window size. Defaults to 1.
+          maximum (float, optional): The maximum window size. Defaults to 64.
+          decrease (float, optional): The factor the window is multiplied by when throttled. Defaults to 0.5.
+          latency_tolerance (float, optional): How many times slower than average a request can be before the window stops growing. Defaults to 2.0.
+          max_retries (int, optional): The number of times a throttled request is retried. Defaults to 5.
+          clock (Callable[[], float], optional): The clock used to measure time. Defaults to time.monotonic.
+        """
+        self.window = maximum if initial is None else initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.max_retries = max_retries
+        self.clock = clock
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.paused_until = 0.0
+        self.throttled = False
+        self.completed = deque()
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+        return self._condition
+
+    @property
+    def throughput(self) -> float:
+        """
+        Gets the number of requests completed per second over the last minute.
+
+        Returns:
+          float: The throughput in requests per second.
+        """
+        now = self.clock()
+        while self.completed and now - self.completed[0] > 60:
+            self.completed.popleft()
+        if not self.completed:
+            return 0.0
+        return len(self.completed) / max(now - self.completed[0], 1)
+
+    def on_success(self, latency: float) -> None:
+        """
+        Grows the window if the latency of a successful request is stable.
+
+        Args:
+          latency (float): The latency of the request in seconds.
+        """
+        self.completed.append(self.clock())
+        if self.latency is None or latency <= self.latency * self.latency_tolerance:
+            self.window = min(self.maximum, self.window + 1 / self.window)
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = 0.8 * self.latency + 0.2 * latency
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        """
+        Shrinks the window after a request was throttled or timed out.
+
+        Args:
+          retry_after (Optional[float], optional): Seconds to pause all new requests for. Defaults to None.
+        """
+        self.throttled = True
+        self.window = max(self.minimum, self.window * self.decrease)
+        if retry_after:
+            self.paused_until = max(self.paused_until, self.clock() + retry_after)
+
+    def set_maximum(self, maximum: float) -> None:
+        """
+        Sets the maximum window size.
+
+        Args:
+          maximum (float): The maximum number of requests in flight.
+
+        Side Effects:
+          Opens the window up to the maximum unless requests have been throttled, otherwise only caps it.
+        """
+        self.maximum = maximum
+        if self.throttled:
+            self.window = min(self.window, maximum)
+        else:
+            self.window = maximum
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Waits for space in the window and holds it while the request runs.
+
+        Side Effects:
+          Updates the window from the outcome and latency of the request.
+        """
+        condition = self.condition
+        async with condition:
+            while True:
+                pause = self.paused_until - self.clock()
+                if pause > 0:
+                    try:
+                        await asyncio.wait_for(condition.wait(), timeout=pause)
+                    except asyncio.TimeoutError:
+                        pass
+                elif self.in_flight >= int(self.window):
+                    await condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+        start = self.clock()
+        try:
+            yield
+        except Exception as e:
+            if is_rate_limit_error(e) or is_timeout_error(e):
+                self.on_throttle(get_retry_after(e))
+            raise
+        else:
+            self.on_success(self.clock() - start)
+        finally:
+            self.in_flight -= 1
+            async with condition:
+                condition.notify_all()
+
+    def retry_delay(self, e: BaseException, attempt: int) -> Optional[float]:
+        """
+        Gets the time to wait before retrying a failed request.
+
+        Args:
+          e (BaseException): The exception raised by the request.
+          attempt (int): The number of the retry, starting at 0.
+
+        Returns:
+          Optional[float]: The number of seconds to wait or None if the request shouldn't be retried.
+
+        Notes:
+          This is the only place requests are retried. Transient errors other than throttling and
+          timeouts (e.g. a 503) are retried too, but don't shrink the window.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if not is_transient_error(e):
+            return None
+        return get_retry_after(e) or backoff_delay(attempt)
+
+
+_limiter = AdaptiveConcurrencyLimiter()
+
+
+def get_limiter() -> AdaptiveConcurrencyLimiter:
+    """
+    Gets the process-wide concurrency limiter that every LLM request goes through.
+
+    Returns:
+      AdaptiveConcurrencyLimiter: The concurrency limiter.
+    """
+    return _limiter
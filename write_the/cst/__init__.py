@@ -1,6 +1,10 @@
+from .background import BACKGROUND_LEVELS, elide_literals, keep_imports
 from .docstring_adder import DocstringAdder, has_docstring
 from .docstring_remover import DocstringRemover, remove_docstrings_from_tree
+from .file_index import FileIndex, IndexEntry
 from .function_and_class_collector import FunctionAndClassCollector, get_node_names
+from .minifier import Minifier, minify_tree
 from .node_extractor import NodeExtractor, extract_nodes_from_tree
 from .node_remover import NodeRemover, remove_nodes_from_tree
+from .node_shrinker import class_skeleton, shrink_node
 from .utils import nodes_to_tree
@@ -0,0 +1,130 @@
+from typing import Iterable, List
+import libcst as cst
+
+# how much of the file is sent with the nodes of a batch, from least to most
+BACKGROUND_LEVELS = ("none", "imports", "module", "signatures", "full")
+MAX_LITERAL_LENGTH = 200
+
+LITERAL_TYPES = (
+    cst.Dict,
+    cst.List,
+    cst.Set,
+    cst.Tuple,
+    cst.SimpleString,
+    cst.ConcatenatedString,
+    cst.FormattedString,
+)
+
+
+class LiteralElider(cst.CSTTransformer):
+    """
+    A CSTTransformer that replaces large literals assigned outside of functions with `...`.
+
+    The names (and annotations) of the assignments are kept so they can still be referenced.
+    """
+
+    def __init__(
+        self, max_length: int = MAX_LITERAL_LENGTH, keep: Iterable[str] = ()
+    ):
+        """
+        Initializes the LiteralElider.
+
+        Args:
+          max_length (int, optional): The length of the code of the longest literal that is kept. Defaults to MAX_LITERAL_LENGTH.
+          keep (Iterable[str], optional): The names of the classes whose bodies are left as they are (e.g. the nodes being documented). Defaults to none.
+        """
+        self.max_length = max_length
+        self.keep = set(keep)
+        self.classes: List[str] = []
+        self.elided = 0
+
+    def _elide(self, value: cst.BaseExpression) -> cst.BaseExpression:
+        if not isinstance(value, LITERAL_TYPES):
+            return value
+        if len(cst.Module(body=[]).code_for_node(value)) <= self.max_length:
+            return value
+        self.elided += 1
+        return cst.Ellipsis()
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> bool:
+        # literals in functions are part of the code being documented
+        return False
+
+    def visit_ClassDef(self, node: cst.ClassDef) -> bool:
+        self.classes.append(node.name.value)
+        # as are the class attributes of the classes being documented
+        return ".".join(self.classes) not in self.keep
+
+    def leave_ClassDef(
+        self, original_node: cst.ClassDef, updated_node: cst.ClassDef
+    ) -> cst.ClassDef:
+        self.classes.pop()
+        return updated_node
+
+    def leave_Assign(
+        self, original_node: cst.Assign, updated_node: cst.Assign
+    ) -> cst.Assign:
+        return updated_node.with_changes(value=self._elide(updated_node.value))
+
+    def leave_AnnAssign(
+        self, original_node: cst.AnnAssign, updated_node: cst.AnnAssign
+    ) -> cst.AnnAssign:
+        if updated_node.value is None:
+            return updated_node
+        return updated_node.with_changes(value=self._elide(updated_node.value))
+
+
+def elide_literals(
+    tree: cst.Module, max_length: int = MAX_LITERAL_LENGTH, keep: Iterable[str] = ()
+) -> cst.Module:
+    """
+    Replaces the large literals assigned at module and class level with `...`.
+
+    Args:
+      tree (cst.Module): The tree to elide literals from.
+      max_length (int, optional): The length of the code of the longest literal that is kept. Defaults to MAX_LITERAL_LENGTH.
+      keep (Iterable[str], optional): The names of the classes whose bodies are left as they are (e.g. the nodes being documented). Defaults to none.
+
+    Returns:
+      cst.Module: The tree with large literals elided, or `tree` itself if there are none.
+
+    Examples:
+      >>> elide_literals(cst.parse_module("x = [1, 2, 3]\\n"), max_length=5).code
+      'x = ...\\n'
+    """
+    elider = LiteralElider(max_length, keep)
+    elided_tree = tree.visit(elider)
+    return elided_tree if elider.elided else tree
+
+
+def _is_import_line(statement: cst.CSTNode) -> bool:
+    return isinstance(statement, cst.SimpleStatementLine) and all(
+        isinstance(s, (cst.Import, cst.ImportFrom)) for s in statement.body
+    )
+
+
+def keep_imports(tree: cst.Module) -> cst.Module:
+    """
+    Removes the module-level statements other than imports, functions, classes and compound statements.
+
+    Args:
+      tree (cst.Module): The tree to reduce.
+
+    Returns:
+      cst.Module: The tree with only its imports as background.
+
+    Notes:
+      Compound statements (e.g. `if TYPE_CHECKING:`) are kept as they may contain imports, functions and classes.
+
+    Examples:
+      >>> keep_imports(cst.parse_module("import os\\nX = 1\\ndef f():\\n    pass\\n")).code
+      'import os\\ndef f():\\n    pass\\n'
+    """
+    body = [
+        s
+        for s in tree.body
+        if not isinstance(s, cst.SimpleStatementLine) or _is_import_line(s)
+    ]
+    if len(body) == len(tree.body):
+        return tree
+    return tree.with_changes(body=body)
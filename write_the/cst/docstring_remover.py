@@ -3,15 +3,36 @@ from .utils import remove_docstring
 
 
 class DocstringRemover(cst.CSTTransformer):
-    def __init__(self, nodes):
+    def __init__(self, nodes, index=None):
         """
         Initializes the DocstringRemover object.
 
         Args:
           nodes (list): A list of nodes to remove docstrings from.
+          index (FileIndex, optional): An index of the tree to be transformed. Nodes are then matched by identity and subtrees without matching nodes are skipped. Defaults to None.
         """
         self.nodes = nodes
         self.current_class = None
+        self.targets = None
+        self.enclosing = None
+        if index is not None:
+            self.targets = index.node_ids(nodes)
+            self.enclosing = index.enclosing_ids(nodes)
+
+    def is_target(self, original_node, name: str) -> bool:
+        if self.targets is not None:
+            return id(original_node) in self.targets
+        return name in self.nodes
+
+    def should_descend(self, node) -> bool:
+        return self.enclosing is None or id(node) in self.enclosing
+
+    def visit_SimpleStatementLine(self, node: cst.SimpleStatementLine) -> bool:
+        # functions and classes are never nested in simple statements
+        return False
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> bool:
+        return self.should_descend(node)
 
     def leave_FunctionDef(
         self, original_node: cst.FunctionDef, updated_node: cst.FunctionDef
@@ -31,12 +52,13 @@ class DocstringRemover(cst.CSTTransformer):
             if self.current_class
             else original_node.name.value
         )
-        if name in self.nodes:
+        if self.is_target(original_node, name):
             return remove_docstring(updated_node)
         return updated_node
 
-    def visit_ClassDef(self, original_node: cst.ClassDef) -> None:
+    def visit_ClassDef(self, original_node: cst.ClassDef) -> bool:
         self.current_class = original_node.name.value
+        return self.should_descend(original_node)
 
     def leave_ClassDef(
         self, original_node: cst.ClassDef, updated_node: cst.ClassDef
@@ -52,22 +74,25 @@ class DocstringRemover(cst.CSTTransformer):
           cst.ClassDef: The updated ClassDef node with the docstring removed if it is in the list of nodes.
         """
         self.current_class = None
-        if original_node.name.value in self.nodes:
+        if self.is_target(original_node, original_node.name.value):
             return remove_docstring(updated_node)
         return updated_node
 
 
-def remove_docstrings_from_tree(tree, nodes):
+def remove_docstrings_from_tree(tree, nodes, index=None):
     """
     Removes the docstrings from a tree of nodes.
 
     Args:
       tree (cst.CSTNode): The tree of nodes to remove the docstrings from.
       nodes (list): A list of nodes to remove docstrings from.
+      index (FileIndex, optional): An index of `tree` used to skip subtrees without docstrings to remove. Defaults to None.
 
     Returns:
       cst.CSTNode: The tree of nodes with the docstrings removed.
     """
-    remover = DocstringRemover(nodes)
+    if index is not None and not index.is_index_of(tree):
+        index = None
+    remover = DocstringRemover(nodes, index=index)
     tree = tree.visit(remover)
     return tree
@@ -0,0 +1,530 @@
+import re
+import textwrap
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import libcst as cst
+from libcst.metadata import MetadataWrapper, WhitespaceInclusivePositionProvider
+from .node_remover import remove_nodes_from_tree
+from .utils import get_code_from_node, has_docstring
+
+if TYPE_CHECKING:
+    from write_the.tokenizer import Tokenizer
+
+
+def _subtract_lines(
+    lines: Tuple[int, int], holes: Iterable[Tuple[int, int]]
+) -> List[Tuple[int, int]]:
+    # the ranges of `lines` that aren't in any of the holes
+    ranges = []
+    start = lines[0]
+    for first, last in sorted(holes):
+        if first > start:
+            ranges.append((start, first - 1))
+        start = max(start, last + 1)
+    if start <= lines[1]:
+        ranges.append((start, lines[1]))
+    return ranges
+
+
+@dataclass
+class IndexEntry:
+    """
+    A function or class in a FileIndex.
+
+    Args:
+      name (str): The qualified name of the node (`Class.method` for methods).
+      node (cst.CSTNode): The FunctionDef or ClassDef node.
+      span (Tuple[int, int]): The start and end offset of the node in the code of the tree, including its leading comments, decorators and trailing newline.
+      lines (Tuple[int, int]): The first and last line of the node.
+      has_docstring (bool): Whether the node has a docstring.
+      parent (Optional[str]): The name of the class the node is defined in.
+      enclosing (Tuple[cst.CSTNode, ...]): The functions and classes the node is nested in.
+      block (Optional[cst.CSTNode]): The block (or module) whose body contains the node.
+      body_span (Optional[Tuple[int, int]]): The start and end offset of the body of the node, from after its colon to the end of its last line.
+      indent (str): The indentation of the node.
+      tokens (Optional[int]): The number of tokens in the code of the node, once counted.
+      node_id (int): The `id` of the node, recorded so the entry can be matched after the tree is released.
+      enclosing_ids (Tuple[int, ...]): The `id` of the functions and classes the node is nested in.
+      block_id (int): The `id` of the block whose body contains the node.
+      block_size (int): The number of statements in the block.
+      source (Optional[str]): The code of the tree, top-level nodes are sliced from it. None if the tree doesn't use `\n` newlines (which nodes are rendered with).
+    """
+
+    name: str
+    node: cst.CSTNode
+    span: Tuple[int, int]
+    lines: Tuple[int, int]
+    has_docstring: bool
+    parent: Optional[str] = None
+    enclosing: Tuple[cst.CSTNode, ...] = ()
+    block: Optional[cst.CSTNode] = field(default=None, repr=False)
+    body_span: Optional[Tuple[int, int]] = None
+    indent: str = ""
+    tokens: Optional[int] = None
+    is_class: bool = False
+    node_id: int = 0
+    enclosing_ids: Tuple[int, ...] = ()
+    block_id: int = 0
+    block_size: int = 0
+    source: Optional[str] = field(default=None, repr=False)
+    _code: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def code(self) -> str:
+        """
+        Gets the code of the node.
+
+        Top-level nodes are sliced from the code of the tree each time, nested
+        nodes are rendered on first use.
+
+        Returns:
+          str: The code of the node.
+
+        Raises:
+          ValueError: If the tree was released before a nested node was rendered.
+        """
+        if self._code is not None:
+            return self._code
+        if not self.indent and self.source is not None:
+            code = self.source[self.span[0] : self.span[1]]
+            if not code.endswith(("\n", "\r")):
+                # the last statement of a file without a trailing newline
+                code += "\n"
+            return code
+        if self.node is None:
+            raise ValueError(f"The tree of {self.name} was released!")
+        self._code = get_code_from_node(self.node)
+        return self._code
+
+    def release(self, keep_code: bool = False) -> None:
+        """
+        Drops the references to the nodes of the tree, keeping the rendered code.
+
+        Args:
+          keep_code (bool, optional): Whether to render the code of the node first if it can't be sliced from the source. Defaults to False.
+        """
+        if keep_code and self._code is None and self.node is not None:
+            if self.indent or self.source is None:
+                self._code = get_code_from_node(self.node)
+        self.node = None
+        self.enclosing = ()
+        self.block = None
+
+
+class FileIndexer(cst.CSTVisitor):
+    """
+    A CSTVisitor that records every function and class of a tree in a single traversal.
+
+    Names are qualified the same way as by the FunctionAndClassCollector.
+    """
+
+    METADATA_DEPENDENCIES = (WhitespaceInclusivePositionProvider,)
+
+    def __init__(self, module: cst.Module, code: str, line_offsets: List[int]):
+        self.code = code
+        self.entries: List[IndexEntry] = []
+        self.current_class = None
+        self.stack: List[cst.CSTNode] = []
+        self.blocks: List[cst.CSTNode] = [module]
+        self.default_indent = module.default_indent
+        self.default_newline = module.default_newline
+        self.indents: List[str] = []
+        self.line_offsets = line_offsets
+
+    def _offset(self, position) -> int:
+        # positions past the end come from the trailing newline libcst drops for
+        # files that don't end with one
+        if position.line > len(self.line_offsets):
+            return len(self.code)
+        return min(self.line_offsets[position.line - 1] + position.column, len(self.code))
+
+    def _add(self, node, name: str, parent: Optional[str]) -> None:
+        position = self.get_metadata(WhitespaceInclusivePositionProvider, node)
+        start, end = self._offset(position.start), self._offset(position.end)
+        # the range ends after the trailing newline, i.e. at the start of the next line
+        last_line = position.end.line - (1 if position.end.column == 0 else 0)
+        body = self.get_metadata(WhitespaceInclusivePositionProvider, node.body)
+        block = self.blocks[-1]
+        self.entries.append(
+            IndexEntry(
+                name=name,
+                node=node,
+                span=(start, end),
+                lines=(position.start.line, last_line),
+                has_docstring=has_docstring(node),
+                parent=parent,
+                enclosing=tuple(self.stack),
+                block=block,
+                body_span=(self._offset(body.start), self._offset(body.end)),
+                indent="".join(self.indents),
+                is_class=isinstance(node, cst.ClassDef),
+                node_id=id(node),
+                enclosing_ids=tuple(id(n) for n in self.stack),
+                block_id=id(block),
+                block_size=len(block.body),
+                source=self.code if self.default_newline == "\n" else None,
+            )
+        )
+        self.stack.append(node)
+
+    def visit_IndentedBlock(self, node: cst.IndentedBlock) -> None:
+        self.blocks.append(node)
+        self.indents.append(self.default_indent if node.indent is None else node.indent)
+
+    def leave_IndentedBlock(self, node: cst.IndentedBlock) -> None:
+        self.blocks.pop()
+        self.indents.pop()
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> None:
+        name = (
+            f"{self.current_class}.{node.name.value}"
+            if self.current_class
+            else node.name.value
+        )
+        self._add(node, name, self.current_class)
+
+    def leave_FunctionDef(self, node: cst.FunctionDef) -> None:
+        self.stack.pop()
+
+    def visit_ClassDef(self, node: cst.ClassDef) -> None:
+        parent = self.current_class
+        self.current_class = node.name.value
+        self._add(node, node.name.value, parent)
+
+    def leave_ClassDef(self, node: cst.ClassDef) -> None:
+        self.current_class = None
+        self.stack.pop()
+
+
+class FileIndex:
+    """
+    An index of the functions and classes in a tree, built in one traversal.
+
+    The collectors, extractors and removers accept an index of the tree they are
+    given so they can look nodes up instead of walking the whole tree again. The
+    code of the tree is rendered once and parts of it are sliced out by span.
+    Once the tree is released the index can still render code by span.
+    """
+
+    def __init__(self, tree: cst.Module):
+        """
+        Initializes the FileIndex.
+
+        Args:
+          tree (cst.Module): The tree to index.
+        """
+        self.tree = tree
+        self.code = tree.code
+        self.default_newline = tree.default_newline
+        self.has_trailing_newline = tree.has_trailing_newline
+        self.module_id = id(tree)
+        # libcst only treats \r\n, \r and \n as line breaks (unlike str.splitlines)
+        line_offsets = [0] + [m.end() for m in re.finditer(r"\r\n|\r|\n", self.code)]
+        indexer = FileIndexer(tree, self.code, line_offsets)
+        MetadataWrapper(tree, unsafe_skip_copy=True).visit(indexer)
+        self.entries: List[IndexEntry] = indexer.entries
+        self._entries_by_name: Dict[str, IndexEntry] = {}
+        for entry in self.entries:
+            self._entries_by_name.setdefault(entry.name, entry)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries_by_name
+
+    def __getitem__(self, name: str) -> IndexEntry:
+        return self._entries_by_name[name]
+
+    def __iter__(self) -> Iterator[IndexEntry]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def is_index_of(self, tree: cst.CSTNode) -> bool:
+        return self.tree is tree
+
+    def release(self, names: Iterable[str] = ()) -> None:
+        """
+        Drops the references to the tree and its nodes so they can be freed.
+
+        The code of the named nodes (and of the nested nodes rendered so far) is
+        kept, the rest of the code is sliced from `code`, so the index can still
+        render batches of the named nodes. Nodes can no longer be looked up or
+        transformed.
+
+        Args:
+          names (Iterable[str], optional): The names of the nodes whose code is needed afterwards, e.g. the nodes of planned batches. Defaults to ().
+        """
+        names = set(names)
+        self.tree = None
+        for entry in self.entries:
+            entry.release(keep_code=entry.name in names)
+
+    def node_names(self, force: bool, update: bool = False) -> List[str]:
+        """
+        Gets the names of the functions and classes, like `get_node_names`.
+
+        Args:
+          force (bool): Whether to include nodes even if they have docstrings.
+          update (bool, optional): Whether to only include nodes that have docstrings. Defaults to False.
+
+        Returns:
+          List[str]: The class names followed by the function names.
+        """
+        selected = [e for e in self.entries if force or e.has_docstring == update]
+        classes = [e.name for e in selected if e.is_class]
+        functions = [e.name for e in selected if not e.is_class]
+        return classes + functions
+
+    def names_in_lines(self, lines: Iterable[Tuple[int, int]]) -> List[str]:
+        """
+        Gets the names of the innermost functions and classes containing the given lines.
+
+        Args:
+          lines (Iterable[Tuple[int, int]]): The first and last line of each range, counted from 1, e.g. the lines changed in a diff.
+
+        Returns:
+          List[str]: The names of the nodes in the order they appear in the tree. Lines of a method select the method, lines of a class outside its methods select the class.
+
+        Examples:
+          >>> FileIndex(cst.parse_module("class A:\\n    x = 1\\n    def f(self):\\n        pass\\n")).names_in_lines([(4, 4)])
+          ['A.f']
+        """
+        ranges = list(lines)
+        nested: Dict[int, List[Tuple[int, int]]] = {}
+        for entry in self.entries:
+            if entry.enclosing_ids:
+                nested.setdefault(entry.enclosing_ids[-1], []).append(entry.lines)
+        names = []
+        for entry in self.entries:
+            own = _subtract_lines(entry.lines, nested.get(entry.node_id, []))
+            if entry.name not in names and any(
+                first <= end and start <= last
+                for first, last in own
+                for start, end in ranges
+            ):
+                names.append(entry.name)
+        return names
+
+    def extract(self, names: Iterable[str]) -> List[cst.CSTNode]:
+        """
+        Gets the nodes with the given names, like `extract_nodes_from_tree`.
+
+        Args:
+          names (Iterable[str]): The names of the nodes.
+
+        Returns:
+          List[cst.CSTNode]: The nodes in the order they appear in the tree.
+        """
+        names = set(names)
+        return [e.node for e in self.entries if e.name in names]
+
+    def node_ids(self, names: Iterable[str]) -> Set[int]:
+        """
+        Gets the ids of the nodes with the given names.
+
+        Args:
+          names (Iterable[str]): The names of the nodes.
+
+        Returns:
+          Set[int]: The `id` of every node with one of the names.
+        """
+        names = set(names)
+        return {e.node_id for e in self.entries if e.name in names}
+
+    def enclosing_ids(self, names: Iterable[str]) -> Set[int]:
+        """
+        Gets the ids of the functions and classes that contain the nodes with the given names.
+
+        Args:
+          names (Iterable[str]): The names of the nodes.
+
+        Returns:
+          Set[int]: The `id` of every node a transformer has to descend into to reach the named nodes.
+        """
+        names = set(names)
+        return {
+            node_id
+            for e in self.entries
+            if e.name in names
+            for node_id in e.enclosing_ids
+        }
+
+    def render(
+        self, names: Iterable[str], replacements: Optional[Dict[str, str]] = None
+    ) -> str:
+        """
+        Renders the nodes with the given names as a module, like `nodes_to_tree(extract_nodes_from_tree(...)).code`.
+
+        Args:
+          names (Iterable[str]): The names of the nodes.
+          replacements (Optional[Dict[str, str]]): Code to render instead of the code of some of the nodes, keyed by name. Defaults to None.
+
+        Returns:
+          str: The code of the nodes, in the order they appear in the tree.
+        """
+        names = set(names)
+        replacements = replacements or {}
+        code = "".join(
+            replacements[e.name] if e.name in replacements else e.code
+            for e in self.entries
+            if e.name in names
+        )
+        return code or cst.Module(body=[]).code
+
+    def _replaced(
+        self, replacements: Optional[Dict[str, str]], dropped: Set[int]
+    ) -> List[IndexEntry]:
+        # only nodes that are rendered without any of their nested nodes can be replaced
+        if not replacements:
+            return []
+        candidates = [
+            e
+            for e in self.entries
+            if e.name in replacements
+            and e.node_id not in dropped
+            and not any(n in dropped for n in e.enclosing_ids)
+        ]
+        kept_nested = {
+            n
+            for e in self.entries
+            if e.node_id not in dropped and not any(n in dropped for n in e.enclosing_ids)
+            for n in e.enclosing_ids
+        }
+        replaced = [e for e in candidates if e.node_id not in kept_nested]
+        replaced_ids = {e.node_id for e in replaced}
+        return [
+            e for e in replaced if not any(n in replaced_ids for n in e.enclosing_ids)
+        ]
+
+    def _splice(self, edits: List[Tuple[int, int, str]]) -> str:
+        parts = []
+        position = 0
+        for start, end, text in sorted(edits):
+            parts.append(self.code[position:start])
+            parts.append(text)
+            position = end
+        parts.append(self.code[position:])
+        return "".join(parts)
+
+    def _replacement_edits(
+        self, replaced: List[IndexEntry], replacements: Dict[str, str]
+    ) -> List[Tuple[int, int, str]]:
+        return [
+            (e.span[0], e.span[1], textwrap.indent(replacements[e.name], e.indent))
+            for e in replaced
+        ]
+
+    def render_without(
+        self, names: Iterable[str], replacements: Optional[Dict[str, str]] = None
+    ) -> str:
+        """
+        Renders the tree without the nodes with the given names, like `remove_nodes_from_tree(...).code`.
+
+        Args:
+          names (Iterable[str]): The names of the nodes to leave out.
+          replacements (Optional[Dict[str, str]]): Code to render instead of the code of some of the remaining nodes, keyed by name. Nodes are only replaced if none of their nested nodes remain. Defaults to None.
+
+        Returns:
+          str: The code of the tree, sliced around the spans of the removed nodes.
+
+        Notes:
+          Blocks emptied by removing the nodes are filled with `pass` like libcst does.
+          Falls back to transforming the tree (parsed again if it was released) if the module would be emptied.
+        """
+        names = set(names)
+        removed = [e for e in self.entries if e.name in names]
+        removed_ids = {e.node_id for e in removed}
+        replaced = self._replaced(replacements, removed_ids)
+        replaced_ids = {e.node_id for e in replaced}
+        # nodes inside removed (or replaced) nodes are removed with them
+        outermost = [
+            e
+            for e in removed
+            if not any(
+                n in removed_ids or n in replaced_ids for n in e.enclosing_ids
+            )
+        ]
+        removed_per_block: Dict[int, List[IndexEntry]] = {}
+        for entry in outermost:
+            removed_per_block.setdefault(entry.block_id, []).append(entry)
+        newline = self.default_newline
+        edits = self._replacement_edits(replaced, replacements)
+        for entries in removed_per_block.values():
+            if len(entries) < entries[0].block_size:
+                edits.extend((e.span[0], e.span[1], "") for e in entries)
+            elif entries[0].block_id == self.module_id:
+                if self.tree is None:
+                    return remove_nodes_from_tree(cst.parse_module(self.code), names).code
+                return remove_nodes_from_tree(self.tree, names, index=self).code
+            else:
+                # libcst fills emptied blocks with `pass`
+                start = min(e.span[0] for e in entries)
+                end = max(e.span[1] for e in entries)
+                edits.append((start, end, f"{entries[0].indent}pass{newline}"))
+        code = self._splice(edits)
+        if not self.has_trailing_newline and code.endswith(newline):
+            # the last statement was removed, libcst drops the newline of the new last one
+            code = code[: -len(newline)]
+        return code
+
+    def render_stubbed(
+        self, names: Iterable[str], replacements: Optional[Dict[str, str]] = None
+    ) -> str:
+        """
+        Renders the tree with every other function reduced to a stub (its signature and `...`).
+
+        Args:
+          names (Iterable[str]): The names of the nodes to keep in full.
+          replacements (Optional[Dict[str, str]]): Code to render instead of the code of some of the kept nodes, keyed by name. Defaults to None.
+
+        Returns:
+          str: The code of the tree, with the bodies of the other functions sliced out.
+
+        Notes:
+          Functions nested in kept or stubbed functions are left as they are, the
+          methods of classes are stubbed unless they are kept.
+        """
+        names = set(names)
+        kept = {e.node_id for e in self.entries if e.name in names}
+        enclosing = self.enclosing_ids(names)
+        kept_functions = {
+            e.node_id for e in self.entries if e.node_id in kept and not e.is_class
+        }
+        replaced = [
+            e
+            for e in self._replaced(replacements, set())
+            if e.node_id in kept and e.node_id not in enclosing
+        ]
+        replaced_ids = {e.node_id for e in replaced}
+        stubbed = set()
+        newline = self.default_newline
+        edits = self._replacement_edits(replaced, replacements)
+        for entry in self.entries:
+            if entry.is_class or entry.node_id in kept or entry.node_id in enclosing:
+                continue
+            if any(
+                n in kept_functions or n in stubbed or n in replaced_ids
+                for n in entry.enclosing_ids
+            ):
+                continue
+            stubbed.add(entry.node_id)
+            edits.append((*entry.body_span, f" ...{newline}"))
+        return self._splice(edits)
+
+    def count_tokens(self, tokenizer: "Tokenizer", names: Iterable[str]) -> List[int]:
+        """
+        Counts the tokens in the code of the named nodes, counting uncounted nodes in one batch.
+
+        Args:
+          tokenizer (Tokenizer): The tokenizer used to count tokens.
+          names (Iterable[str]): The names of the nodes.
+
+        Returns:
+          List[int]: The number of tokens in each node.
+        """
+        entries = [self[name] for name in names]
+        uncounted = [e for e in entries if e.tokens is None]
+        counts = tokenizer.count_batch([e.code for e in uncounted])
+        for entry, count in zip(uncounted, counts):
+            entry.tokens = count
+        return [e.tokens for e in entries]
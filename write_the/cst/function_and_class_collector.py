@@ -62,7 +62,7 @@ class FunctionAndClassCollector(cst.CSTVisitor):
         self.current_class = None
 
 
-def get_node_names(tree, force, update=False):
+def get_node_names(tree, force, update=False, index=None):
     """
     Gets the names of functions and classes from a CST tree.
 
@@ -70,10 +70,13 @@ def get_node_names(tree, force, update=False):
       tree (cst.CSTNode): The CST tree to traverse.
       force (bool): Whether to force the collection of functions and classes even if they have docstrings.
       update (bool, optional): Whether to update the collection of functions and classes if they have docstrings. Defaults to False.
+      index (FileIndex, optional): An index of `tree` to read the names from instead of traversing it. Defaults to None.
 
     Returns:
       list[str]: A list of function and class names.
     """
+    if index is not None and index.is_index_of(tree):
+        return index.node_names(force, update)
     collector = FunctionAndClassCollector(force, update)
     tree.visit(collector)
     return collector.classes + collector.functions
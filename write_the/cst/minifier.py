@@ -0,0 +1,233 @@
+from typing import Iterable, Optional, Union
+import libcst as cst
+import libcst.matchers as m
+from .utils import remove_docstring
+
+MAX_STRING_LENGTH = 80
+# the longest escape sequence (\N{...} aside) is \UXXXXXXXX
+MAX_ESCAPE_LENGTH = 10
+
+
+def shorten_string(value: str, max_length: int = MAX_STRING_LENGTH) -> str:
+    """
+    Shortens the code of a string literal, keeping its prefix and quotes.
+
+    Args:
+      value (str): The code of the string literal, e.g. `'abc'`.
+      max_length (int, optional): The maximum length of the contents of the string. Defaults to MAX_STRING_LENGTH.
+
+    Returns:
+      str: The code of the shortened string, ending with `...` if it was shortened.
+
+    Examples:
+      >>> shorten_string("b'abcdef'", max_length=3)
+      "b'abc...'"
+    """
+    prefix_length = len(value) - len(value.lstrip("rRbBuUfF"))
+    prefix, rest = value[:prefix_length], value[prefix_length:]
+    quote = rest[:3] if rest[:3] in ('"""', "'''") else rest[0]
+    contents = rest[len(quote) : -len(quote)]
+    if len(contents) <= max_length:
+        return value
+    contents = contents[:max_length]
+    escape = contents.rfind("\\")
+    if escape >= 0 and escape >= len(contents) - MAX_ESCAPE_LENGTH:
+        # don't cut an escape sequence in half
+        contents = contents[:escape]
+    return f"{prefix}{quote}{contents}...{quote}"
+
+
+def _docstring_node(node) -> Optional[cst.SimpleString]:
+    body = node.body.body if not isinstance(node, cst.Module) else node.body
+    if body and isinstance(body[0], cst.SimpleStatementLine):
+        statement = body[0].body[0]
+        if isinstance(statement, cst.Expr) and isinstance(statement.value, cst.SimpleString):
+            return statement.value
+    return None
+
+
+def _is_type_checking(test: cst.BaseExpression) -> bool:
+    return m.matches(
+        test, m.Name("TYPE_CHECKING") | m.Attribute(attr=m.Name("TYPE_CHECKING"))
+    )
+
+
+class Minifier(cst.CSTTransformer):
+    """
+    A CSTTransformer that removes what the model doesn't need to document code.
+
+    Comments, blank lines and `if TYPE_CHECKING:` blocks are removed, whitespace is
+    collapsed, long strings are shortened and the docstrings of the nodes that aren't
+    being documented are dropped. Signatures, decorators and control flow are kept.
+    """
+
+    def __init__(
+        self,
+        nodes: Iterable[str] = (),
+        index=None,
+        drop_docstrings: bool = True,
+        max_string_length: int = MAX_STRING_LENGTH,
+    ):
+        """
+        Initializes the Minifier.
+
+        Args:
+          nodes (Iterable[str], optional): The names of the nodes whose docstrings are kept. Defaults to ().
+          index (FileIndex, optional): An index of the tree to be transformed, nodes are then matched by identity. Defaults to None.
+          drop_docstrings (bool, optional): Whether to drop the docstrings of the other nodes and the module. Defaults to True.
+          max_string_length (int, optional): The maximum length of the contents of a string that isn't a docstring. Defaults to MAX_STRING_LENGTH.
+        """
+        self.nodes = set(nodes)
+        self.targets = index.node_ids(self.nodes) if index is not None else None
+        self.drop_docstrings = drop_docstrings
+        self.max_string_length = max_string_length
+        self.current_class = None
+        self.docstrings = set()
+
+    def is_target(self, original_node, name: str) -> bool:
+        if self.targets is not None:
+            return id(original_node) in self.targets
+        return name in self.nodes
+
+    def _visit_docstring_owner(self, node) -> None:
+        docstring = _docstring_node(node)
+        if docstring is not None:
+            self.docstrings.add(id(docstring))
+
+    def _leave_docstring_owner(self, original_node, updated_node, name: str):
+        if self.drop_docstrings and not self.is_target(original_node, name):
+            return remove_docstring(updated_node)
+        return updated_node
+
+    def visit_Module(self, node: cst.Module) -> None:
+        self._visit_docstring_owner(node)
+
+    def leave_Module(self, original_node: cst.Module, updated_node: cst.Module) -> cst.Module:
+        if self.drop_docstrings and _docstring_node(updated_node) is not None:
+            return updated_node.with_changes(body=updated_node.body[1:])
+        return updated_node
+
+    def visit_ClassDef(self, node: cst.ClassDef) -> None:
+        self.current_class = node.name.value
+        self._visit_docstring_owner(node)
+
+    def leave_ClassDef(
+        self, original_node: cst.ClassDef, updated_node: cst.ClassDef
+    ) -> cst.ClassDef:
+        self.current_class = None
+        return self._leave_docstring_owner(
+            original_node, updated_node, original_node.name.value
+        )
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> None:
+        self._visit_docstring_owner(node)
+
+    def leave_FunctionDef(
+        self, original_node: cst.FunctionDef, updated_node: cst.FunctionDef
+    ) -> cst.FunctionDef:
+        name = (
+            f"{self.current_class}.{original_node.name.value}"
+            if self.current_class
+            else original_node.name.value
+        )
+        return self._leave_docstring_owner(original_node, updated_node, name)
+
+    def leave_If(
+        self, original_node: cst.If, updated_node: cst.If
+    ) -> Union[cst.If, cst.RemovalSentinel]:
+        if (
+            _is_type_checking(original_node.test)
+            and original_node.orelse is None
+            and not m.findall(original_node.body, m.FunctionDef() | m.ClassDef())
+        ):
+            return cst.RemoveFromParent()
+        return updated_node
+
+    def leave_EmptyLine(
+        self, original_node: cst.EmptyLine, updated_node: cst.EmptyLine
+    ) -> cst.RemovalSentinel:
+        # blank lines and comments on their own line
+        return cst.RemoveFromParent()
+
+    def leave_TrailingWhitespace(
+        self, original_node: cst.TrailingWhitespace, updated_node: cst.TrailingWhitespace
+    ) -> cst.TrailingWhitespace:
+        return updated_node.with_changes(whitespace=cst.SimpleWhitespace(""), comment=None)
+
+    def leave_ParenthesizedWhitespace(
+        self,
+        original_node: cst.ParenthesizedWhitespace,
+        updated_node: cst.ParenthesizedWhitespace,
+    ) -> cst.SimpleWhitespace:
+        # join lines wrapped inside brackets
+        return cst.SimpleWhitespace(" ")
+
+    def leave_SimpleWhitespace(
+        self, original_node: cst.SimpleWhitespace, updated_node: cst.SimpleWhitespace
+    ) -> cst.SimpleWhitespace:
+        if len(updated_node.value) > 1 and "\\" not in updated_node.value:
+            return cst.SimpleWhitespace(" ")
+        return updated_node
+
+    def leave_SimpleString(
+        self, original_node: cst.SimpleString, updated_node: cst.SimpleString
+    ) -> cst.SimpleString:
+        if id(original_node) in self.docstrings:
+            return updated_node
+        return updated_node.with_changes(
+            value=shorten_string(updated_node.value, self.max_string_length)
+        )
+
+
+def minify_tree(
+    tree: cst.Module,
+    nodes: Iterable[str] = (),
+    index=None,
+    drop_docstrings: bool = True,
+    max_string_length: int = MAX_STRING_LENGTH,
+) -> cst.Module:
+    """
+    Minifies a tree, keeping the docstrings of the given nodes.
+
+    Args:
+      tree (cst.Module): The tree to minify.
+      nodes (Iterable[str], optional): The names of the nodes whose docstrings are kept. Defaults to ().
+      index (FileIndex, optional): An index of `tree` to match the nodes by identity. Defaults to None.
+      drop_docstrings (bool, optional): Whether to drop the docstrings of the other nodes and the module. Defaults to True.
+      max_string_length (int, optional): The maximum length of the contents of a string that isn't a docstring. Defaults to MAX_STRING_LENGTH.
+
+    Returns:
+      cst.Module: The minified tree.
+
+    Examples:
+      >>> minify_tree(cst.parse_module("x = [\\n    1,  # one\\n    2,\\n]\\n\\n\\ny = 1\\n")).code
+      'x = [ 1, 2, ]\\ny = 1\\n'
+    """
+    if index is not None and not index.is_index_of(tree):
+        index = None
+    return tree.visit(
+        Minifier(
+            nodes,
+            index=index,
+            drop_docstrings=drop_docstrings,
+            max_string_length=max_string_length,
+        )
+    )
+
+
+def minify_code(code: str, **kwargs) -> str:
+    """
+    Minifies Python source code, returning it unchanged if it can't be parsed.
+
+    Args:
+      code (str): The source code.
+      **kwargs: The options of `minify_tree`.
+
+    Returns:
+      str: The minified code.
+    """
+    try:
+        tree = cst.parse_module(code)
+    except cst.ParserSyntaxError:
+        return code
+    return minify_tree(tree, **kwargs).code
@@ -1,31 +1,62 @@
-from dataclasses import dataclass, field
-from typing import List, Optional
+import heapq
+from dataclasses import dataclass, field, replace
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import libcst as cst
-import tiktoken
+from write_the.cst.background import (
+    BACKGROUND_LEVELS,
+    MAX_LITERAL_LENGTH,
+    elide_literals,
+    keep_imports,
+)
 from write_the.cst.docstring_remover import remove_docstrings_from_tree
+from write_the.cst.file_index import FileIndex
+from write_the.cst.minifier import minify_tree
 from write_the.cst.node_extractor import extract_node_from_tree, extract_nodes_from_tree
 from write_the.cst.node_remover import remove_nodes_from_tree
+from write_the.cst.node_shrinker import shrink_node
 from write_the.cst.utils import get_code_from_node, nodes_to_tree
 from write_the.cst.function_and_class_collector import get_node_names
+from write_the.tokenizer import Tokenizer, get_tokenizer
 
 
 class Node:
     """
     A class representing a node in a CST tree.
 
+    Nodes looked up in an index only refer to its entry, their code is sliced
+    (or rendered) from the source of the file when it is needed.
+
     Args:
       name (str): The name of the node.
-      node (cst.CSTNode): The CST node.
+      node (cst.CSTNode): The CST node, None once the tree is released.
       code (str): The code of the node.
       tokens (int): The number of tokens in the node.
+      shrunk (Optional[str]): How the code of the node was shrunk to fit in a request, None if it wasn't.
+      saved_tokens (int): The tokens saved by minifying the code of the node.
     """
 
-    name: str
-    node: cst.CSTNode
-    code: str
-    tokens: int
+    __slots__ = (
+        "name",
+        "response_size",
+        "tokenizer",
+        "shrunk",
+        "saved_tokens",
+        "_tokens",
+        "_entry",
+        "_node",
+        "_code",
+    )
 
-    def __init__(self, *, tree, node_name, response_size=80) -> None:
+    def __init__(
+        self,
+        *,
+        tree,
+        node_name,
+        response_size=80,
+        tokenizer: Optional[Tokenizer] = None,
+        index: Optional[FileIndex] = None,
+    ) -> None:
         """
         Initializes a Node object.
 
@@ -33,12 +64,68 @@ class Node:
           tree (cst.Module): The CST tree.
           node_name (str): The name of the node.
           response_size (int): The size of the response.
+          tokenizer (Optional[Tokenizer]): The tokenizer used to count tokens. Defaults to the shared gpt-4 tokenizer.
+          index (Optional[FileIndex]): An index of `tree` to look the node up in. Defaults to None.
         """
-        self.node = extract_node_from_tree(tree=tree, node=node_name)
         self.name = node_name
-        self.code = get_code_from_node(self.node)
-        encoding = tiktoken.encoding_for_model("gpt-4")
-        self.tokens = len(encoding.encode(self.code)) + response_size
+        self._entry = self._node = self._code = None
+        if index is not None and index.is_index_of(tree):
+            if node_name not in index:
+                raise ValueError(f"Could not find node: {node_name}!")
+            self._entry = index[node_name]
+        else:
+            self._node = extract_node_from_tree(tree=tree, node=node_name)
+            self._code = get_code_from_node(self._node)
+        self.response_size = response_size
+        self.tokenizer = tokenizer
+        self.shrunk = None
+        self.saved_tokens = 0
+        self._tokens = None
+
+    @property
+    def node(self) -> Optional[cst.CSTNode]:
+        return self._entry.node if self._entry is not None else self._node
+
+    @property
+    def code(self) -> str:
+        """
+        Gets the code of the node.
+
+        Returns:
+          str: The code set for the node (e.g. shrunk), or else the code of its index entry.
+        """
+        if self._code is None and self._entry is not None:
+            return self._entry.code
+        return self._code
+
+    @code.setter
+    def code(self, code: str) -> None:
+        self._code = code
+
+    def release(self) -> None:
+        """
+        Drops the reference to the CST node of a node that isn't in an index.
+
+        Nodes in an index are released with the index (see `FileIndex.release`).
+        """
+        self._node = None
+
+    @property
+    def tokens(self) -> int:
+        """
+        Gets the number of tokens in the node and its response, counting them on first use.
+
+        Returns:
+          int: The number of tokens.
+        """
+        if self._tokens is None:
+            tokenizer = self.tokenizer or get_tokenizer()
+            self._tokens = tokenizer.count(self.code) + self.response_size
+        return self._tokens
+
+    @tokens.setter
+    def tokens(self, tokens: int) -> None:
+        self._tokens = tokens
 
 
 class Background(Node):
@@ -49,18 +136,28 @@ class Background(Node):
       body (cst.CSTNode): The CST node of the background.
     """
 
-    def __init__(self, body) -> None:
+    __slots__ = ()
+
+    def __init__(
+        self, body, tokenizer: Optional[Tokenizer] = None, code: Optional[str] = None
+    ) -> None:
         """
         Initializes a Background object.
 
         Args:
           body (cst.CSTNode): The CST node of the background.
+          tokenizer (Optional[Tokenizer]): The tokenizer used to count tokens. Defaults to the shared gpt-4 tokenizer.
+          code (Optional[str]): The code of the background if it isn't the code of `body`. Defaults to None.
         """
-        self.node = body
         self.name = "background"
-        self.code = self.node.code
-        encoding = tiktoken.encoding_for_model("gpt-4")
-        self.tokens = len(encoding.encode(self.code))
+        self._entry = None
+        self._node = body
+        self._code = body.code if code is None else code
+        self.response_size = 0
+        self.tokenizer = tokenizer
+        self.shrunk = None
+        self.saved_tokens = 0
+        self._tokens = None
 
 
 @dataclass
@@ -76,6 +173,8 @@ class NodeBatch:
       nodes (List[Node]): The list of nodes in the batch.
       max_batch_size (Optional[int]): The maximum size of the batch.
       send_node_context (bool): Whether to send the context of the nodes.
+      index (Optional[FileIndex]): An index of the tree used to find nodes without traversing it.
+      background_level (str): How much of the rest of the file is sent with the nodes, one of BACKGROUND_LEVELS.
     """
 
     tree: cst.Module
@@ -85,6 +184,11 @@ class NodeBatch:
     nodes: List[Node] = field(default_factory=list)
     max_batch_size: Optional[int] = None
     send_node_context: bool = False
+    index: Optional[FileIndex] = None
+    background_level: str = "module"
+    _code: Optional[Tuple[Tuple[str, ...], str]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     @property
     def tokens(self) -> int:
@@ -94,11 +198,50 @@ class NodeBatch:
         Returns:
           int: The number of tokens in the batch.
         """
-        tokens = self.prompt_size + sum(n.tokens for n in self.nodes)
+        tokens = self.prompt_size + sum(self.cost(n) for n in self.nodes)
         if self.background:
             tokens += self.background.tokens
         return tokens
 
+    @property
+    def saved_tokens(self) -> int:
+        """
+        Gets the number of tokens saved by minifying the code of the batch.
+
+        Returns:
+          int: The tokens saved, 0 if the code wasn't minified.
+        """
+        saved = self.background.saved_tokens if self.background else 0
+        if self.background_level == "full" and self.background:
+            # the nodes are part of the background
+            return saved
+        return saved + sum(n.saved_tokens for n in self.nodes)
+
+    def cost(self, node: Node) -> int:
+        """
+        Gets the number of tokens a node adds to the batch.
+
+        Args:
+          node (Node): The node.
+
+        Returns:
+          int: The tokens of the node, or only of its response if the whole file is sent as background.
+        """
+        if self.background_level == "full" and self.background:
+            # the code of the node is part of the background
+            return getattr(node, "response_size", 0)
+        return node.tokens
+
+    @property
+    def fill(self) -> float:
+        """
+        Gets how full the batch is.
+
+        Returns:
+          float: The fraction of `max_tokens` used by the batch.
+        """
+        return self.tokens / self.max_tokens
+
     @property
     def node_names(self) -> List[str]:
         """
@@ -122,28 +265,98 @@ class NodeBatch:
     @property
     def code(self):
         """
-        Gets the code of the batch.
+        Gets the code of the batch, rendering it once for the current nodes.
 
         Returns:
           str: The code of the batch.
+
+        Notes:
+          With an index the code is sliced from the rendered source instead of transforming the tree.
         """
-        if self.send_node_context:
+        key = tuple(self.node_names)
+        if self._code is None or self._code[0] != key:
+            self._code = (key, self._render())
+        return self._code[1]
+
+    def _render(self) -> str:
+        index = self.index
+        if index is not None and not index.is_index_of(self.tree):
+            index = None
+        if self.send_node_context or self.background_level == "full":
             # send everything
-            return self.tree.code
+            return index.code if index else self.tree.code
+        # shrunk nodes are sent as their shrunk code
+        replacements = {n.name: n.code for n in self.nodes if getattr(n, "shrunk", None)}
+        if replacements and index is None:
+            index = FileIndex(self.tree)
+        if self.background_level == "signatures":
+            return (index or FileIndex(self.tree)).render_stubbed(
+                self.node_names, replacements
+            )
+        node_names = set(self.node_names)
         if self.background:
             # remove all non batch nodes
-            all_nodes = get_node_names(self.tree, True)
-            classes_to_keep = [n.split(".")[0] for n in self.node_names if "." in n]
-            nodes_to_remove: List[str] = [
-                n for n in all_nodes if n not in self.node_names
+            all_nodes = get_node_names(self.tree, True, index=index)
+            classes_to_keep = {n.split(".")[0] for n in node_names if "." in n}
+            nodes_to_remove = [
+                n for n in all_nodes if n not in node_names and n not in classes_to_keep
             ]
-            nodes_to_remove = [n for n in nodes_to_remove if n not in classes_to_keep]
-            processed_tree = remove_nodes_from_tree(self.tree, nodes_to_remove)
-        else:
-            # extract batch nodes
-            extracted_nodes = extract_nodes_from_tree(self.tree, self.node_names)
-            processed_tree = nodes_to_tree(extracted_nodes)
-        return processed_tree.code
+            if index:
+                return index.render_without(nodes_to_remove, replacements)
+            return remove_nodes_from_tree(self.tree, nodes_to_remove).code
+        # extract batch nodes
+        if index:
+            return index.render(node_names, replacements)
+        extracted_nodes = extract_nodes_from_tree(self.tree, self.node_names)
+        return nodes_to_tree(extracted_nodes).code
+
+    def release(self) -> None:
+        """
+        Drops the references to the tree of the batch so it can be freed once planned.
+
+        Notes:
+          The code is rendered from the index afterwards, so only batches with an index can be released.
+          Batches sharing an index are released together with `release_trees`.
+        """
+        for node in self.nodes:
+            node.release()
+        if self.background:
+            self.background.release()
+        if self.index is not None and self.index.tree is not None:
+            self.index.release(self.node_names)
+        self.tree = None
+
+    def split(self) -> List["NodeBatch"]:
+        """
+        Splits the batch into two batches with half of the nodes each.
+
+        Returns:
+          List[NodeBatch]: The two batches.
+
+        Raises:
+          ValueError: If the batch has fewer than two nodes.
+        """
+        if len(self.nodes) < 2:
+            raise ValueError("Can't split a batch with fewer than two nodes!")
+        middle = len(self.nodes) // 2
+        return [
+            replace(self, nodes=self.nodes[:middle]),
+            replace(self, nodes=self.nodes[middle:]),
+        ]
+
+    def fits(self, node: Node) -> bool:
+        """
+        Checks if a node fits in the batch.
+
+        Args:
+          node (Node): The node to check.
+
+        Returns:
+          bool: Whether the node fits in the space available and the maximum batch size.
+        """
+        if self.max_batch_size and len(self.nodes) + 1 > self.max_batch_size:
+            return False
+        return self.space_available - self.cost(node) >= 0
 
     def add(self, node: Node):
         """
@@ -155,26 +368,431 @@ class NodeBatch:
         Raises:
           ValueError: If there is no space available in the batch.
         """
-        if self.space_available - node.tokens < 0 or (
-            self.max_batch_size and len(self.nodes) + 1 > self.max_batch_size
-        ):
+        if not self.fits(node):
             raise ValueError("No space available in batch!")
         self.nodes.append(node)
 
 
-def extract_background(tree):
+def extract_background(
+    tree,
+    tokenizer: Optional[Tokenizer] = None,
+    index: Optional[FileIndex] = None,
+    level: str = "module",
+):
     """
     Extracts the background from a CST tree.
 
     Args:
       tree (cst.Module): The CST tree.
+      tokenizer (Optional[Tokenizer]): The tokenizer used to count tokens. Defaults to the shared gpt-4 tokenizer.
+      index (Optional[FileIndex]): An index of `tree`. Defaults to None.
+      level (str): The background level ("imports", "module", "signatures" or "full"). Defaults to "module".
+
+    Returns:
+      Background: The background of the tree. At the "signatures" level it includes a stub of every node and at the "full" level the whole tree.
+
+    Notes:
+      At the "imports" level the tree is expected to be reduced with `keep_imports` already.
+      At the "signatures" and "full" levels the nodes of a batch are counted twice
+      (as part of the background and as nodes), so batches are planned conservatively.
+    """
+    if level == "full":
+        code = index.code if index is not None and index.is_index_of(tree) else None
+        return Background(body=tree, tokenizer=tokenizer, code=code)
+    if level == "signatures":
+        index = index if index is not None and index.is_index_of(tree) else FileIndex(tree)
+        return Background(body=tree, tokenizer=tokenizer, code=index.render_stubbed([]))
+    all_node_names = get_node_names(tree, force=True, index=index)
+    background = remove_nodes_from_tree(tree, all_node_names, index=index)
+    return Background(body=background, tokenizer=tokenizer)
+
+
+def plan_greedy(
+    nodes: List[Node], create_batch: Callable[[], NodeBatch]
+) -> List[NodeBatch]:
+    """
+    Fills batches in source order, starting a new batch as soon as a node doesn't fit.
+
+    Args:
+      nodes (List[Node]): The nodes to batch.
+      create_batch (Callable[[], NodeBatch]): Creates an empty batch.
+
+    Returns:
+      List[NodeBatch]: The batches.
+
+    Raises:
+      ValueError: If a node doesn't fit in an empty batch.
+    """
+    batches = []
+    current_batch = create_batch()
+    for node in nodes:
+        try:
+            current_batch.add(node)
+        except ValueError:
+            # full
+            batches.append(current_batch)
+            current_batch = create_batch()
+            current_batch.add(node)
+    batches.append(current_batch)
+    return batches
+
+
+def plan_first_fit_decreasing(
+    nodes: List[Node], create_batch: Callable[[], NodeBatch]
+) -> List[NodeBatch]:
+    """
+    Packs the nodes into as few batches as possible with first-fit-decreasing bin packing.
+
+    Args:
+      nodes (List[Node]): The nodes to batch.
+      create_batch (Callable[[], NodeBatch]): Creates an empty batch.
+
+    Returns:
+      List[NodeBatch]: The batches, with the nodes of each batch in source order.
+
+    Raises:
+      ValueError: If a node doesn't fit in an empty batch.
+
+    Notes:
+      First-fit-decreasing never uses more than 11/9 of the optimal number of batches (plus one).
+    """
+    batches: List[NodeBatch] = []
+    for node in sorted(nodes, key=lambda n: n.tokens, reverse=True):
+        for batch in batches:
+            if batch.fits(node):
+                batch.add(node)
+                break
+        else:
+            batch = create_batch()
+            batch.add(node)
+            batches.append(batch)
+    return _sort_by_source(batches, nodes) or [create_batch()]
+
+
+def _sort_by_source(batches: List[NodeBatch], nodes: List[Node]) -> List[NodeBatch]:
+    order = {id(node): i for i, node in enumerate(nodes)}
+    for batch in batches:
+        batch.nodes.sort(key=lambda n: order[id(n)])
+    batches.sort(key=lambda b: order[id(b.nodes[0])])
+    return batches
+
+
+@dataclass
+class LatencyModel:
+    """
+    Estimates how long it takes to complete a set of requests.
+
+    Args:
+      time_to_first_token (float): The fixed overhead of a request in seconds.
+      prefill_rate (float): The number of prompt tokens processed per second.
+      output_rate (float): The number of tokens generated per second.
+      requests_per_minute (Optional[float]): The requests per minute budget, None if unlimited.
+      tokens_per_minute (Optional[float]): The tokens per minute budget, None if unlimited.
+    """
+
+    time_to_first_token: float = 0.5
+    prefill_rate: float = 5000
+    output_rate: float = 50
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+
+    def request_time(self, batch: NodeBatch) -> float:
+        """
+        Estimates how long a batch takes to complete.
+
+        Args:
+          batch (NodeBatch): The batch.
+
+        Returns:
+          float: The time in seconds. The response of each node is generated serially.
+        """
+        output_tokens = sum(getattr(n, "response_size", 0) for n in batch.nodes)
+        input_tokens = batch.tokens - output_tokens
+        return (
+            self.time_to_first_token
+            + input_tokens / self.prefill_rate
+            + output_tokens / self.output_rate
+        )
+
+    def completion_time(self, batches: List[NodeBatch], concurrency: int) -> float:
+        """
+        Estimates how long it takes to complete every batch.
+
+        Args:
+          batches (List[NodeBatch]): The batches.
+          concurrency (int): The number of requests that can run at once.
+
+        Returns:
+          float: The time in seconds until the last batch completes.
+        """
+        slots = [0.0] * max(1, min(concurrency, len(batches)))
+        for time in sorted((self.request_time(b) for b in batches), reverse=True):
+            heapq.heapreplace(slots, slots[0] + time)
+        completion_time = max(slots)
+        # the budgets start full, so only the excess has to wait for them to refill
+        if self.requests_per_minute:
+            excess = len(batches) - self.requests_per_minute
+            completion_time = max(completion_time, excess / self.requests_per_minute * 60)
+        if self.tokens_per_minute:
+            excess = sum(b.tokens for b in batches) - self.tokens_per_minute
+            completion_time = max(completion_time, excess / self.tokens_per_minute * 60)
+        return completion_time
+
+
+def plan_balanced(
+    nodes: List[Node], create_batch: Callable[[], NodeBatch], count: int
+) -> List[NodeBatch]:
+    """
+    Spreads the nodes over a number of batches, adding each node to the emptiest batch it fits in.
+
+    Args:
+      nodes (List[Node]): The nodes to batch.
+      create_batch (Callable[[], NodeBatch]): Creates an empty batch.
+      count (int): The number of batches to spread the nodes over. More are added if the nodes don't fit.
 
     Returns:
-      Background: The background of the tree.
+      List[NodeBatch]: The non-empty batches, with the nodes of each batch in source order.
+
+    Raises:
+      ValueError: If a node doesn't fit in an empty batch.
+    """
+    batches = [create_batch() for _ in range(count)]
+    for node in sorted(nodes, key=lambda n: n.tokens, reverse=True):
+        candidates = [b for b in batches if b.fits(node)]
+        if candidates:
+            min(candidates, key=lambda b: b.tokens).add(node)
+        else:
+            batch = create_batch()
+            batch.add(node)
+            batches.append(batch)
+    return _sort_by_source([b for b in batches if b.nodes], nodes)
+
+
+def plan_latency(
+    nodes: List[Node],
+    create_batch: Callable[[], NodeBatch],
+    concurrency: int = 1,
+    latency_model: Optional[LatencyModel] = None,
+) -> List[NodeBatch]:
     """
-    all_node_names = get_node_names(tree, force=True)
-    background = remove_nodes_from_tree(tree, all_node_names)
-    return Background(body=background)
+    Splits the nodes into the batches expected to complete soonest when requested concurrently.
+
+    Args:
+      nodes (List[Node]): The nodes to batch.
+      create_batch (Callable[[], NodeBatch]): Creates an empty batch.
+      concurrency (int, optional): The number of requests that can run at once. Defaults to 1.
+      latency_model (Optional[LatencyModel], optional): Estimates the completion time of the batches. Defaults to LatencyModel().
+
+    Returns:
+      List[NodeBatch]: The batches.
+
+    Raises:
+      ValueError: If a node doesn't fit in an empty batch.
+
+    Notes:
+      Starts from the fewest batches (first-fit-decreasing) and tries up to `concurrency`
+      batches. Splitting sends the background more than once, so it only pays off while the
+      responses generated in parallel save more time than the extra prompt tokens cost.
+    """
+    latency_model = latency_model or LatencyModel()
+    best = plan_first_fit_decreasing(nodes, create_batch)
+    best_time = latency_model.completion_time(best, concurrency)
+    for count in range(len(best) + 1, min(len(nodes), concurrency) + 1):
+        batches = plan_balanced(nodes, create_batch, count)
+        time = latency_model.completion_time(batches, concurrency)
+        if time < best_time:
+            best, best_time = batches, time
+    return best
+
+
+planners: Dict[str, Callable[[List[Node], Callable[[], NodeBatch]], List[NodeBatch]]] = {
+    "greedy": plan_greedy,
+    "ffd": plan_first_fit_decreasing,
+}
+
+
+def _check_plan_options(planner: str, optimize: str) -> None:
+    if planner not in planners:
+        raise ValueError(f"Planner '{planner}' not found!")
+    if optimize not in ("tokens", "latency"):
+        raise ValueError(f"Can't optimize for '{optimize}'!")
+
+
+def _plan(nodes, create_batch, planner, optimize, concurrency, latency_model):
+    if optimize == "latency":
+        return plan_latency(nodes, create_batch, concurrency, latency_model)
+    return planners[planner](nodes, create_batch)
+
+
+def _fit_background(
+    tree: cst.Module,
+    index: FileIndex,
+    tokenizer: Tokenizer,
+    level: str,
+    budget: Optional[int],
+) -> Tuple[str, cst.Module, FileIndex, Optional[Background]]:
+    # step down from the requested level until the background fits the budget
+    levels = BACKGROUND_LEVELS[: BACKGROUND_LEVELS.index(level) + 1]
+    for level in reversed(levels):
+        if level == "none":
+            return level, tree, index, None
+        level_tree, level_index = tree, index
+        if level == "imports":
+            level_tree = keep_imports(tree)
+            if level_tree is not tree:
+                level_index = FileIndex(level_tree)
+        background = extract_background(
+            level_tree, tokenizer=tokenizer, index=level_index, level=level
+        )
+        if budget is None or background.tokens <= budget:
+            return level, level_tree, level_index, background
+
+
+def _create_empty_batch(
+    index: FileIndex,
+    background: Optional[Background],
+    max_tokens: int,
+    prompt_size: int,
+    max_batch_size: Optional[int],
+    background_level: str,
+) -> NodeBatch:
+    return NodeBatch(
+        tree=index.tree,
+        max_tokens=max_tokens,
+        prompt_size=prompt_size,
+        background=background,
+        max_batch_size=max_batch_size,
+        send_node_context=background_level == "full",
+        index=index,
+        background_level=background_level,
+    )
+
+
+def prepare_nodes(
+    tree,
+    node_names,
+    max_tokens,
+    prompt_size,
+    response_size_per_node,
+    max_batch_size=None,
+    send_background_context=True,
+    send_node_context=True,
+    remove_docstrings=True,
+    model_name="gpt-4",
+    index: Optional[FileIndex] = None,
+    background_level: Optional[str] = None,
+    background_budget: Optional[int] = None,
+    max_literal_length: Optional[int] = MAX_LITERAL_LENGTH,
+    minify: bool = False,
+) -> Tuple[List[Node], Callable[[], NodeBatch]]:
+    """
+    Creates the nodes of a tree and a factory for empty batches of them, ready to be planned.
+
+    Args:
+      tree (cst.Module): The tree to create nodes from.
+      node_names (List[str]): The names of the nodes.
+      max_tokens (int): The maximum number of tokens per batch.
+      prompt_size (int): The size of the prompt for each node.
+      response_size_per_node (int): The size of the response for each node.
+      max_batch_size (Optional[int]): The maximum number of nodes per batch.
+      send_background_context (bool): Whether to send background context.
+      send_node_context (bool): Whether to send node context.
+      remove_docstrings (bool): Whether to remove docstrings from the tree.
+      model_name (str): The name of the model, used to count tokens.
+      index (Optional[FileIndex]): An index of `tree`. Built if not given.
+      background_level (Optional[str]): How much of the rest of the file to send, one of BACKGROUND_LEVELS. Defaults to the level of `send_background_context` and `send_node_context`.
+      background_budget (Optional[int]): The maximum number of background tokens per batch. Lower levels are used until the background fits. Defaults to None (the background only has to leave room for the largest node).
+      max_literal_length (Optional[int]): The length of the longest literal assigned outside of functions and of the classes being documented that isn't elided. None keeps every literal. Defaults to MAX_LITERAL_LENGTH.
+      minify (bool): Whether to minify the tree (see `minify_tree`) and record the tokens saved. Defaults to False.
+
+    Returns:
+      Tuple[List[Node], Callable[[], NodeBatch]]: The counted nodes and a function creating an empty batch.
+
+    Raises:
+      ValueError: If the background level doesn't exist.
+
+    Notes:
+      Nodes too big for a request are shrunk (see `shrink_node`) and marked with how they were shrunk.
+    """
+    if background_level is None:
+        background_level = (
+            "full"
+            if send_node_context
+            else "module"
+            if send_background_context
+            else "none"
+        )
+    if background_level not in BACKGROUND_LEVELS:
+        raise ValueError(f"Background level '{background_level}' not found!")
+    if index is None or not index.is_index_of(tree):
+        index = FileIndex(tree)
+    if remove_docstrings:
+        tree = remove_docstrings_from_tree(tree, node_names, index=index)
+        index = FileIndex(tree)
+    if max_literal_length is not None:
+        # only in the background, the nodes being documented are sent as they are
+        elided_tree = elide_literals(tree, max_literal_length, keep=node_names)
+        if elided_tree is not tree:
+            tree, index = elided_tree, FileIndex(elided_tree)
+    tokenizer = get_tokenizer(model_name)
+    if minify:
+        unminified_tree, unminified_index = tree, index
+        unminified_counts = index.count_tokens(tokenizer, node_names)
+        tree = minify_tree(tree, node_names, index=index)
+        index = FileIndex(tree)
+    # count every node at once so uncached nodes are encoded in parallel
+    counts = index.count_tokens(tokenizer, node_names)
+    # nodes that can't fit in a request on their own are shrunk to half of it,
+    # leaving the other half for the background, or to all of it if they must
+    available = max_tokens - prompt_size - response_size_per_node
+    shrunk = {}
+    for i, (node_name, count) in enumerate(zip(node_names, counts)):
+        if count > available:
+            code, description = shrink_node(
+                index[node_name].node, available // 2, tokenizer.count, limit=available
+            )
+            shrunk[node_name] = (code, description)
+            counts[i] = tokenizer.count(code)
+    # the background has to leave room for the largest node
+    budget = max_tokens - prompt_size - max(counts, default=0) - response_size_per_node
+    if background_budget is not None:
+        budget = min(budget, background_budget)
+    background_level, tree, index, background = _fit_background(
+        tree, index, tokenizer, background_level, budget
+    )
+    if minify and background:
+        _, _, _, unminified_background = _fit_background(
+            unminified_tree, unminified_index, tokenizer, background_level, None
+        )
+        background.saved_tokens = unminified_background.tokens - background.tokens
+
+    # a partial rather than a closure, so planned batches can be sent between processes
+    create_batch = partial(
+        _create_empty_batch,
+        index,
+        background,
+        max_tokens=max_tokens,
+        prompt_size=prompt_size,
+        max_batch_size=max_batch_size,
+        background_level=background_level,
+    )
+    nodes = [
+        Node(
+            tree=tree,
+            node_name=node_name,
+            response_size=response_size_per_node,
+            tokenizer=tokenizer,
+            index=index,
+        )
+        for node_name in node_names
+    ]
+    for i, (node, count) in enumerate(zip(nodes, counts)):
+        node.tokens = count + response_size_per_node
+        if minify:
+            node.saved_tokens = unminified_counts[i] - count
+        if node.name in shrunk:
+            node.code, node.shrunk = shrunk[node.name]
+    return nodes, create_batch
 
 
 def create_batches(
@@ -187,6 +805,17 @@ def create_batches(
     send_background_context=True,
     send_node_context=True,
     remove_docstrings=True,
+    model_name="gpt-4",
+    index: Optional[FileIndex] = None,
+    planner="ffd",
+    optimize="tokens",
+    concurrency=1,
+    latency_model: Optional[LatencyModel] = None,
+    background_level: Optional[str] = None,
+    background_budget: Optional[int] = None,
+    max_literal_length: Optional[int] = MAX_LITERAL_LENGTH,
+    minify: bool = False,
+    release: bool = True,
 ) -> List[NodeBatch]:
     """
     Creates batches of nodes from a tree.
@@ -201,52 +830,421 @@ def create_batches(
       send_background_context (bool): Whether to send background context.
       send_node_context (bool): Whether to send node context.
       remove_docstrings (bool): Whether to remove docstrings from the tree.
+      model_name (str): The name of the model, used to count tokens.
+      index (Optional[FileIndex]): An index of `tree`. Built if not given.
+      planner (str): The batch planning strategy, one of `planners` ("greedy" or "ffd"). Defaults to "ffd".
+      optimize (str): Whether to minimise the number of "tokens" sent (using `planner`) or the "latency" of the file. Defaults to "tokens".
+      concurrency (int): The number of requests that can run at once, used to optimise latency. Defaults to 1.
+      latency_model (Optional[LatencyModel]): Estimates request times, used to optimise latency. Defaults to LatencyModel().
+      background_level (Optional[str]): How much of the rest of each file to send, one of BACKGROUND_LEVELS. Defaults to the level of `send_background_context` and `send_node_context`.
+      background_budget (Optional[int]): The maximum number of background tokens of a file per batch. Defaults to None (unlimited).
+      max_literal_length (Optional[int]): The length of the longest literal assigned outside of functions and of the classes being documented that isn't elided. Defaults to MAX_LITERAL_LENGTH.
+      minify (bool): Whether to minify the code sent (see `minify_tree`). Defaults to False.
+      release (bool): Whether to release the trees once the batches are planned (see `release_trees`). Defaults to True.
 
     Returns:
       List[NodeBatch]: A list of batches of nodes.
+
+    Raises:
+      ValueError: If the planner or optimisation doesn't exist or a node doesn't fit in an empty batch.
     """
-    if remove_docstrings:
-      tree = remove_docstrings_from_tree(tree, node_names)  # TODO: fix to use Class.method syntax
-    batches = []
-    background = None
-    if send_background_context:
-        background = extract_background(tree)
+    _check_plan_options(planner, optimize)
+    nodes, create_batch = prepare_nodes(
+        tree,
+        node_names,
+        max_tokens,
+        prompt_size,
+        response_size_per_node,
+        max_batch_size=max_batch_size,
+        send_background_context=send_background_context,
+        send_node_context=send_node_context,
+        remove_docstrings=remove_docstrings,
+        model_name=model_name,
+        index=index,
+        background_level=background_level,
+        background_budget=background_budget,
+        max_literal_length=max_literal_length,
+        minify=minify,
+    )
+    batches = _plan(nodes, create_batch, planner, optimize, concurrency, latency_model)
+    if release:
+        release_trees(batches)
+    return batches
 
-    def create_batch():
+
+FILE_HEADER = "# File: {}\n"
+QUALIFIER = "::"
+
+
+def qualify_name(file_key: str, node_name: str) -> str:
+    """
+    Qualifies a node name with the file it is in.
+
+    Args:
+      file_key (str): The key of the file.
+      node_name (str): The name of the node.
+
+    Returns:
+      str: The file-qualified name.
+
+    Examples:
+      >>> qualify_name("src/maths.py", "Calculator.add")
+      'src/maths.py::Calculator.add'
+    """
+    return f"{file_key}{QUALIFIER}{node_name}"
+
+
+def split_qualified_name(name: str) -> Tuple[str, str]:
+    """
+    Splits a file-qualified name into the file key and the node name.
+
+    Args:
+      name (str): The file-qualified name.
+
+    Returns:
+      Tuple[str, str]: The file key and the node name.
+
+    Examples:
+      >>> split_qualified_name("src/maths.py::Calculator.add")
+      ('src/maths.py', 'Calculator.add')
+    """
+    file_key, _, node_name = name.rpartition(QUALIFIER)
+    return file_key, node_name
+
+
+@dataclass
+class BatchFile:
+    """
+    A file whose nodes are batched together with the nodes of other files.
+
+    Args:
+      key (str): The key of the file, used to qualify its node names.
+      create_batch (Callable[[], NodeBatch]): Creates an empty batch of the file.
+      overhead (int): The tokens sent once per request containing nodes of the file (its header and background).
+    """
+
+    key: str
+    create_batch: Callable[[], NodeBatch] = field(repr=False)
+    overhead: int = 0
+
+
+class FileNode:
+    """
+    A node of a BatchFile, named by its file-qualified name.
+
+    Args:
+      file (BatchFile): The file of the node.
+      node (Node): The node.
+      tokens (Optional[int]): The tokens the node adds to a batch of its file. Defaults to the tokens of the node.
+    """
+
+    def __init__(self, file: BatchFile, node: Node, tokens: Optional[int] = None) -> None:
+        self.file = file
+        self.node = node
+        self.name = qualify_name(file.key, node.name)
+        self.tokens = node.tokens if tokens is None else tokens
+
+    @property
+    def shrunk(self) -> Optional[str]:
+        return self.node.shrunk
+
+    @property
+    def response_size(self) -> int:
+        return self.node.response_size
+
+
+@dataclass
+class CrossFileBatch:
+    """
+    A batch of nodes from several files, sent as one request.
+
+    The code of each file is rendered like a NodeBatch of that file and
+    prefixed with a header naming the file. The header and background of a
+    file are only counted once per batch.
+
+    Args:
+      max_tokens (int): The maximum number of tokens in the batch.
+      prompt_size (int): The size of the prompt.
+      nodes (List[FileNode]): The list of nodes in the batch.
+      max_batch_size (Optional[int]): The maximum size of the batch.
+    """
+
+    max_tokens: int
+    prompt_size: int
+    nodes: List[FileNode] = field(default_factory=list)
+    max_batch_size: Optional[int] = None
+    _code: Optional[Tuple[Tuple[str, ...], str]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    # kept up to date by `add`, so checking whether a node fits doesn't scan the batch
+    _files: Dict[str, BatchFile] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    _tokens: int = field(default=0, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        nodes, self.nodes = self.nodes, []
+        for node in nodes:
+            self._append(node)
+
+    @property
+    def files(self) -> List[BatchFile]:
+        """
+        Gets the files with nodes in the batch.
+
+        Returns:
+          List[BatchFile]: The files, in the order their first node was added.
+        """
+        return list(self._files.values())
+
+    @property
+    def tokens(self) -> int:
         """
-    Creates a batch of nodes from a tree.
+        Gets the number of tokens in the batch.
+
+        Returns:
+          int: The number of tokens in the batch.
+        """
+        return self.prompt_size + self._tokens
+
+    @property
+    def fill(self) -> float:
+        return self.tokens / self.max_tokens
+
+    @property
+    def node_names(self) -> List[str]:
+        return [n.name for n in self.nodes]
+
+    @property
+    def space_available(self) -> int:
+        return self.max_tokens - self.tokens
+
+    @property
+    def saved_tokens(self) -> int:
+        """
+        Gets the number of tokens saved by minifying the code of the batch.
+
+        Returns:
+          int: The tokens saved in the code of every file of the batch.
+        """
+        return sum(b.saved_tokens for b in self.file_batches().values())
+
+    def file_batches(self) -> Dict[str, NodeBatch]:
+        """
+        Splits the batch into a NodeBatch per file.
+
+        Returns:
+          Dict[str, NodeBatch]: The batch of each file, keyed by file key.
+        """
+        batches: Dict[str, NodeBatch] = {}
+        for node in self.nodes:
+            if node.file.key not in batches:
+                batches[node.file.key] = node.file.create_batch()
+            batches[node.file.key].nodes.append(node.node)
+        return batches
+
+    @property
+    def code(self) -> str:
+        """
+        Gets the code of the batch, rendering it once for the current nodes.
+
+        Returns:
+          str: The code of each file in the batch, prefixed with a header naming the file.
+        """
+        key = tuple(self.node_names)
+        if self._code is None or self._code[0] != key:
+            code = "\n".join(
+                FILE_HEADER.format(file_key) + batch.code
+                for file_key, batch in self.file_batches().items()
+            )
+            self._code = (key, code)
+        return self._code[1]
+
+    def release(self) -> None:
+        """
+        Drops the references to the trees of the files in the batch.
+        """
+        for batch in self.file_batches().values():
+            batch.release()
+
+    def split(self) -> List["CrossFileBatch"]:
+        """
+        Splits the batch into two batches with half of the nodes each.
+
+        Returns:
+          List[CrossFileBatch]: The two batches.
+
+        Raises:
+          ValueError: If the batch has fewer than two nodes.
+        """
+        if len(self.nodes) < 2:
+            raise ValueError("Can't split a batch with fewer than two nodes!")
+        middle = len(self.nodes) // 2
+        return [
+            replace(self, nodes=self.nodes[:middle]),
+            replace(self, nodes=self.nodes[middle:]),
+        ]
+
+    def fits(self, node: FileNode) -> bool:
+        """
+        Checks if a node fits in the batch.
+
+        Args:
+          node (FileNode): The node to check.
+
+        Returns:
+          bool: Whether the node (and the overhead of its file, if it is the first node of the file) fits in the batch.
+        """
+        if self.max_batch_size and len(self.nodes) + 1 > self.max_batch_size:
+            return False
+        tokens = node.tokens
+        if node.file.key not in self._files:
+            tokens += node.file.overhead
+        return self.space_available - tokens >= 0
+
+    def add(self, node: FileNode):
+        """
+        Adds a node to the batch.
+
+        Args:
+          node (FileNode): The node to add.
+
+        Raises:
+          ValueError: If there is no space available in the batch.
+        """
+        if not self.fits(node):
+            raise ValueError("No space available in batch!")
+        self._append(node)
+
+    def _append(self, node: FileNode) -> None:
+        if node.file.key not in self._files:
+            self._files[node.file.key] = node.file
+            self._tokens += node.file.overhead
+        self._tokens += node.tokens
+        self.nodes.append(node)
+
+
+def release_trees(batches: List[Union[NodeBatch, CrossFileBatch]]) -> None:
+    """
+    Drops the references of planned batches to the trees of their files, so the trees can be freed while the batches are requested.
 
     Args:
-      tree (cst.Module): The tree to create batches from.
+      batches (List[Union[NodeBatch, CrossFileBatch]]): The planned batches.
+    """
+    file_batches = [
+        file_batch
+        for batch in batches
+        for file_batch in (
+            batch.file_batches().values()
+            if isinstance(batch, CrossFileBatch)
+            else [batch]
+        )
+    ]
+    # the batches of a file share its index, which has to keep the code of all of them
+    indexes: Dict[int, Tuple[FileIndex, List[str]]] = {}
+    for batch in file_batches:
+        if batch.index is not None:
+            indexes.setdefault(id(batch.index), (batch.index, []))[1].extend(batch.node_names)
+    for index, names in indexes.values():
+        index.release(names)
+    for batch in file_batches:
+        batch.release()
+
+
+def create_cross_file_batches(
+    trees: Dict[str, cst.Module],
+    node_names: Dict[str, List[str]],
+    max_tokens,
+    prompt_size,
+    response_size_per_node,
+    max_batch_size=None,
+    send_background_context=True,
+    send_node_context=True,
+    remove_docstrings=True,
+    model_name="gpt-4",
+    indexes: Optional[Dict[str, FileIndex]] = None,
+    planner="ffd",
+    optimize="tokens",
+    concurrency=1,
+    latency_model: Optional[LatencyModel] = None,
+    background_level: Optional[str] = None,
+    background_budget: Optional[int] = None,
+    max_literal_length: Optional[int] = MAX_LITERAL_LENGTH,
+    minify: bool = False,
+    release: bool = True,
+) -> List[CrossFileBatch]:
+    """
+    Creates batches of nodes from several trees, packing nodes of different files into the same batches.
+
+    Args:
+      trees (Dict[str, cst.Module]): The trees to create batches from, keyed by file key.
+      node_names (Dict[str, List[str]]): The names of the nodes of each tree to create batches for.
       max_tokens (int): The maximum number of tokens per batch.
-      prompt_size (int): The size of the prompt for each node.
-      background (Optional[cst.Module]): The background context for the batch.
+      prompt_size (int): The size of the prompt for each batch.
+      response_size_per_node (int): The size of the response for each node.
       max_batch_size (Optional[int]): The maximum number of nodes per batch.
+      send_background_context (bool): Whether to send the background of each file.
       send_node_context (bool): Whether to send node context.
+      remove_docstrings (bool): Whether to remove docstrings from the trees.
+      model_name (str): The name of the model, used to count tokens.
+      indexes (Optional[Dict[str, FileIndex]]): An index of each tree. Built if not given.
+      planner (str): The batch planning strategy, one of `planners`. Defaults to "ffd".
+      optimize (str): Whether to minimise the number of "tokens" sent or the "latency". Defaults to "tokens".
+      concurrency (int): The number of requests that can run at once, used to optimise latency. Defaults to 1.
+      latency_model (Optional[LatencyModel]): Estimates request times, used to optimise latency. Defaults to LatencyModel().
+      background_level (Optional[str]): How much of the rest of each file to send, one of BACKGROUND_LEVELS. Defaults to the level of `send_background_context` and `send_node_context`.
+      background_budget (Optional[int]): The maximum number of background tokens of a file per batch. Defaults to None (unlimited).
+      max_literal_length (Optional[int]): The length of the longest literal assigned outside of functions and of the classes being documented that isn't elided. Defaults to MAX_LITERAL_LENGTH.
+      minify (bool): Whether to minify the code sent (see `minify_tree`). Defaults to False.
+      release (bool): Whether to release the trees once the batches are planned (see `release_trees`). Defaults to True.
 
     Returns:
-      NodeBatch: A batch of nodes.
+      List[CrossFileBatch]: A list of batches, with nodes named `<file key>::<node name>`.
+
+    Raises:
+      ValueError: If the planner or optimisation doesn't exist or a node doesn't fit in an empty batch.
     """
-        return NodeBatch(
-            tree=tree,
+    _check_plan_options(planner, optimize)
+    indexes = indexes or {}
+    tokenizer = get_tokenizer(model_name)
+    nodes: List[FileNode] = []
+    for file_key, tree in trees.items():
+        file_nodes, create_batch = prepare_nodes(
+            tree,
+            node_names[file_key],
+            max_tokens,
+            prompt_size,
+            response_size_per_node,
+            send_background_context=send_background_context,
+            send_node_context=send_node_context,
+            remove_docstrings=remove_docstrings,
+            model_name=model_name,
+            index=indexes.get(file_key),
+            background_level=background_level,
+            background_budget=background_budget,
+            max_literal_length=max_literal_length,
+            minify=minify,
+        )
+        empty_batch = create_batch()
+        file = BatchFile(
+            key=file_key,
+            create_batch=create_batch,
+            overhead=tokenizer.count(FILE_HEADER.format(file_key))
+            + empty_batch.tokens
+            - prompt_size,
+        )
+        nodes.extend(
+            FileNode(file, node, tokens=empty_batch.cost(node)) for node in file_nodes
+        )
+
+    def create_batch():
+        return CrossFileBatch(
             max_tokens=max_tokens,
             prompt_size=prompt_size,
-            background=background,
             max_batch_size=max_batch_size,
-            send_node_context=send_node_context,
         )
 
-    current_batch = create_batch()
-    for node_name in node_names:
-        node = Node(
-            tree=tree, node_name=node_name, response_size=response_size_per_node
-        )
-        try:
-            current_batch.add(node)
-        except ValueError:
-            # full
-            batches.append(current_batch)
-            current_batch = create_batch()
-            current_batch.add(node)
-    batches.append(current_batch)
+    batches = _plan(nodes, create_batch, planner, optimize, concurrency, latency_model)
+    if release:
+        release_trees(batches)
     return batches
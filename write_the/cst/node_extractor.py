@@ -44,13 +44,14 @@ class NodeExtractor(cst.CSTVisitor):
         self.current_class = None
 
 
-def extract_nodes_from_tree(tree, nodes):
+def extract_nodes_from_tree(tree, nodes, index=None):
     """
     Extracts specified nodes from a CST tree.
 
     Args:
       tree (cst.CSTNode): The CST tree to extract nodes from.
       nodes (list of str): A list of node names to extract.
+      index (FileIndex, optional): An index of `tree` to look the nodes up in instead of traversing it. Defaults to None.
 
     Returns:
       list of cst.CSTNode: A list of extracted nodes.
@@ -59,12 +60,18 @@ def extract_nodes_from_tree(tree, nodes):
       >>> extract_nodes_from_tree(tree, ['FunctionDef', 'ClassDef'])
       [cst.FunctionDef, cst.ClassDef]
     """
+    if index is not None and index.is_index_of(tree):
+        return index.extract(nodes)
     extractor = NodeExtractor(nodes)
     tree.visit(extractor)
     return extractor.extracted_nodes
 
 
-def extract_node_from_tree(tree, node) -> Optional[cst.CSTNode]:
+def extract_node_from_tree(tree, node, index=None) -> Optional[cst.CSTNode]:
+    if index is not None and index.is_index_of(tree):
+        if node not in index:
+            raise ValueError(f"Could not find node: {node}!")
+        return index[node].node
     extractor = NodeExtractor([node])
     tree.visit(extractor)
     if not extractor.extracted_nodes:
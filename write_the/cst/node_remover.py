@@ -2,15 +2,36 @@ import libcst as cst
 
 
 class NodeRemover(cst.CSTTransformer):
-    def __init__(self, nodes):
+    def __init__(self, nodes, index=None):
         """
         Initializes a NodeRemover instance.
 
         Args:
           nodes (list): A list of nodes to remove.
+          index (FileIndex, optional): An index of the tree to be transformed. Nodes are then matched by identity and subtrees without matching nodes are skipped. Defaults to None.
         """
         self.nodes = nodes
         self.current_class = None
+        self.targets = None
+        self.enclosing = None
+        if index is not None:
+            self.targets = index.node_ids(nodes)
+            self.enclosing = index.enclosing_ids(nodes)
+
+    def is_target(self, original_node, name: str) -> bool:
+        if self.targets is not None:
+            return id(original_node) in self.targets
+        return name in self.nodes
+
+    def should_descend(self, node) -> bool:
+        return self.enclosing is None or id(node) in self.enclosing
+
+    def visit_SimpleStatementLine(self, node: cst.SimpleStatementLine) -> bool:
+        # functions and classes are never nested in simple statements
+        return False
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> bool:
+        return self.should_descend(node)
 
     def leave_FunctionDef(
         self, original_node: cst.FunctionDef, updated_node: cst.FunctionDef
@@ -30,12 +51,13 @@ class NodeRemover(cst.CSTTransformer):
             if self.current_class
             else original_node.name.value
         )
-        if name in self.nodes:
+        if self.is_target(original_node, name):
             return cst.RemoveFromParent()
         return updated_node
 
-    def visit_ClassDef(self, original_node: cst.ClassDef) -> None:
+    def visit_ClassDef(self, original_node: cst.ClassDef) -> bool:
         self.current_class = original_node.name.value
+        return self.should_descend(original_node)
 
     def leave_ClassDef(
         self, original_node: cst.ClassDef, updated_node: cst.ClassDef
@@ -51,23 +73,26 @@ class NodeRemover(cst.CSTTransformer):
           cst.RemovalSentinel: A sentinel indicating whether the node should be removed.
         """
         self.current_class = None
-        if original_node.name.value in self.nodes:
+        if self.is_target(original_node, original_node.name.value):
             return cst.RemoveFromParent()
 
         return updated_node
 
 
-def remove_nodes_from_tree(tree, nodes):
+def remove_nodes_from_tree(tree, nodes, index=None):
     """
     Removes specified nodes from a CST tree.
 
     Args:
       tree (cst.CSTNode): The CST tree to remove nodes from.
       nodes (list): A list of nodes to remove.
+      index (FileIndex, optional): An index of `tree` used to skip subtrees without nodes to remove. Defaults to None.
 
     Returns:
       cst.CSTNode: The updated CST tree after removal of specified nodes.
     """
-    remover = NodeRemover(nodes)
+    if index is not None and not index.is_index_of(tree):
+        index = None
+    remover = NodeRemover(nodes, index=index)
     tree = tree.visit(remover)
     return tree
@@ -0,0 +1,192 @@
+import textwrap
+from typing import Callable, Optional, Tuple, Union
+import libcst as cst
+from .utils import get_code_from_node
+
+
+def _stub_body() -> cst.SimpleStatementSuite:
+    return cst.SimpleStatementSuite(body=[cst.Expr(cst.Ellipsis())])
+
+
+class MethodStubber(cst.CSTTransformer):
+    """
+    A CSTTransformer that reduces every function to a stub (its signature and `...`).
+    """
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> bool:
+        return False
+
+    def leave_FunctionDef(
+        self, original_node: cst.FunctionDef, updated_node: cst.FunctionDef
+    ) -> cst.FunctionDef:
+        return updated_node.with_changes(body=_stub_body())
+
+
+def class_skeleton(node: cst.ClassDef) -> cst.ClassDef:
+    """
+    Reduces a class to its skeleton, with every method stubbed.
+
+    Args:
+      node (cst.ClassDef): The class.
+
+    Returns:
+      cst.ClassDef: The class with the bodies of its methods replaced by `...`.
+
+    Examples:
+      >>> get_code_from_node(class_skeleton(cst.parse_statement("class A:\\n    def f(self):\\n        return 1\\n")))
+      'class A:\\n    def f(self): ...\\n'
+    """
+    return node.visit(MethodStubber())
+
+
+def _is_key_statement(statement: cst.BaseStatement) -> bool:
+    # the return value or exception at the end of a function says the most about it
+    return isinstance(statement, cst.SimpleStatementLine) and any(
+        isinstance(s, (cst.Return, cst.Raise)) for s in statement.body
+    )
+
+
+def _truncation_marker(count: int) -> cst.SimpleStatementLine:
+    return cst.SimpleStatementLine(
+        body=[cst.Expr(cst.Ellipsis())],
+        trailing_whitespace=cst.TrailingWhitespace(
+            whitespace=cst.SimpleWhitespace("  "),
+            comment=cst.Comment(
+                f"# {count} statement{'s' if count != 1 else ''} truncated"
+            ),
+        ),
+    )
+
+
+def truncate_body(
+    node: Union[cst.FunctionDef, cst.ClassDef],
+    max_tokens: int,
+    count_tokens: Callable[[str], int],
+) -> Tuple[Union[cst.FunctionDef, cst.ClassDef], int]:
+    """
+    Truncates the body of a function or class so its code fits in a number of tokens.
+
+    The signature, the leading statements that fit and the final return (or raise)
+    of a function are kept, the rest is replaced with `...` and a comment.
+
+    Args:
+      node (Union[cst.FunctionDef, cst.ClassDef]): The function or class.
+      max_tokens (int): The maximum number of tokens in the code of the truncated node.
+      count_tokens (Callable[[str], int]): Counts the tokens in a text.
+
+    Returns:
+      Tuple[Union[cst.FunctionDef, cst.ClassDef], int]: The truncated node and the number of statements removed.
+    """
+    if not isinstance(node.body, cst.IndentedBlock):
+        return node, 0
+    body = list(node.body.body)
+    tail = []
+    if isinstance(node, cst.FunctionDef) and body and _is_key_statement(body[-1]):
+        tail = [body.pop()]
+    empty = node.with_changes(
+        body=node.body.with_changes(body=[_truncation_marker(len(body))] + tail)
+    )
+    budget = max_tokens - count_tokens(get_code_from_node(empty))
+    if budget < 0 and tail:
+        # even the final statement doesn't fit
+        body, tail = body + tail, []
+        empty = node.with_changes(
+            body=node.body.with_changes(body=[_truncation_marker(len(body))])
+        )
+        budget = max_tokens - count_tokens(get_code_from_node(empty))
+    indent = "    " if node.body.indent is None else node.body.indent
+    kept = []
+    for statement in body:
+        code = cst.Module(body=[]).code_for_node(statement)
+        tokens = count_tokens(textwrap.indent(code, indent))
+        if tokens > budget:
+            break
+        kept.append(statement)
+        budget -= tokens
+    if len(kept) == len(body):
+        return node, 0
+    while True:
+        removed = len(body) - len(kept)
+        truncated_body = kept + [_truncation_marker(removed)] + tail
+        truncated = node.with_changes(body=node.body.with_changes(body=truncated_body))
+        # counting the parts separately can underestimate the whole
+        if not kept or count_tokens(get_code_from_node(truncated)) <= max_tokens:
+            return truncated, removed
+        kept.pop()
+
+
+def signature_stub(
+    node: Union[cst.FunctionDef, cst.ClassDef], keep_parameters: bool = True
+) -> Union[cst.FunctionDef, cst.ClassDef]:
+    """
+    Reduces a function or class to its signature, without decorators or body.
+
+    Args:
+      node (Union[cst.FunctionDef, cst.ClassDef]): The function or class.
+      keep_parameters (bool, optional): Whether to keep the parameters and return annotation (or base classes), otherwise only the name is kept. Defaults to True.
+
+    Returns:
+      Union[cst.FunctionDef, cst.ClassDef]: The stub, with `...` as its body.
+
+    Examples:
+      >>> get_code_from_node(signature_stub(cst.parse_statement("@cache\ndef f(a: int) -> int:\n    return a\n")))
+      'def f(a: int) -> int: ...\n'
+    """
+    node = node.with_changes(decorators=[], body=_stub_body(), leading_lines=[])
+    if keep_parameters:
+        return node
+    if isinstance(node, cst.FunctionDef):
+        return node.with_changes(params=cst.Parameters(), returns=None)
+    return node.with_changes(
+        bases=[], keywords=[], lpar=cst.MaybeSentinel.DEFAULT, rpar=cst.MaybeSentinel.DEFAULT
+    )
+
+
+def shrink_node(
+    node: Union[cst.FunctionDef, cst.ClassDef],
+    max_tokens: int,
+    count_tokens: Callable[[str], int],
+    limit: Optional[int] = None,
+) -> Tuple[str, str]:
+    """
+    Shrinks a function or class that is too big to be documented in one request.
+
+    Classes are reduced to their skeleton (their methods are documented separately),
+    function bodies (and skeletons that are still too big) are truncated. Nodes whose
+    signature alone is too big are sent as a stub of their signature, or of their name.
+
+    Args:
+      node (Union[cst.FunctionDef, cst.ClassDef]): The function or class.
+      max_tokens (int): The number of tokens the code of the shrunk node aims for.
+      count_tokens (Callable[[str], int]): Counts the tokens in a text.
+      limit (Optional[int], optional): The most tokens the code of the shrunk node can have, if it doesn't fit in `max_tokens`. Defaults to `max_tokens`.
+
+    Returns:
+      Tuple[str, str]: The code of the shrunk node and a description of how it was shrunk.
+
+    Notes:
+      The name-only stub is returned even if it doesn't fit, nothing smaller can be sent.
+    """
+    limit = max_tokens if limit is None else max(limit, max_tokens)
+    original = node
+    description = ""
+    if isinstance(node, cst.ClassDef):
+        node = class_skeleton(node)
+        code = get_code_from_node(node)
+        description = "class skeleton"
+        if count_tokens(code) <= max_tokens:
+            return code, description
+    for tokens in sorted({max_tokens, limit}):
+        truncated, removed = truncate_body(node, tokens, count_tokens)
+        code = get_code_from_node(truncated)
+        if count_tokens(code) <= tokens:
+            if removed:
+                truncated = f"truncated {removed} statement{'s' if removed != 1 else ''}"
+                description = f"{description}, {truncated}" if description else truncated
+            return code, description
+    # not even the signature and the start of the body fit
+    code = get_code_from_node(signature_stub(original))
+    if count_tokens(code) <= limit:
+        return code, "signature only"
+    code = get_code_from_node(signature_stub(original, keep_parameters=False))
+    return code, "name only, signature truncated"
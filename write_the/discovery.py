@@ -0,0 +1,303 @@
+import os
+import re
+from itertools import chain, islice
+from pathlib import Path
+from typing import (
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+T = TypeVar("T")
+
+# directories that hold environments, caches and build output rather than code
+DEFAULT_EXCLUDES = (
+    ".git/",
+    ".hg/",
+    ".svn/",
+    ".venv/",
+    "venv/",
+    ".tox/",
+    ".nox/",
+    ".eggs/",
+    "*.egg-info/",
+    "__pycache__/",
+    ".mypy_cache/",
+    ".pytest_cache/",
+    ".ruff_cache/",
+    "node_modules/",
+    "site-packages/",
+    # only at the top, as packages can have their own e.g. `build` module folder
+    "/build/",
+    "/dist/",
+)
+# larger modules are almost always generated or vendored, and don't fit a request anyway
+DEFAULT_MAX_SIZE = 500_000
+# the files of a cross-file group are parsed and planned together in one worker process
+CROSS_FILE_GROUP_FILES = 100
+CROSS_FILE_GROUP_BYTES = 1_000_000
+# how much of the start of a file is searched for a "generated" comment
+GENERATED_HEADER_SIZE = 2048
+GENERATED_FILE_NAMES = re.compile(r".*_pb2(_grpc)?\.pyi?$")
+GENERATED_COMMENT = re.compile(
+    rb"^\s*#.*(@generated|do not edit|auto-?generated|generated (by|from|with))",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def _path_spec(patterns: Iterable[str]):
+    import pathspec
+
+    patterns = [p for p in patterns if p.strip() and not p.lstrip().startswith("#")]
+    if not patterns:
+        return None
+    if hasattr(pathspec, "GitIgnoreSpec"):
+        return pathspec.GitIgnoreSpec.from_lines(patterns)
+    return pathspec.PathSpec.from_lines("gitwildmatch", patterns)
+
+
+def _last_match(spec, path: str) -> Optional[bool]:
+    # like git, the last matching pattern decides, so `!pattern` re-includes a path
+    result = None
+    for pattern in spec.patterns:
+        if pattern.include is not None and pattern.regex.match(path):
+            result = pattern.include
+    return result
+
+
+def _load_gitignore(directory: Path):
+    try:
+        with open(directory / ".gitignore", "r", errors="replace") as f:
+            return _path_spec(f.read().splitlines())
+    except OSError:
+        return None
+
+
+def _parent_gitignores(directory: Path) -> List[Tuple[Path, object]]:
+    # the .gitignore files of the repository above the directory, outermost first
+    directory = directory.resolve()
+    if (directory / ".git").exists():
+        return []
+    specs = []
+    for parent in directory.parents:
+        spec = _load_gitignore(parent)
+        if spec is not None:
+            specs.append((parent, spec))
+        if (parent / ".git").exists():
+            break
+    else:
+        # not in a repository
+        return []
+    return specs[::-1]
+
+
+def is_generated(file: Union[str, Path]) -> bool:
+    """
+    Checks if a Python file was generated by a tool, from its name or a comment at its top.
+
+    Args:
+      file (Union[str, Path]): The path to the file.
+
+    Returns:
+      bool: Whether the file is e.g. a protobuf module or has a "DO NOT EDIT" or "@generated" comment.
+
+    Examples:
+      >>> is_generated(Path("api/service_pb2.py"))
+      True
+    """
+    if GENERATED_FILE_NAMES.match(Path(file).name):
+        return True
+    try:
+        with open(file, "rb") as f:
+            header = f.read(GENERATED_HEADER_SIZE)
+    except OSError:
+        return False
+    return GENERATED_COMMENT.search(header) is not None
+
+
+def iter_python_files(
+    directory: Union[str, Path],
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    gitignore: bool = True,
+    max_size: Optional[int] = DEFAULT_MAX_SIZE,
+    skip_generated: bool = True,
+    on_skip: Optional[Callable[[Path, str], None]] = None,
+) -> Iterator[Path]:
+    """
+    Finds the Python files in a directory, yielding them as the directory is walked.
+
+    Args:
+      directory (Union[str, Path]): The directory to search.
+      include (Sequence[str], optional): Gitignore-style patterns, relative to the directory, of the only files to yield. Defaults to every file.
+      exclude (Sequence[str], optional): Gitignore-style patterns, relative to the directory, of files and folders to skip as well as the `DEFAULT_EXCLUDES`. Defaults to none.
+      gitignore (bool, optional): Whether to skip the files and folders ignored by the .gitignore files of the directory, its subfolders and its repository. Defaults to True.
+      max_size (Optional[int], optional): The size in bytes above which files are skipped, None to keep every file. Defaults to `DEFAULT_MAX_SIZE`.
+      skip_generated (bool, optional): Whether to skip generated files (see `is_generated`). Defaults to True.
+      on_skip (Optional[Callable[[Path, str], None]], optional): Called with each file skipped for its size or for being generated, and the reason. Defaults to None.
+
+    Returns:
+      Iterator[Path]: The files, joined to `directory`. Each folder's files come (by name) before its subfolders.
+
+    Notes:
+      Excluded folders aren't entered, and links to folders aren't followed. A
+      directory that doesn't exist has no files.
+
+    Examples:
+      >>> list(iter_python_files(Path("src"), exclude=["migrations/"]))
+      [PosixPath('src/app.py'), PosixPath('src/models/user.py')]
+    """
+    directory = Path(directory)
+    excluded = _path_spec([*DEFAULT_EXCLUDES, *exclude])
+    included = _path_spec(include)
+    ignores = _parent_gitignores(directory) if gitignore else []
+
+    def ignored(resolved: Path, relative: str, is_dir: bool) -> bool:
+        suffix = "/" if is_dir else ""
+        if excluded is not None and excluded.match_file(relative + suffix):
+            return True
+        # the .gitignore files closest to the path take precedence
+        for base, spec in reversed(ignores):
+            try:
+                path_in_base = resolved.relative_to(base).as_posix()
+            except ValueError:
+                continue
+            match = _last_match(spec, path_in_base + suffix)
+            if match is not None:
+                return match
+        return False
+
+    def skipped(entry: os.DirEntry, path: Path) -> Optional[str]:
+        if max_size:
+            try:
+                size = entry.stat().st_size
+            except OSError:
+                size = 0
+            if size > max_size:
+                return f"larger than {max_size:,} bytes ({size:,})"
+        if skip_generated and is_generated(path):
+            return "generated"
+        return None
+
+    def walk(folder: Path, resolved: Path, relative: str) -> Iterator[Path]:
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            return
+        spec = _load_gitignore(folder) if gitignore else None
+        if spec is not None:
+            # applies to this folder and its subfolders
+            ignores.append((resolved, spec))
+        folders = []
+        for entry in entries:
+            path = folder / entry.name
+            entry_relative = f"{relative}{entry.name}"
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if ignored(resolved / entry.name, entry_relative, is_dir):
+                continue
+            if is_dir:
+                folders.append(entry.name)
+                continue
+            if not entry.name.endswith(".py"):
+                continue
+            if included is not None and not included.match_file(entry_relative):
+                continue
+            reason = skipped(entry, path)
+            if reason is not None:
+                if on_skip is not None:
+                    on_skip(path, reason)
+                continue
+            yield path
+        for name in folders:
+            yield from walk(folder / name, resolved / name, f"{relative}{name}/")
+        if spec is not None:
+            ignores.pop()
+
+    yield from walk(directory, directory.resolve(), "")
+
+
+def discover_python_files(
+    paths: Iterable[Union[str, Path]], **options
+) -> Iterator[Path]:
+    """
+    Yields the given Python files and the Python files found in the given folders.
+
+    Args:
+      paths (Iterable[Union[str, Path]]): The files and folders.
+      **options: The options of `iter_python_files`, which only apply to the files found in folders.
+
+    Returns:
+      Iterator[Path]: The files, in the order of the paths.
+    """
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            yield from iter_python_files(path, **options)
+        else:
+            yield path
+
+
+def count_up_to(items: Iterable[T], limit: int) -> Tuple[int, Iterator[T]]:
+    """
+    Counts the items of an iterable, but not beyond a limit, without losing them.
+
+    Args:
+      items (Iterable[T]): The items, e.g. a generator of files.
+      limit (int): The most items to count (and to hold in memory).
+
+    Returns:
+      Tuple[int, Iterator[T]]: The number of items (`limit` if there are at least as many) and an iterator over all of the items.
+
+    Examples:
+      >>> count, files = count_up_to(iter_python_files(Path("src")), 33)
+    """
+    items = iter(items)
+    head = list(islice(items, limit))
+    return len(head), chain(head, items)
+
+
+def group_files(
+    files: Iterable[Path],
+    max_files: int = CROSS_FILE_GROUP_FILES,
+    max_bytes: int = CROSS_FILE_GROUP_BYTES,
+) -> Iterator[List[Path]]:
+    """
+    Packs files into consecutive groups of bounded size, as the files are found.
+
+    Args:
+      files (Iterable[Path]): The files, e.g. a generator of files.
+      max_files (int, optional): The most files in a group. Defaults to `CROSS_FILE_GROUP_FILES`.
+      max_bytes (int, optional): The most bytes of source code in a group, unless a single file is larger. Defaults to `CROSS_FILE_GROUP_BYTES`.
+
+    Returns:
+      Iterator[List[Path]]: The groups, in the order of the files.
+
+    Examples:
+      >>> list(group_files(iter_python_files(Path("src")), max_files=2))
+      [[PosixPath('src/app.py'), PosixPath('src/cli.py')], [PosixPath('src/models/user.py')]]
+    """
+    group: List[Path] = []
+    size = 0
+    for file in files:
+        try:
+            file_size = os.stat(file).st_size
+        except OSError:
+            # fails when it is loaded
+            file_size = 0
+        if group and (len(group) >= max_files or size + file_size > max_bytes):
+            yield group
+            group, size = [], 0
+        group.append(file)
+        size += file_size
+    if group:
+        yield group
@@ -1,4 +1,22 @@
 class FileSkippedError(Exception):
     """
     Exception raised when a file operation is intentionally skipped.
-    """
\ No newline at end of file
+    """
+
+
+class CacheMissError(Exception):
+    """
+    Exception raised when a response is not cached and only cached responses may be used.
+    """
+
+
+class GitError(Exception):
+    """
+    Exception raised when git can't be run or reports an error.
+    """
+
+
+class WorkerError(Exception):
+    """
+    Exception raised when a worker process dies (e.g. running out of memory) while processing a file.
+    """
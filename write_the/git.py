@@ -0,0 +1,183 @@
+import codecs
+import re
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from .errors import GitError
+
+# the first and last line of a range, counted from 1
+LineRange = Tuple[int, int]
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+# the first line and number of lines before and after a hunk
+Hunk = Tuple[int, int, int, int]
+
+
+def _run_git(args: List[str], cwd: Optional[Union[str, Path]] = None) -> str:
+    try:
+        result = subprocess.run(
+            ["git", *args], cwd=cwd, capture_output=True, text=True, check=False
+        )
+    except OSError as e:
+        raise GitError(f"git can't be run: {e}") from e
+    if result.returncode != 0:
+        raise GitError(result.stderr.strip() or f"git {args[0]} failed!")
+    return result.stdout
+
+
+def _unquote_path(path: str) -> str:
+    # git quotes paths with unusual characters C-style, with octal escapes for UTF-8 bytes
+    if path.startswith('"') and path.endswith('"'):
+        return codecs.escape_decode(path[1:-1].encode())[0].decode("utf-8")
+    return path
+
+
+def _parse_hunks(diff: str) -> Dict[str, List[Hunk]]:
+    # the hunks of each file that still exists, keyed by its path in the repository
+    hunks: Dict[str, List[Hunk]] = {}
+    current = None
+    in_header = False
+    for line in diff.splitlines():
+        if line.startswith("diff --git "):
+            current = None
+            in_header = True
+        elif in_header and line.startswith("+++ "):
+            path = _unquote_path(line[4:].rstrip("\t"))
+            # deleted files have no lines left
+            current = path[2:] if path.startswith("b/") else None
+            if current is not None:
+                hunks.setdefault(current, [])
+        elif line.startswith("@@"):
+            in_header = False
+            match = _HUNK_HEADER.match(line)
+            if current is None or match is None:
+                continue
+            old_start, old_count, new_start, new_count = match.groups()
+            hunks[current].append(
+                (
+                    int(old_start),
+                    1 if old_count is None else int(old_count),
+                    int(new_start),
+                    1 if new_count is None else int(new_count),
+                )
+            )
+    return hunks
+
+
+def parse_diff(diff: str) -> Dict[str, List[LineRange]]:
+    """
+    Parses the changed line ranges of each file from a `git diff --unified=0`.
+
+    Args:
+      diff (str): The output of `git diff --unified=0` with the `a/` and `b/` prefixes.
+
+    Returns:
+      Dict[str, List[LineRange]]: The ranges of added or changed lines of each file that still exists, keyed by its path in the repository. Where lines were only removed, the line before them is given.
+
+    Examples:
+      >>> parse_diff("diff --git a/m.py b/m.py\\n--- a/m.py\\n+++ b/m.py\\n@@ -3 +3,2 @@\\n-x\\n+y\\n+z\\n")
+      {'m.py': [(3, 4)]}
+    """
+    changed: Dict[str, List[LineRange]] = {}
+    for path, hunks in _parse_hunks(diff).items():
+        changed[path] = []
+        for _, _, start, count in hunks:
+            if count:
+                changed[path].append((start, start + count - 1))
+            else:
+                # lines were removed after `start`
+                changed[path].append((max(start, 1), max(start, 1)))
+    return changed
+
+
+def _map_line(line: int, hunks: List[Hunk], last: bool) -> int:
+    shift = 0
+    for old_start, old_count, new_start, new_count in hunks:
+        if old_count == 0:
+            # lines were added after `old_start`
+            if line <= old_start:
+                break
+        elif line < old_start:
+            break
+        elif line < old_start + old_count:
+            # the line was changed, it is now somewhere in the new lines
+            if new_count == 0:
+                return max(new_start, 1)
+            return new_start + new_count - 1 if last else new_start
+        shift += new_count - old_count
+    return line + shift
+
+
+def map_lines(ranges: List[LineRange], hunks: List[Hunk]) -> List[LineRange]:
+    """
+    Maps line ranges of a file onto the file after a diff of it.
+
+    Args:
+      ranges (List[LineRange]): The ranges of lines before the diff.
+      hunks (List[Hunk]): The hunks of the diff of the file, in order.
+
+    Returns:
+      List[LineRange]: The ranges of the same lines after the diff. Lines that were changed by the diff are mapped to the lines that replaced them.
+
+    Examples:
+      >>> map_lines([(10, 12)], [(2, 0, 3, 2)])
+      [(12, 14)]
+    """
+    return [
+        (_map_line(start, hunks, False), _map_line(end, hunks, True))
+        for start, end in ranges
+    ]
+
+
+def changed_lines(
+    since: Optional[str] = None,
+    staged: bool = False,
+    paths: Iterable[Union[str, Path]] = (),
+    cwd: Optional[Union[str, Path]] = None,
+) -> Dict[Path, List[LineRange]]:
+    """
+    Gets the lines changed in the files of a git repository.
+
+    Args:
+      since (Optional[str], optional): The commit (or branch or tag) to compare the files to. Defaults to the index (or HEAD with `staged`).
+      staged (bool, optional): Whether to compare the staged files instead of the working tree, e.g. in a pre-commit hook. Defaults to False.
+      paths (Iterable[Union[str, Path]], optional): The files and folders to look at. Defaults to the whole repository.
+      cwd (Optional[Union[str, Path]], optional): A directory in the repository. Defaults to the current directory.
+
+    Returns:
+      Dict[Path, List[LineRange]]: The ranges of changed lines of each changed file, keyed by its resolved path. Untracked files aren't included. With `staged` the ranges are those of the staged lines in the working tree, so unstaged changes above them don't shift them.
+
+    Raises:
+      GitError: If git can't be run, the directory isn't in a repository or the commit doesn't exist.
+
+    Examples:
+      >>> changed_lines(since="origin/main", paths=["src"])
+      {PosixPath('/repo/src/calc.py'): [(12, 15), (40, 40)]}
+    """
+    root = Path(_run_git(["rev-parse", "--show-toplevel"], cwd).strip())
+    args = [
+        "diff",
+        "--unified=0",
+        "--no-color",
+        "--no-ext-diff",
+        "--src-prefix=a/",
+        "--dst-prefix=b/",
+    ]
+    pathspec = ["--", *[str(path) for path in paths]]
+    diff_args = list(args)
+    if staged:
+        diff_args.append("--cached")
+    if since:
+        diff_args.append(since)
+    changed = parse_diff(_run_git(diff_args + pathspec, cwd))
+    if staged:
+        # the staged lines are numbered as in the index, but the files are read from
+        # the working tree, which may have unstaged changes above them
+        unstaged = _parse_hunks(_run_git(args + pathspec, cwd))
+        changed = {
+            path: map_lines(ranges, unstaged[path]) if path in unstaged else ranges
+            for path, ranges in changed.items()
+        }
+    return {
+        (root / path).resolve(): ranges for path, ranges in changed.items() if ranges
+    }
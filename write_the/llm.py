@@ -1,15 +1,28 @@
+import asyncio
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
-from langchain.llms import OpenAI
-from langchain.chat_models import ChatOpenAI
-import tiktoken
+from typing import AsyncIterator, Optional, Tuple
+from .backends import Backend, get_backend
+from .cache import LLMCache
+from .clients import get_client
+from .concurrency import get_limiter
+from .errors import CacheMissError
 from .models import models
+from .scheduler import get_scheduler
+from .tokenizer import get_tokenizer
 
 class LLM:
     """
     A class for running a Language Model Chain.
     """
-    def __init__(self, prompt: PromptTemplate, temperature=0, model_name="gpt-3.5-turbo-instruct"):
+    def __init__(
+        self,
+        prompt: PromptTemplate,
+        temperature=0,
+        model_name="gpt-3.5-turbo-instruct",
+        cache: Optional[LLMCache] = None,
+        backend: Optional[Backend] = None,
+    ):
         """
         Initializes the LLM class.
 
@@ -17,6 +30,8 @@ class LLM:
           prompt (PromptTemplate): The prompt template to use.
           temperature (int, optional): The temperature to use for the model. Defaults to 0.
           model_name (str, optional): The name of the model to use. Defaults to "gpt-3.5-turbo-instruct".
+          cache (Optional[LLMCache], optional): The cache to read responses from and write responses to. Defaults to None.
+          backend (Optional[Backend], optional): The backend that generates the responses. Defaults to the process-wide backend.
 
         Side Effects:
           Sets the class attributes.
@@ -25,9 +40,12 @@ class LLM:
           KeyError: If the model_name is not found in the models dictionary.
         """
         self.prompt = prompt
-        self.prompt_size = self.number_of_tokens(prompt.template)
         self.temperature = temperature
         self.model_name = model_name
+        self.prompt_size = self.number_of_tokens(prompt.template)
+        self.cache = cache
+        self._backend = backend
+        self._chain = None
         try:
             self.max_tokens = int(models[model_name]["context_window"])
         except KeyError:
@@ -37,27 +55,146 @@ class LLM:
             elif model_name.startswith('gpt-3'):
                 self.max_tokens = 4096
 
-    async def run(self, code, **kwargs):
+    @property
+    def backend(self) -> Backend:
+        """
+        Gets the backend that generates the responses.
+
+        Returns:
+          Backend: The backend.
+        """
+        return self._backend or get_backend()
+
+    @property
+    def chain(self) -> LLMChain:
+        """
+        Gets the chain for the prompt, backed by the shared client for the model.
+
+        Returns:
+          LLMChain: The chain.
+        """
+        if self._chain is None:
+            client = get_client(self.model_name, self.temperature)
+            self._chain = LLMChain(llm=client, prompt=self.prompt)
+        return self._chain
+
+    def get_cached(self, code, **kwargs) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Looks up the cached response for a request.
+
+        Args:
+          code (str): The code to use for the chain.
+          **kwargs (dict): Additional keyword arguments.
+
+        Returns:
+          Tuple[Optional[str], Optional[str]]: The cache key and the cached response, or None if there is no cache or response.
+
+        Raises:
+          CacheMissError: If the cache is offline and the response is not cached.
+        """
+        if self.cache is None:
+            return None, None
+        key = self.cache.key(
+            self.model_name,
+            self.temperature,
+            self.prompt.template,
+            {"code": code, **kwargs},
+            backend=self.backend.name,
+        )
+        cached = self.cache.get(key)
+        if cached is None and self.cache.offline:
+            raise CacheMissError("Response not found in cache!")
+        return key, cached
+
+    async def run(self, code, tokens: Optional[int] = None, **kwargs):
         """
         Runs the Language Model Chain asynchronously.
 
         Args:
           code (str): The code to use for the chain.
+          tokens (Optional[int], optional): The number of tokens the request will use. Defaults to the size of the prompt and code.
           **kwargs (dict): Additional keyword arguments.
 
         Returns:
           str: The generated text.
+
+        Raises:
+          CacheMissError: If the cache is offline and the response is not cached.
+
+        Notes:
+          Requests that are throttled or time out are retried after the delay requested by the API.
+        """
+        key, cached = self.get_cached(code, **kwargs)
+        if cached is not None:
+            return cached
+        scheduler = get_scheduler()
+        limiter = get_limiter()
+        if scheduler.is_limited(self.model_name) and tokens is None:
+            tokens = self.prompt_size + self.number_of_tokens(code)
+        attempt = 0
+        while True:
+            await scheduler.acquire(self.model_name, tokens)
+            try:
+                async with limiter.slot():
+                    result = await self.backend.complete(self, code=code, **kwargs)
+                break
+            except Exception as e:
+                delay = limiter.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+        if key is not None:
+            self.cache.set(key, result)
+        return result
+
+    async def stream(
+        self, code, tokens: Optional[int] = None, **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        Runs the Language Model Chain asynchronously, yielding the text as it is generated.
+
+        Args:
+          code (str): The code to use for the chain.
+          tokens (Optional[int], optional): The number of tokens the request will use. Defaults to the size of the prompt and code.
+          **kwargs (dict): Additional keyword arguments.
+
+        Yields:
+          str: The next chunk of generated text.
+
+        Raises:
+          CacheMissError: If the cache is offline and the response is not cached.
+
+        Notes:
+          Cached responses are yielded as a single chunk.
+          Requests are only retried if they fail before any text is generated.
         """
-        if "-instruct" in self.model_name:
-            llm = OpenAI(
-                temperature=self.temperature, max_tokens=-1, model_name=self.model_name
-            )
-        else:
-            llm = ChatOpenAI(
-                temperature=self.temperature, model_name=self.model_name
-            )
-        chain = LLMChain(llm=llm, prompt=self.prompt)
-        return await chain.apredict(code=code, **kwargs)
+        key, cached = self.get_cached(code, **kwargs)
+        if cached is not None:
+            yield cached
+            return
+        scheduler = get_scheduler()
+        limiter = get_limiter()
+        if scheduler.is_limited(self.model_name) and tokens is None:
+            tokens = self.prompt_size + self.number_of_tokens(code)
+        attempt = 0
+        chunks = []
+        while True:
+            await scheduler.acquire(self.model_name, tokens)
+            try:
+                async with limiter.slot():
+                    async for text in self.backend.stream(self, code=code, **kwargs):
+                        chunks.append(text)
+                        yield text
+                break
+            except Exception as e:
+                delay = limiter.retry_delay(e, attempt)
+                if delay is None or chunks:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+        if key is not None:
+            self.cache.set(key, "".join(chunks))
 
     def number_of_tokens(self, text):
         """
@@ -69,5 +206,4 @@ class LLM:
         Returns:
           int: The number of tokens in the text.
         """
-        encoding = tiktoken.encoding_for_model("gpt-4")
-        return len(encoding.encode(text))
+        return get_tokenizer(self.model_name).count(text)
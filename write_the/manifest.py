@@ -0,0 +1,203 @@
+import ast
+import copy
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+from .prescan import iter_definitions
+
+MANIFEST_PATH = Path(".write-the") / "manifest"
+# bumped when the way nodes are hashed changes, so old manifests are ignored
+MANIFEST_VERSION = 1
+# the layout of `ast` trees changes between Python versions
+PYTHON_VERSION = f"{sys.version_info[0]}.{sys.version_info[1]}"
+
+# the hash of the code of a node and the hash of its docstring (None if it has none)
+NodeHash = Tuple[str, Optional[str]]
+
+
+def _hash(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def _strip_docstrings(tree: ast.AST) -> None:
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if ast.get_docstring(node, clean=False) is not None:
+                node.body = node.body[1:]
+
+
+def _without_method_bodies(node: ast.ClassDef) -> ast.ClassDef:
+    # a class is documented from its attributes and the signatures of its methods
+    node = copy.deepcopy(node)
+    for child in ast.walk(node):
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            child.body = [ast.Pass()]
+    return node
+
+
+def hash_nodes(source_code: str) -> Dict[str, NodeHash]:
+    """
+    Hashes the code and the docstring of every function and class in source code.
+
+    Args:
+      source_code (str): The source code.
+
+    Returns:
+      Dict[str, NodeHash]: The code hash and docstring hash of each node, keyed by the name `get_node_names` gives it. Empty if `ast` can't parse the code.
+
+    Notes:
+      The code hash is taken from the `ast` dump of the node without the docstrings of the
+      node and the nodes inside it, so formatting, comments and docstrings don't change it.
+      Classes are hashed without the bodies of their methods, so editing a method only
+      changes the hash of the method.
+
+    Examples:
+      >>> hash_nodes("def f(a):\\n    return a\\n") == hash_nodes("def f( a ):  # same\\n    return (a)\\n")
+      True
+    """
+    if source_code.startswith("\ufeff"):
+        # a byte order mark read as text
+        source_code = source_code[1:]
+    try:
+        tree = ast.parse(source_code)
+    except (SyntaxError, ValueError):
+        return {}
+    definitions = list(iter_definitions(tree.body))
+    docstrings = [ast.get_docstring(node, clean=False) for _, node in definitions]
+    _strip_docstrings(tree)
+    # nodes that share a name (e.g. a property and its setter) are hashed together
+    codes: Dict[str, List[str]] = {}
+    docs: Dict[str, List[Optional[str]]] = {}
+    for (name, node), docstring in zip(definitions, docstrings):
+        if isinstance(node, ast.ClassDef):
+            node = _without_method_bodies(node)
+        codes.setdefault(name, []).append(ast.dump(node))
+        docs.setdefault(name, []).append(docstring)
+    return {
+        name: (
+            _hash("\n".join(codes[name])),
+            None
+            if all(d is None for d in docs[name])
+            else _hash("\n".join(d or "" for d in docs[name])),
+        )
+        for name in codes
+    }
+
+
+def unchanged_nodes(source_code: str, recorded: Dict[str, NodeHash]) -> List[str]:
+    """
+    Finds the nodes whose code is the same as when they were recorded.
+
+    Args:
+      source_code (str): The source code.
+      recorded (Dict[str, NodeHash]): The recorded hashes of the nodes of the file (see `Manifest.get`).
+
+    Returns:
+      List[str]: The names of the unchanged nodes. Edited docstrings aren't changes, but nodes whose docstring was removed since count as changed.
+    """
+    return [
+        name
+        for name, (code, docstring) in hash_nodes(source_code).items()
+        if name in recorded and recorded[name][0] == code and docstring is not None
+    ]
+
+
+class Manifest:
+    """
+    The hashes of the documented nodes of each file, kept between runs to find the nodes whose code changed.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = MANIFEST_PATH,
+        root: Optional[Union[str, Path]] = None,
+    ):
+        """
+        Initializes the Manifest, loading it if the file exists.
+
+        Args:
+          path (Union[str, Path], optional): The path of the manifest. Defaults to ".write-the/manifest".
+          root (Optional[Union[str, Path]], optional): The directory files are keyed relative to. Defaults to the current directory.
+
+        Notes:
+          A manifest that can't be read, or was written by another version of write-the
+          or Python, is ignored, so every node counts as changed.
+        """
+        self.path = Path(path)
+        self.root = Path(root if root is not None else Path.cwd()).resolve()
+        self.files: Dict[str, Dict[str, NodeHash]] = {}
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (
+            isinstance(data, dict)
+            and data.get("version") == MANIFEST_VERSION
+            and data.get("python") == PYTHON_VERSION
+        ):
+            self.files = {
+                key: {name: tuple(hashes) for name, hashes in nodes.items()}
+                for key, nodes in data.get("files", {}).items()
+            }
+
+    def key(self, file: Union[str, Path]) -> str:
+        """
+        Gets the key of a file in the manifest.
+
+        Args:
+          file (Union[str, Path]): The file.
+
+        Returns:
+          str: The POSIX path of the file relative to the root, or its absolute path if it is outside the root.
+        """
+        path = Path(file).resolve()
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def get(self, file: Union[str, Path]) -> Dict[str, NodeHash]:
+        """
+        Gets the recorded hashes of the nodes of a file.
+
+        Args:
+          file (Union[str, Path]): The file.
+
+        Returns:
+          Dict[str, NodeHash]: The hashes, keyed by node name. Empty if the file wasn't recorded.
+        """
+        return dict(self.files.get(self.key(file), {}))
+
+    def record(self, file: Union[str, Path], hashes: Dict[str, NodeHash]) -> None:
+        """
+        Replaces the recorded hashes of a file.
+
+        Args:
+          file (Union[str, Path]): The file.
+          hashes (Dict[str, NodeHash]): The hashes of the nodes of the file as saved (see `hash_nodes`). Nodes without docstrings aren't recorded.
+        """
+        self.files[self.key(file)] = {
+            name: node_hash for name, node_hash in hashes.items() if node_hash[1] is not None
+        }
+
+    def save(self) -> None:
+        """
+        Writes the manifest, replacing the file in one step so an interrupted run can't corrupt it.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": MANIFEST_VERSION,
+            "python": PYTHON_VERSION,
+            "files": {
+                key: {name: list(hashes) for name, hashes in sorted(nodes.items())}
+                for key, nodes in sorted(self.files.items())
+            },
+        }
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, self.path)
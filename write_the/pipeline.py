@@ -0,0 +1,88 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable, List
+
+# tells the workers of a stage that no more items are coming
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """
+    A stage of a pipeline.
+
+    Args:
+      fn (Callable[[Any], Awaitable[Any]]): Processes an item, returning the item for the next stage or None to drop it.
+      workers (int): The number of items processed at the same time. Defaults to 1.
+    """
+
+    fn: Callable[[Any], Awaitable[Any]]
+    workers: int = 1
+
+
+def max_items_in_flight(stages: List[Stage]) -> int:
+    """
+    Gets the most items a pipeline holds at once.
+
+    Args:
+      stages (List[Stage]): The stages of the pipeline.
+
+    Returns:
+      int: The number of items that can be queued in front of or processed by the stages.
+
+    Examples:
+      >>> max_items_in_flight([Stage(fn, workers=4), Stage(fn, workers=32)])
+      72
+    """
+    return sum(2 * stage.workers for stage in stages)
+
+
+async def run_pipeline(items: Iterable[Any], stages: List[Stage]) -> None:
+    """
+    Runs items through stages connected by bounded queues.
+
+    Args:
+      items (Iterable[Any]): The items, consumed lazily as the first stage has room for them.
+      stages (List[Stage]): The stages, in order. The results of the last stage are dropped.
+
+    Raises:
+      Exception: The first exception raised by a stage, after the other stages were cancelled.
+
+    Notes:
+      The queue in front of a stage holds as many items as the stage has workers, so a
+      slow stage holds up the stages before it and at most `max_items_in_flight` items
+      are in the pipeline, however many items there are.
+    """
+    queues = [asyncio.Queue(maxsize=stage.workers) for stage in stages]
+
+    async def feed():
+        for item in items:
+            await queues[0].put(item)
+        for _ in range(stages[0].workers):
+            await queues[0].put(_DONE)
+
+    async def work(i: int):
+        while True:
+            item = await queues[i].get()
+            if item is _DONE:
+                return
+            result = await stages[i].fn(item)
+            if result is not None and i + 1 < len(stages):
+                await queues[i + 1].put(result)
+
+    async def run_stage(i: int):
+        await asyncio.gather(*[work(i) for _ in range(stages[i].workers)])
+        if i + 1 < len(stages):
+            for _ in range(stages[i + 1].workers):
+                await queues[i + 1].put(_DONE)
+
+    tasks = [asyncio.ensure_future(feed())]
+    tasks += [asyncio.ensure_future(run_stage(i)) for i in range(len(stages))]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # don't leave the other stages waiting on their queues
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
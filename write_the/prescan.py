@@ -0,0 +1,211 @@
+import ast
+import io
+import os
+import tokenize
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+from .utils import load_source_code
+
+# below this many files starting worker processes costs more than it saves
+PROCESS_POOL_MIN_FILES = 64
+# the fields of statements that hold blocks of statements
+BLOCK_FIELDS = ("body", "orelse", "finalbody", "handlers", "cases")
+
+
+def iter_definitions(
+    statements: List[ast.AST], current_class: Optional[List[Optional[str]]] = None
+) -> Iterator[Tuple[str, ast.AST]]:
+    """
+    Walks the functions and classes of `ast` statements in the order of the FunctionAndClassCollector.
+
+    Args:
+      statements (List[ast.AST]): The statements, e.g. the body of a module.
+      current_class (Optional[List[Optional[str]]], optional): The name of the enclosing class, in a list so nested blocks share it. Defaults to no class.
+
+    Returns:
+      Iterator[Tuple[str, ast.AST]]: The name of each function and class, named the way `get_node_names` names it, and its node.
+    """
+    if current_class is None:
+        current_class = [None]
+    for statement in statements:
+        if isinstance(statement, ast.ClassDef):
+            current_class[0] = statement.name
+            yield statement.name, statement
+        elif isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            name = statement.name
+            yield (f"{current_class[0]}.{name}" if current_class[0] else name), statement
+        for field in BLOCK_FIELDS:
+            block = getattr(statement, field, None)
+            if block:
+                yield from iter_definitions(block, current_class)
+        if isinstance(statement, ast.ClassDef):
+            current_class[0] = None
+
+
+def _segment(lines: List[bytes], node: ast.AST) -> bytes:
+    # ast offsets are in bytes of the UTF-8 encoded lines
+    if node.lineno == node.end_lineno:
+        return lines[node.lineno - 1][node.col_offset : node.end_col_offset]
+    return b"".join(
+        [lines[node.lineno - 1][node.col_offset :]]
+        + lines[node.lineno : node.end_lineno - 1]
+        + [lines[node.end_lineno - 1][: node.end_col_offset]]
+    )
+
+
+def _is_single_string(code: str) -> bool:
+    prefix = len(code) - len(code.lstrip("rRbBuUfF"))
+    literal = code[prefix:]
+    quote = literal[:3] if literal[:3] in ('"""', "'''") else literal[:1]
+    if len(literal) >= 2 * len(quote) and literal.endswith(quote):
+        if quote not in literal[len(quote) : -len(quote)]:
+            return True
+    # escaped quotes or several strings
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+    except (tokenize.TokenError, SyntaxError):
+        return False
+    return sum(t.type == tokenize.STRING for t in tokens) == 1 and all(
+        t.type in (tokenize.STRING, tokenize.NL, tokenize.NEWLINE, tokenize.ENDMARKER)
+        for t in tokens
+    )
+
+
+def _has_docstring(node: ast.AST, lines: List[bytes]) -> Optional[bool]:
+    """
+    Checks if a function or class has a docstring the way `has_docstring` does for CST nodes.
+
+    Args:
+      node (ast.AST): The function or class.
+      lines (List[bytes]): The UTF-8 encoded lines of the source code.
+
+    Returns:
+      Optional[bool]: Whether the node has a docstring, None if it can't be told without parsing the code with libcst.
+    """
+    first = node.body[0]
+    if not (
+        isinstance(first, ast.Expr)
+        and isinstance(first.value, ast.Constant)
+        and isinstance(first.value.value, (str, bytes))
+    ):
+        return False
+    if lines[first.lineno - 1][: first.col_offset].strip():
+        # `def f(): "..."` has no indented block, so libcst sees no docstring
+        return None
+    if not _is_single_string(_segment(lines, first.value).decode("utf-8")):
+        # implicitly concatenated strings aren't docstrings for libcst
+        return None
+    return True
+
+
+def has_candidate_nodes(
+    source_code: str,
+    force: bool,
+    update: bool = False,
+    node_names: Optional[Sequence[str]] = None,
+) -> bool:
+    """
+    Checks if source code has functions or classes to document, without parsing it with libcst.
+
+    Args:
+      source_code (str): The source code.
+      force (bool): Whether every function and class is a candidate, even if it has a docstring.
+      update (bool, optional): Whether only the functions and classes with docstrings are candidates. Defaults to False.
+      node_names (Optional[Sequence[str]], optional): The names of the only functions and classes that are candidates. Defaults to None.
+
+    Returns:
+      bool: False only if `get_node_names` (or the given names) would find no nodes. Code `ast` can't parse is reported as having candidates.
+
+    Examples:
+      >>> has_candidate_nodes("def f():\\n    '''Documented.'''\\n", force=False)
+      False
+      >>> has_candidate_nodes("def f():\\n    '''Documented.'''\\n", force=False, update=True)
+      True
+    """
+    if source_code.startswith("\ufeff"):
+        # a byte order mark read as text
+        source_code = source_code[1:]
+    try:
+        tree = ast.parse(source_code)
+    except (SyntaxError, ValueError):
+        return True
+    definitions = iter_definitions(tree.body)
+    if node_names:
+        names = set(node_names)
+        return any(name in names for name, _ in definitions)
+    if force:
+        return next(definitions, None) is not None
+    lines = source_code.encode("utf-8").splitlines(keepends=True)
+    for _, node in definitions:
+        docstring = _has_docstring(node, lines)
+        if docstring is None or docstring == update:
+            return True
+    return False
+
+
+def scan_file(
+    file: Union[str, Path],
+    force: bool,
+    update: bool = False,
+    node_names: Optional[Sequence[str]] = None,
+) -> bool:
+    """
+    Checks if a file has functions or classes to document (see `has_candidate_nodes`).
+
+    Args:
+      file (Union[str, Path]): The path to the file.
+      force (bool): Whether every function and class is a candidate.
+      update (bool, optional): Whether only the functions and classes with docstrings are candidates. Defaults to False.
+      node_names (Optional[Sequence[str]], optional): The names of the only functions and classes that are candidates. Defaults to None.
+
+    Returns:
+      bool: Whether the file may have candidates. Files that can't be read are left for the command to report.
+    """
+    try:
+        source_code = load_source_code(file)
+    except (OSError, UnicodeDecodeError):
+        return True
+    return has_candidate_nodes(source_code, force, update, node_names)
+
+
+def prescan_files(
+    files: List[Path],
+    force: bool,
+    update: bool = False,
+    node_names: Optional[Sequence[str]] = None,
+    max_workers: Optional[int] = None,
+) -> Tuple[List[Path], List[Path]]:
+    """
+    Splits files into those with functions or classes to document and those without, using worker processes for many files.
+
+    Args:
+      files (List[Path]): The files to scan.
+      force (bool): Whether every function and class is a candidate.
+      update (bool, optional): Whether only the functions and classes with docstrings are candidates. Defaults to False.
+      node_names (Optional[Sequence[str]], optional): The names of the only functions and classes that are candidates. Defaults to None.
+      max_workers (Optional[int], optional): The maximum number of worker processes, 0 to scan in this process. Defaults to the number of CPUs.
+
+    Returns:
+      Tuple[List[Path], List[Path]]: The files with candidates and the files to skip, in the order given.
+    """
+    scan = partial(scan_file, force=force, update=update, node_names=node_names)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    workers = min(max_workers, len(files))
+    results = None
+    if workers > 1 and len(files) >= PROCESS_POOL_MIN_FILES:
+        chunksize = max(1, len(files) // (workers * 4))
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(scan, files, chunksize=chunksize))
+        except (OSError, BrokenProcessPool):
+            # e.g. sandboxes that don't allow worker processes
+            results = None
+    if results is None:
+        results = [scan(file) for file in files]
+    candidates = [file for file, result in zip(files, results) if result]
+    skipped = [file for file, result in zip(files, results) if not result]
+    return candidates, skipped
@@ -0,0 +1,204 @@
+import asyncio
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously up to its capacity.
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_rate: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initializes a full TokenBucket.
+
+        Args:
+          capacity (float): The maximum number of tokens in the bucket.
+          refill_rate (float): The number of tokens added per second.
+          clock (Callable[[], float], optional): The clock used to measure time. Defaults to time.monotonic.
+        """
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def refill(self) -> None:
+        """
+        Adds the tokens accumulated since the last refill.
+        """
+        now = self.clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.refill_rate
+        )
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """
+        Gets the time until `amount` tokens are available.
+
+        Args:
+          amount (float): The number of tokens required. Clamped to the capacity of the bucket.
+
+        Returns:
+          float: The number of seconds to wait.
+        """
+        self.refill()
+        missing = min(amount, self.capacity) - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.refill_rate
+
+    def consume(self, amount: float) -> None:
+        """
+        Removes tokens from the bucket.
+
+        Args:
+          amount (float): The number of tokens to remove. Clamped to the capacity of the bucket.
+        """
+        self.refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class Scheduler:
+    """
+    Schedules LLM requests so each model stays within its requests and tokens per minute budgets.
+    """
+
+    def __init__(self):
+        self.request_buckets: Dict[str, TokenBucket] = {}
+        self.token_buckets: Dict[str, TokenBucket] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self._loop = None
+
+    def lock(self, model_name: str) -> asyncio.Lock:
+        """
+        Gets the lock that queues the requests to a model in the running event loop.
+
+        Args:
+          model_name (str): The name of the model.
+
+        Returns:
+          asyncio.Lock: The lock.
+
+        Notes:
+          The locks are recreated when the event loop changes (e.g. between `asyncio.run`
+          calls), as a lock can't be shared between loops.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self.locks = {}
+            self._loop = loop
+        return self.locks.setdefault(model_name, asyncio.Lock())
+
+    def set_limits(
+        self, model_name: str, rpm: Optional[int] = None, tpm: Optional[int] = None
+    ) -> None:
+        """
+        Sets the rate limits for a model.
+
+        Args:
+          model_name (str): The name of the model.
+          rpm (Optional[int], optional): The maximum requests per minute. Defaults to None (unlimited).
+          tpm (Optional[int], optional): The maximum tokens per minute. Defaults to None (unlimited).
+        """
+        self.request_buckets.pop(model_name, None)
+        self.token_buckets.pop(model_name, None)
+        self.locks.pop(model_name, None)
+        if rpm:
+            self.request_buckets[model_name] = TokenBucket(rpm, rpm / 60)
+        if tpm:
+            self.token_buckets[model_name] = TokenBucket(tpm, tpm / 60)
+
+    def get_limits(self, model_name: str) -> Tuple[Optional[float], Optional[float]]:
+        """
+        Gets the rate limits of a model.
+
+        Args:
+          model_name (str): The name of the model.
+
+        Returns:
+          Tuple[Optional[float], Optional[float]]: The requests and tokens per minute, None if unlimited.
+        """
+        rpm = self.request_buckets.get(model_name)
+        tpm = self.token_buckets.get(model_name)
+        return (rpm.capacity if rpm else None, tpm.capacity if tpm else None)
+
+    def is_limited(self, model_name: str) -> bool:
+        """
+        Checks if a model has any rate limits.
+
+        Args:
+          model_name (str): The name of the model.
+
+        Returns:
+          bool: Whether requests to the model are rate limited.
+        """
+        return model_name in self.request_buckets or model_name in self.token_buckets
+
+    def delay(self, model_name: str, tokens: int) -> float:
+        """
+        Gets the time until a request for `tokens` tokens fits in the budgets of a model.
+
+        Args:
+          model_name (str): The name of the model.
+          tokens (int): The number of tokens in the request.
+
+        Returns:
+          float: The number of seconds to wait.
+        """
+        delay = 0.0
+        if model_name in self.request_buckets:
+            delay = max(delay, self.request_buckets[model_name].delay(1))
+        if model_name in self.token_buckets:
+            delay = max(delay, self.token_buckets[model_name].delay(tokens))
+        return delay
+
+    async def acquire(self, model_name: str, tokens: int) -> None:
+        """
+        Waits, in FIFO order, until a request fits in the budgets of a model and then consumes it.
+
+        Args:
+          model_name (str): The name of the model.
+          tokens (int): The number of tokens in the request.
+
+        Side Effects:
+          Updates `queue_depth` and `max_queue_depth` while waiting.
+        """
+        if not self.is_limited(model_name):
+            return
+        lock = self.lock(model_name)
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            async with lock:
+                delay = self.delay(model_name, tokens)
+                while delay > 0:
+                    await asyncio.sleep(delay)
+                    delay = self.delay(model_name, tokens)
+                if model_name in self.request_buckets:
+                    self.request_buckets[model_name].consume(1)
+                if model_name in self.token_buckets:
+                    self.token_buckets[model_name].consume(tokens)
+        finally:
+            self.queue_depth -= 1
+
+
+_scheduler = Scheduler()
+
+
+def get_scheduler() -> Scheduler:
+    """
+    Gets the process-wide scheduler that every LLM request goes through.
+
+    Returns:
+      Scheduler: The scheduler.
+    """
+    return _scheduler
@@ -0,0 +1,421 @@
+from pathlib import Path
+from typing import Collection, Dict, List, Optional, Tuple
+import libcst as cst
+from black import FileMode, InvalidInput, format_str
+
+from write_the.cst import nodes_to_tree
+from write_the.cst.docstring_adder import add_docstrings_to_tree
+from write_the.cst.file_index import FileIndex
+from write_the.cst.function_and_class_collector import get_node_names
+from write_the.cst.minifier import minify_code
+from write_the.cst.node_batcher import (
+    CrossFileBatch,
+    LatencyModel,
+    NodeBatch,
+    create_batches,
+    create_cross_file_batches,
+)
+from write_the.cst.node_extractor import extract_nodes_from_tree
+from write_the.errors import FileSkippedError
+from write_the.manifest import NodeHash, unchanged_nodes
+from write_the.prescan import has_candidate_nodes
+from write_the.utils import create_tree, format_source_code, load_source_code
+
+# the errors that fail a single file of a cross-file run: it can't be read, formatted or parsed
+_LOAD_ERRORS = (OSError, UnicodeDecodeError, InvalidInput, cst.ParserSyntaxError)
+
+# The CPU-bound stages of the commands. They don't import langchain or openai so
+# worker processes start quickly, and they take and return paths, strings and
+# released batches (which hold no trees) so little crosses process boundaries.
+
+
+def _select(
+    node_names: List[str],
+    exclude: Collection[str] = (),
+    include: Optional[Collection[str]] = None,
+) -> List[str]:
+    exclude = set(exclude)
+    include = None if include is None else set(include)
+    return [
+        name
+        for name in node_names
+        if name not in exclude and (include is None or name in include)
+    ]
+
+
+def plan_docs(
+    tree: cst.Module,
+    max_tokens: int,
+    prompt_size: int,
+    node_names=[],
+    update=False,
+    force=False,
+    context=False,
+    background=True,
+    max_batch_size=False,
+    model="gpt-3.5-turbo-instruct",
+    planner="ffd",
+    optimize="tokens",
+    concurrency=1,
+    latency_model: Optional[LatencyModel] = None,
+    background_level=None,
+    background_budget=None,
+    minify=False,
+    exclude: Collection[str] = (),
+    include: Optional[Collection[str]] = None,
+) -> Tuple[List[str], List[NodeBatch]]:
+    """
+    Finds the nodes to document in a tree and plans the requests for them.
+
+    Args:
+      tree (cst.Module): The tree to document.
+      max_tokens (int): The context window of the model.
+      prompt_size (int): The number of tokens in the prompt.
+      node_names (list, optional): The names of the nodes to document. Defaults to the nodes without docstrings (or with, when updating).
+      update (bool, optional): Whether to update existing docstrings. Defaults to False.
+      force (bool, optional): Whether to document nodes that have docstrings. Defaults to False.
+      context (bool, optional): Whether to send the other nodes as context. Defaults to False.
+      background (bool, optional): Whether to send the rest of the file. Defaults to True.
+      max_batch_size (int, optional): The maximum number of nodes in each batch. Defaults to False.
+      model (str, optional): The model the tokens are counted for. Defaults to "gpt-3.5-turbo-instruct".
+      planner (str, optional): The batch planning strategy ("greedy" or "ffd"). Defaults to "ffd".
+      optimize (str, optional): Whether to minimise the "tokens" sent or the "latency" of the file. Defaults to "tokens".
+      concurrency (int, optional): The number of requests available to this file. Defaults to 1.
+      latency_model (Optional[LatencyModel], optional): Estimates how long requests take. Defaults to None.
+      background_level (str, optional): How much of the rest of the file to send. Defaults to the level of `background` and `context`.
+      background_budget (int, optional): The maximum number of background tokens per request. Defaults to None.
+      minify (bool, optional): Whether to minify the code sent. Defaults to False.
+      exclude (Collection[str], optional): The names of nodes to leave out when the nodes aren't given, e.g. the unchanged nodes. Defaults to none.
+      include (Optional[Collection[str]], optional): The names of the only nodes to consider when the nodes aren't given, e.g. the nodes changed in a diff. Defaults to None, considering every node.
+
+    Returns:
+      Tuple[List[str], List[NodeBatch]]: The names of the nodes and the batches, with the tree released.
+
+    Raises:
+      FileSkippedError: If no nodes are found.
+    """
+    index = FileIndex(tree)
+    if not node_names:
+        node_names = get_node_names(tree, force=force, update=update, index=index)
+        if node_names and (exclude or include is not None):
+            node_names = _select(node_names, exclude, include)
+            if not node_names:
+                raise FileSkippedError("No changed nodes found, skipping file...")
+    if not node_names:
+        raise FileSkippedError("No nodes found, skipping file...")
+    batches = create_batches(
+        tree=tree,
+        node_names=node_names,
+        max_tokens=max_tokens,
+        prompt_size=prompt_size,
+        response_size_per_node=250,  # a guess... TODO: smarter
+        max_batch_size=max_batch_size,
+        send_background_context=background,
+        send_node_context=context,
+        remove_docstrings=not update,
+        model_name=model,
+        index=index,
+        planner=planner,
+        optimize=optimize,
+        concurrency=concurrency,
+        latency_model=latency_model,
+        background_level=background_level,
+        background_budget=background_budget,
+        minify=minify,
+    )
+    return node_names, batches
+
+
+def plan_cross_file_docs(
+    trees: Dict[str, cst.Module],
+    max_tokens: int,
+    prompt_size: int,
+    node_names=[],
+    update=False,
+    force=False,
+    context=False,
+    background=True,
+    max_batch_size=False,
+    model="gpt-3.5-turbo-instruct",
+    planner="ffd",
+    optimize="tokens",
+    concurrency=1,
+    latency_model: Optional[LatencyModel] = None,
+    background_level=None,
+    background_budget=None,
+    minify=False,
+    exclude: Optional[Dict[str, Collection[str]]] = None,
+    include: Optional[Dict[str, Collection[str]]] = None,
+) -> Tuple[Dict[str, List[str]], List[CrossFileBatch]]:
+    """
+    Finds the nodes to document in several trees and packs them into shared requests.
+
+    Args:
+      trees (Dict[str, cst.Module]): The trees to document, keyed by file.
+      max_tokens (int): The context window of the model.
+      prompt_size (int): The number of tokens in the prompt.
+      node_names (list, optional): The names of the nodes to document in each file that has them. Defaults to the nodes without docstrings (or with, when updating).
+      update (bool, optional): Whether to update existing docstrings. Defaults to False.
+      force (bool, optional): Whether to document nodes that have docstrings. Defaults to False.
+      context (bool, optional): Whether to send the other nodes as context. Defaults to False.
+      background (bool, optional): Whether to send the rest of each file. Defaults to True.
+      max_batch_size (int, optional): The maximum number of nodes in each batch. Defaults to False.
+      model (str, optional): The model the tokens are counted for. Defaults to "gpt-3.5-turbo-instruct".
+      planner (str, optional): The batch planning strategy ("greedy" or "ffd"). Defaults to "ffd".
+      optimize (str, optional): Whether to minimise the "tokens" sent or the "latency". Defaults to "tokens".
+      concurrency (int, optional): The number of requests available. Defaults to 1.
+      latency_model (Optional[LatencyModel], optional): Estimates how long requests take. Defaults to None.
+      background_level (str, optional): How much of the rest of each file to send. Defaults to the level of `background` and `context`.
+      background_budget (int, optional): The maximum number of background tokens of a file per request. Defaults to None.
+      minify (bool, optional): Whether to minify the code sent. Defaults to False.
+      exclude (Optional[Dict[str, Collection[str]]], optional): The names of nodes to leave out of each file when the nodes aren't given, e.g. the unchanged nodes. Defaults to None.
+      include (Optional[Dict[str, Collection[str]]], optional): The names of the only nodes to consider in each file when the nodes aren't given, e.g. the nodes changed in a diff. Files that aren't keyed have none. Defaults to None, considering every node.
+
+    Returns:
+      Tuple[Dict[str, List[str]], List[CrossFileBatch]]: The names of the nodes of each file with nodes to document and the batches, with the trees released.
+
+    Raises:
+      FileSkippedError: If no nodes are found in any of the trees.
+    """
+    indexes = {key: FileIndex(tree) for key, tree in trees.items()}
+    names = {}
+    for key, index in indexes.items():
+        if node_names:
+            file_names = [n for n in node_names if n in index]
+        else:
+            file_names = get_node_names(trees[key], force=force, update=update, index=index)
+            if exclude or include is not None:
+                file_names = _select(
+                    file_names,
+                    (exclude or {}).get(key, ()),
+                    None if include is None else include.get(key, ()),
+                )
+        if file_names:
+            names[key] = file_names
+    if not names:
+        if include is not None or (exclude and any(exclude.values())):
+            raise FileSkippedError("No changed nodes found, skipping files...")
+        raise FileSkippedError("No nodes found, skipping files...")
+    batches = create_cross_file_batches(
+        trees={key: trees[key] for key in names},
+        node_names=names,
+        max_tokens=max_tokens,
+        prompt_size=prompt_size,
+        response_size_per_node=250,  # a guess... TODO: smarter
+        max_batch_size=max_batch_size,
+        send_background_context=background,
+        send_node_context=context,
+        remove_docstrings=not update,
+        model_name=model,
+        indexes=indexes,
+        planner=planner,
+        optimize=optimize,
+        concurrency=concurrency,
+        latency_model=latency_model,
+        background_level=background_level,
+        background_budget=background_budget,
+        minify=minify,
+    )
+    return names, batches
+
+
+def apply_docstrings(
+    tree: cst.Module,
+    docstrings: Dict[str, str],
+    node_names: List[str],
+    extract_specific_nodes=False,
+    save=False,
+    force=False,
+    update=False,
+    pretty=False,
+) -> str:
+    """
+    Adds docstrings to a tree and renders it.
+
+    Args:
+      tree (cst.Module): The tree.
+      docstrings (Dict[str, str]): The docstrings, keyed by node name.
+      node_names (List[str]): The names of the documented nodes.
+      extract_specific_nodes (bool, optional): Whether to only render the documented nodes when not saving. Defaults to False.
+      save (bool, optional): Whether the code is saved to the file. Defaults to False.
+      force (bool, optional): Whether to replace existing docstrings. Defaults to False.
+      update (bool, optional): Whether existing docstrings were updated. Defaults to False.
+      pretty (bool, optional): Whether to format the code with black. Defaults to False.
+
+    Returns:
+      str: The code with the docstrings.
+    """
+    modified_tree = add_docstrings_to_tree(tree, docstrings, force=force or update)
+    if not save and extract_specific_nodes:
+        extracted_nodes = extract_nodes_from_tree(modified_tree, node_names)
+        modified_tree = nodes_to_tree(extracted_nodes)
+    if pretty:
+        return format_str(modified_tree.code, mode=FileMode())
+    return modified_tree.code
+
+
+def _load_file(
+    file: Path,
+    force: bool,
+    update: bool,
+    pretty: bool,
+    recorded: Optional[Dict[str, NodeHash]],
+    lines: Optional[List[Tuple[int, int]]],
+    node_names: Optional[List[str]],
+) -> Tuple[str, cst.Module, Optional[List[str]], Optional[List[str]]]:
+    # loads a file and finds the nodes to consider and to leave out, unless the
+    # nodes are given
+    source_code = load_source_code(file=file)
+    if not has_candidate_nodes(source_code, force, update, node_names):
+        # without parsing it with libcst
+        raise FileSkippedError("No nodes found, skipping file...")
+    tree = include = exclude = None
+    if lines is not None and not node_names:
+        # the changed lines are those of the file as it is, before formatting
+        tree = create_tree(source_code)
+        include = FileIndex(tree).names_in_lines(lines)
+    if pretty:
+        source_code = format_source_code(source_code)
+        tree = None
+    if recorded is not None and not node_names:
+        exclude = unchanged_nodes(source_code, recorded)
+    if tree is None:
+        tree = create_tree(source_code)
+    return source_code, tree, include, exclude
+
+
+def plan_docs_for_file(
+    file: Path,
+    pretty=False,
+    recorded: Optional[Dict[str, NodeHash]] = None,
+    lines: Optional[List[Tuple[int, int]]] = None,
+    **options,
+) -> Tuple[str, List[str], List[NodeBatch]]:
+    """
+    Loads a file and plans the requests to document it.
+
+    Args:
+      file (Path): The file.
+      pretty (bool, optional): Whether to format the code with black first. Defaults to False.
+      recorded (Optional[Dict[str, NodeHash]], optional): The hashes recorded in the manifest for the file, to only document the nodes that changed since. Defaults to None, documenting every node.
+      lines (Optional[List[Tuple[int, int]]], optional): The ranges of changed lines of the file (as it is, before formatting), to only document the nodes containing them. Defaults to None, documenting every node.
+      **options: The options of `plan_docs`.
+
+    Returns:
+      Tuple[str, List[str], List[NodeBatch]]: The (formatted) source code, the names of the nodes and the batches.
+
+    Raises:
+      FileSkippedError: If no nodes are found.
+    """
+    source_code, tree, include, exclude = _load_file(
+        file,
+        options.get("force", False),
+        options.get("update", False),
+        pretty,
+        recorded,
+        lines,
+        options.get("node_names"),
+    )
+    if include is not None:
+        options["include"] = include
+    if exclude is not None:
+        options["exclude"] = exclude
+    node_names, batches = plan_docs(tree, **options)
+    return source_code, node_names, batches
+
+
+def plan_docs_for_files(
+    files: List[Path],
+    pretty=False,
+    recorded: Optional[Dict[str, Dict[str, NodeHash]]] = None,
+    lines: Optional[Dict[str, List[Tuple[int, int]]]] = None,
+    **options,
+) -> Tuple[Dict[str, str], Dict[str, List[str]], List[CrossFileBatch], Dict[str, str]]:
+    """
+    Loads several files and packs the nodes to document into shared requests.
+
+    Args:
+      files (List[Path]): The files, keyed by their POSIX path in the results.
+      pretty (bool, optional): Whether to format the code with black first. Defaults to False.
+      recorded (Optional[Dict[str, Dict[str, NodeHash]]], optional): The hashes recorded in the manifest for each file, keyed by POSIX path, to only document the nodes that changed since. Defaults to None, documenting every node.
+      lines (Optional[Dict[str, List[Tuple[int, int]]]], optional): The ranges of changed lines of each file (as it is, before formatting), keyed by POSIX path, to only document the nodes containing them. Defaults to None, documenting every node.
+      **options: The options of `plan_cross_file_docs`.
+
+    Returns:
+      Tuple[Dict[str, str], Dict[str, List[str]], List[CrossFileBatch], Dict[str, str]]: The source code and the names of the nodes of each file with nodes to document, the batches, and the error of each file that couldn't be read, formatted or parsed.
+
+    Raises:
+      FileSkippedError: If no nodes are found in any of the files and none of them failed.
+    """
+    sources, trees, include, exclude, failed = {}, {}, {}, {}, {}
+    for file in files:
+        key = file.as_posix()
+        try:
+            sources[key], trees[key], file_include, file_exclude = _load_file(
+                file,
+                options.get("force", False),
+                options.get("update", False),
+                pretty,
+                None if recorded is None else recorded.get(key, {}),
+                None if lines is None else lines.get(key, []),
+                options.get("node_names"),
+            )
+        except FileSkippedError:
+            # the other files may still have nodes
+            continue
+        except _LOAD_ERRORS as e:
+            # only this file fails, the others are still planned
+            failed[key] = str(e)
+            continue
+        if file_include is not None:
+            include[key] = file_include
+        if file_exclude is not None:
+            exclude[key] = file_exclude
+    if lines is not None and not options.get("node_names"):
+        options["include"] = include
+    if exclude:
+        options["exclude"] = exclude
+    try:
+        if not trees:
+            raise FileSkippedError("No nodes found, skipping files...")
+        names, batches = plan_cross_file_docs(trees, **options)
+    except FileSkippedError:
+        if not failed:
+            raise
+        names, batches = {}, []
+    return {key: sources[key] for key in names}, names, batches, failed
+
+
+def apply_docstrings_to_source(
+    source_code: str, docstrings: Dict[str, str], node_names: List[str], **options
+) -> str:
+    """
+    Adds docstrings to source code (see `apply_docstrings`).
+
+    Args:
+      source_code (str): The source code.
+      docstrings (Dict[str, str]): The docstrings, keyed by node name.
+      node_names (List[str]): The names of the documented nodes.
+      **options: The options of `apply_docstrings`.
+
+    Returns:
+      str: The code with the docstrings.
+    """
+    return apply_docstrings(create_tree(source_code), docstrings, node_names, **options)
+
+
+def prepare_source_for_tests(file: Path, minify=False) -> str:
+    """
+    Loads and formats the code of a file to write tests for.
+
+    Args:
+      file (Path): The file.
+      minify (bool, optional): Whether to strip comments, blank lines and long strings. Docstrings are kept. Defaults to False.
+
+    Returns:
+      str: The code to send.
+    """
+    source_code = format_str(load_source_code(file=file), mode=FileMode())
+    if minify:
+        source_code = minify_code(source_code, drop_docstrings=False)
+    return source_code
@@ -0,0 +1,404 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import tiktoken
+from tiktoken.model import encoding_name_for_model
+
+ENCODING_URLS = {
+    "cl100k_base": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+    "p50k_base": "https://openaipublic.blob.core.windows.net/encodings/p50k_base.tiktoken",
+    "r50k_base": "https://openaipublic.blob.core.windows.net/encodings/r50k_base.tiktoken",
+}
+# Python source averages ~3.5-4 bytes per cl100k token, so counting 3 bytes per
+# token plus a 10% margin overestimates and keeps approximate batches in the window.
+APPROXIMATE_BYTES_PER_TOKEN = 3.0
+APPROXIMATE_SAFETY_MARGIN = 1.1
+
+_offline = False
+
+
+def get_model_encoding_name(model_name: str) -> str:
+    """
+    Gets the name of the encoding used by a model.
+
+    Args:
+      model_name (str): The name of the model.
+
+    Returns:
+      str: The name of the encoding, or cl100k_base if the model is unknown to tiktoken.
+
+    Examples:
+      >>> get_model_encoding_name("gpt-4")
+      'cl100k_base'
+    """
+    try:
+        return encoding_name_for_model(model_name)
+    except KeyError:
+        return "cl100k_base"
+
+
+def get_tiktoken_cache_dir() -> Path:
+    """
+    Gets the directory tiktoken caches encoding files in.
+
+    Returns:
+      Path: The cache directory.
+    """
+    if "TIKTOKEN_CACHE_DIR" in os.environ:
+        return Path(os.environ["TIKTOKEN_CACHE_DIR"])
+    if "DATA_GYM_CACHE_DIR" in os.environ:
+        return Path(os.environ["DATA_GYM_CACHE_DIR"])
+    return Path(tempfile.gettempdir()) / "data-gym-cache"
+
+
+def get_encoding_cache_path(encoding_name: str) -> Path:
+    """
+    Gets the path tiktoken caches an encoding file at.
+
+    Args:
+      encoding_name (str): The name of the encoding.
+
+    Returns:
+      Path: The path of the cached encoding file.
+    """
+    url = ENCODING_URLS[encoding_name]
+    return get_tiktoken_cache_dir() / hashlib.sha1(url.encode()).hexdigest()
+
+
+def set_offline(offline: bool) -> None:
+    """
+    Sets whether encoding files may be downloaded.
+
+    Args:
+      offline (bool): If True, encodings that aren't cached locally fall back to approximate counts.
+    """
+    global _offline
+    _offline = offline
+    get_encoding.cache_clear()
+
+
+def is_offline() -> bool:
+    """
+    Checks if encoding files may not be downloaded.
+
+    Returns:
+      bool: Whether encodings that aren't cached locally fall back to approximate counts.
+    """
+    return _offline
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str = "gpt-4") -> Optional[tiktoken.Encoding]:
+    """
+    Gets the tiktoken encoding for a model, loading it only once per process.
+
+    Args:
+      model_name (str, optional): The name of the model. Defaults to "gpt-4".
+
+    Returns:
+      Optional[tiktoken.Encoding]: The encoding used by the model, or None if it can't be loaded (e.g. offline without a cached encoding file).
+    """
+    encoding_name = get_model_encoding_name(model_name)
+    if (
+        _offline
+        and encoding_name in ENCODING_URLS
+        and not get_encoding_cache_path(encoding_name).exists()
+    ):
+        return None
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception:
+        return None
+
+
+def approximate_count(text: str) -> int:
+    """
+    Estimates the number of tokens in a text without an encoding.
+
+    Args:
+      text (str): The text to count tokens for.
+
+    Returns:
+      int: An overestimate of the number of tokens in the text.
+
+    Examples:
+      >>> approximate_count("def add(a, b):\\n    return a + b\\n")
+      12
+    """
+    return math.ceil(
+        len(text.encode()) / APPROXIMATE_BYTES_PER_TOKEN * APPROXIMATE_SAFETY_MARGIN
+    )
+
+
+def warmup(
+    encoding_names: Optional[Iterable[str]] = None,
+    source: Optional[Union[str, Path]] = None,
+) -> Dict[str, Path]:
+    """
+    Fills the tiktoken cache with encoding files so they don't need to be downloaded later.
+
+    Args:
+      encoding_names (Optional[Iterable[str]], optional): The encodings to cache. Defaults to every encoding write-the can use.
+      source (Optional[Union[str, Path]], optional): A directory of `<encoding>.tiktoken` files to copy instead of downloading. Defaults to None.
+
+    Returns:
+      Dict[str, Path]: The cached file of each encoding.
+
+    Raises:
+      FileNotFoundError: If an encoding file is missing from `source`.
+      ValueError: If an encoding is unknown.
+    """
+    if encoding_names is None:
+        encoding_names = list(ENCODING_URLS)
+    cached = {}
+    for encoding_name in encoding_names:
+        if encoding_name not in ENCODING_URLS:
+            raise ValueError(f"Unknown encoding: {encoding_name}!")
+        path = get_encoding_cache_path(encoding_name)
+        if source is not None:
+            source_file = Path(source) / f"{encoding_name}.tiktoken"
+            if not source_file.exists():
+                raise FileNotFoundError(f"Encoding file not found: {source_file}")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(source_file, path)
+        else:
+            tiktoken.get_encoding(encoding_name)
+        cached[encoding_name] = path
+    get_encoding.cache_clear()
+    return cached
+
+
+def hash_text(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+class Tokenizer:
+    """
+    Counts tokens for a model, caching the count of every text by its content hash.
+    """
+
+    def __init__(self, model_name: str = "gpt-4", max_entries: int = 100_000):
+        """
+        Initializes the Tokenizer.
+
+        Args:
+          model_name (str, optional): The name of the model. Defaults to "gpt-4".
+          max_entries (int, optional): The maximum number of cached counts. Defaults to 100,000.
+        """
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.counts: Dict[str, int] = {}
+        # the counts added since they were last sent to the main process
+        self.new_counts: Dict[str, int] = {}
+
+    @property
+    def encoding(self) -> Optional[tiktoken.Encoding]:
+        return get_encoding(self.model_name)
+
+    @property
+    def approximate(self) -> bool:
+        """
+        Checks if token counts are approximate because the encoding isn't available.
+
+        Returns:
+          bool: Whether the counts are approximate.
+        """
+        return self.encoding is None
+
+    def _store(self, key: str, count: int) -> None:
+        if len(self.counts) >= self.max_entries:
+            # drop the oldest entry
+            del self.counts[next(iter(self.counts))]
+        self.counts[key] = count
+        if _collecting:
+            self.new_counts[key] = count
+
+    def count(self, text: str) -> int:
+        """
+        Counts the tokens in a text.
+
+        Args:
+          text (str): The text to count tokens for.
+
+        Returns:
+          int: The number of tokens in the text.
+
+        Notes:
+          Falls back to an approximate count if the encoding can't be loaded.
+        """
+        key = hash_text(text)
+        if key in self.counts:
+            return self.counts[key]
+        encoding = self.encoding
+        if encoding is None:
+            return approximate_count(text)
+        count = len(encoding.encode(text, disallowed_special=()))
+        self._store(key, count)
+        return count
+
+    def count_batch(self, texts: List[str], num_threads: int = 8) -> List[int]:
+        """
+        Counts the tokens in many texts, encoding the uncached texts in parallel.
+
+        Args:
+          texts (List[str]): The texts to count tokens for.
+          num_threads (int, optional): The number of threads used to encode. Defaults to 8.
+
+        Returns:
+          List[int]: The number of tokens in each text.
+        """
+        keys = [hash_text(text) for text in texts]
+        counts = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in self.counts:
+                counts[key] = self.counts[key]
+            else:
+                missing[key] = text
+        encoding = self.encoding
+        if missing and encoding is None:
+            for key, text in missing.items():
+                counts[key] = approximate_count(text)
+        elif missing:
+            encoded = encoding.encode_batch(
+                list(missing.values()), num_threads=num_threads, disallowed_special=()
+            )
+            for key, tokens in zip(missing, encoded):
+                counts[key] = len(tokens)
+                self._store(key, len(tokens))
+        return [counts[key] for key in keys]
+
+    def load(self, path: Union[str, Path]) -> None:
+        """
+        Loads cached counts from a file.
+
+        Args:
+          path (Union[str, Path]): The path of the JSON file to load.
+        """
+        try:
+            with open(path, "r") as f:
+                self.counts.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        Saves the cached counts to a file, replacing it in one step so runs sharing it or an interrupted run can't truncate it.
+
+        Args:
+          path (Union[str, Path]): The path of the JSON file to write.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.counts, f)
+        os.replace(tmp, path)
+
+    def __reduce__(self):
+        # sent between processes as the shared tokenizer of the model, not its counts
+        return get_tokenizer, (self.model_name,)
+
+
+_tokenizers: Dict[str, Tokenizer] = {}
+_cache_dir: Optional[Path] = None
+_collecting = False
+
+
+def _cache_path(tokenizer: Tokenizer) -> Path:
+    return _cache_dir / f"tokens-{tokenizer.model_name}.json"
+
+
+def get_tokenizer(model_name: str = "gpt-4") -> Tokenizer:
+    """
+    Gets the shared tokenizer for a model.
+
+    Args:
+      model_name (str, optional): The name of the model. Defaults to "gpt-4".
+
+    Returns:
+      Tokenizer: The tokenizer, loaded from the persisted counts if a cache directory is set.
+    """
+    if model_name not in _tokenizers:
+        tokenizer = Tokenizer(model_name)
+        if _cache_dir is not None:
+            tokenizer.load(_cache_path(tokenizer))
+        _tokenizers[model_name] = tokenizer
+    return _tokenizers[model_name]
+
+
+def set_tokenizer_cache_dir(cache_dir: Optional[Union[str, Path]]) -> None:
+    """
+    Sets the directory token counts are persisted in.
+
+    Args:
+      cache_dir (Optional[Union[str, Path]]): The directory, or None to only cache counts in memory.
+    """
+    global _cache_dir
+    _cache_dir = Path(cache_dir) if cache_dir is not None else None
+    for tokenizer in _tokenizers.values():
+        if _cache_dir is not None:
+            tokenizer.load(_cache_path(tokenizer))
+
+
+def get_tokenizer_cache_dir() -> Optional[Path]:
+    """
+    Gets the directory token counts are persisted in.
+
+    Returns:
+      Optional[Path]: The directory, or None if counts are only cached in memory.
+    """
+    return _cache_dir
+
+
+def collect_new_counts() -> None:
+    """
+    Keeps the counts added to the shared tokenizers from now on, so a worker process can send them to the main process (see `pop_new_counts`).
+    """
+    global _collecting
+    _collecting = True
+
+
+def pop_new_counts() -> Dict[str, Dict[str, int]]:
+    """
+    Takes the counts added to the shared tokenizers since they were last taken.
+
+    Returns:
+      Dict[str, Dict[str, int]]: The new counts of each model that has any, keyed by text hash.
+    """
+    new_counts = {}
+    for model_name, tokenizer in _tokenizers.items():
+        if tokenizer.new_counts:
+            new_counts[model_name] = tokenizer.new_counts
+            tokenizer.new_counts = {}
+    return new_counts
+
+
+def add_counts(new_counts: Dict[str, Dict[str, int]]) -> None:
+    """
+    Adds counts taken from another process to the shared tokenizers, so they are persisted by `save_tokenizers`.
+
+    Args:
+      new_counts (Dict[str, Dict[str, int]]): The counts of each model, keyed by text hash (see `pop_new_counts`).
+    """
+    for model_name, counts in new_counts.items():
+        tokenizer = get_tokenizer(model_name)
+        for key, count in counts.items():
+            tokenizer._store(key, count)
+
+
+def save_tokenizers() -> None:
+    """
+    Persists the token counts of every shared tokenizer if a cache directory is set.
+    """
+    if _cache_dir is None:
+        return
+    for tokenizer in _tokenizers.values():
+        tokenizer.save(_cache_path(tokenizer))
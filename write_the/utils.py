@@ -1,14 +1,14 @@
 from pathlib import Path
-import libcst as cst
-from black import FileMode, format_str
+from .discovery import iter_python_files
 
 
-def list_python_files(directory):
+def list_python_files(directory, **options):
     """
     Finds all Python files in a given directory.
 
     Args:
       directory (Path): The directory to search for Python files.
+      **options: The exclusion rules and guards of `iter_python_files`. By default environments, build folders, files ignored by git, large files and generated files are skipped.
 
     Returns:
       list: A list of Path objects for each Python file found.
@@ -17,10 +17,7 @@ def list_python_files(directory):
       >>> list_python_files(Path('/home/user/code'))
       [Path('/home/user/code/main.py'), Path('/home/user/code/utils.py')]
     """
-    python_files = []
-    for file in directory.glob("**/*.py"):
-        python_files.append(file)
-    return python_files
+    return list(iter_python_files(directory, **options))
 
 
 def load_source_code(file: Path):
@@ -29,8 +26,12 @@ def load_source_code(file: Path):
 
 
 def format_source_code(source_code):
+    from black import FileMode, format_str
+
     return format_str(source_code, mode=FileMode())
 
 
 def create_tree(source_code):
+    import libcst as cst
+
     return cst.parse_module(source_code)
@@ -0,0 +1,131 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Tuple, TypeVar
+from .errors import WorkerError
+from .tokenizer import (
+    add_counts,
+    collect_new_counts,
+    get_tokenizer_cache_dir,
+    is_offline,
+    pop_new_counts,
+    set_offline,
+    set_tokenizer_cache_dir,
+)
+
+T = TypeVar("T")
+
+
+def get_cpu_workers(cpu_workers: Optional[int], files: int) -> int:
+    """
+    Gets the number of worker processes for the CPU-bound stages of a command.
+
+    Args:
+      cpu_workers (Optional[int]): The number of workers asked for, None to use every CPU.
+      files (int): The number of files to process.
+
+    Returns:
+      int: The number of workers, at most one per file. 0 runs the stages in the main process.
+
+    Examples:
+      >>> get_cpu_workers(8, files=3)
+      3
+      >>> get_cpu_workers(0, files=3)
+      0
+    """
+    if cpu_workers is None:
+        workers = min(os.cpu_count() or 1, files)
+        # a single worker would only add its start-up time
+        return workers if workers > 1 else 0
+    return min(cpu_workers, files)
+
+
+def _init_worker(offline: bool, tokenizer_cache_dir: Optional[Path]) -> None:
+    set_offline(offline)
+    set_tokenizer_cache_dir(tokenizer_cache_dir)
+    collect_new_counts()
+
+
+def _call_in_worker(call: Callable[[], T]) -> Tuple[T, Dict[str, Dict[str, int]]]:
+    # the token counts go back with the result, only the main process persists them
+    return call(), pop_new_counts()
+
+
+@contextmanager
+def cpu_pool(workers: int) -> Iterator[Optional[ProcessPoolExecutor]]:
+    """
+    Starts worker processes for the CPU-bound stages of a command.
+
+    Args:
+      workers (int): The number of worker processes, 0 for none.
+
+    Yields:
+      Optional[ProcessPoolExecutor]: The pool, or None to run the stages in the main process.
+
+    Notes:
+      Workers are spawned rather than forked, as the progress display and the HTTP
+      clients run threads, and get the tokenizer settings of the main process.
+    """
+    if workers < 1:
+        yield None
+        return
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(is_offline(), get_tokenizer_cache_dir()),
+    )
+    try:
+        yield executor
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+async def run_in_worker(
+    executor: Optional[ProcessPoolExecutor], fn: Callable[..., T], *args, **kwargs
+) -> T:
+    """
+    Runs a CPU-bound function in a worker process so the event loop stays free for requests.
+
+    Args:
+      executor (Optional[ProcessPoolExecutor]): The pool, None to run the function in the main process.
+      fn (Callable[..., T]): The function, importable by the workers (e.g. from `write_the.stages`).
+      *args: The positional arguments of the function.
+      **kwargs: The keyword arguments of the function.
+
+    Returns:
+      T: The result of the function.
+
+    Raises:
+      WorkerError: If the worker dies while running the function (e.g. running out of memory).
+
+    Notes:
+      If worker processes can't be started (or an earlier worker died), the function is
+      run in the main process. The token counts the worker added are sent back with the
+      result, so the main process can persist them.
+    """
+    call = partial(fn, *args, **kwargs)
+    if executor is not None:
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                executor, partial(_call_in_worker, call)
+            )
+        except (OSError, BrokenProcessPool):
+            # e.g. sandboxes that don't allow worker processes
+            future = None
+        if future is not None:
+            try:
+                result, new_counts = await future
+            except BrokenProcessPool as e:
+                # running it again here could take the main process down too
+                raise WorkerError(
+                    "A worker process died (e.g. out of memory) while processing the file!"
+                ) from e
+            add_counts(new_counts)
+            return result
+    return call()